@@ -71,15 +71,43 @@ def create_app(test_config=None):
          resources={r"/api/*": {
              "origins": allowed_origins if os.environ.get('FLASK_ENV') == 'production' else "*",
              "methods": ["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
-             "allow_headers": ["Content-Type", "Authorization", "X-Requested-With", "Accept"],
+             "allow_headers": ["Content-Type", "Authorization", "X-Requested-With", "Accept", "Upload-Offset", "X-Metrics-Token"],
              "supports_credentials": False
          }})
     
     # Add security headers to all responses
     app.after_request(add_security_headers)
-    
+
+    # Per-endpoint latency and DB query metrics at /api/metrics
+    from . import metrics
+    metrics.init_app(app)
+
+    # Query budget / N+1 detection (warns in development, raises under TESTING)
+    from . import query_budget
+    query_budget.init_app(app)
+
     init_db(app)
 
+    # Buffered view counters flush in the background, off the request path
+    from .services.view_tracker import view_tracker
+    view_tracker.init_app(app)
+
+    # Make/model/engine catalog for the listing form dictionaries
+    from .services.catalog_index import catalog_index
+    catalog_index.init_app(app)
+
+    # Fair-price / deal-score annotations, scored in batches in the background
+    from .services.deal_scorer import deal_scorer
+    deal_scorer.init_app(app)
+
+    # Bulk CSV/NDJSON listing imports, run in the background for large files
+    from .services.listing_import import listing_importer
+    listing_importer.init_app(app)
+
+    # Content-addressed uploads: unreferenced blobs are collected in the background
+    from .services.media_store import media_store
+    media_store.init_app(app)
+
     # Register Blueprints
     from .routes import cars, ai, system, auth, dealers, favorites, listings, reviews, messages
     app.register_blueprint(cars.bp)
@@ -101,6 +129,12 @@ def create_app(test_config=None):
         config={'app_name': "IntelliWheels API"}
     )
     app.register_blueprint(swaggerui_blueprint, url_prefix=SWAGGER_URL)
+
+    # Background job workers (email, Cloudinary uploads); handlers are registered
+    # by the modules imported above
+    from .services import mailer  # noqa: F401
+    from .services.job_queue import job_queue
+    job_queue.init_app(app)
     
     # Serve swagger.json from static folder
     @app.route('/api/swagger.json')
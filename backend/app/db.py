@@ -1,14 +1,16 @@
 import sqlite3
 import os
+import time
 from flask import g, current_app
+from .lazy_imports import lazy_import
+from .log import get_logger
 
-# PostgreSQL support
-try:
-    import psycopg2
-    import psycopg2.extras
-    HAS_POSTGRES = True
-except ImportError:
-    HAS_POSTGRES = False
+log = get_logger('DB')
+
+# PostgreSQL support (the driver itself is imported on the first connection)
+psycopg2 = lazy_import('psycopg2')
+HAS_POSTGRES = psycopg2 is not None
+if not HAS_POSTGRES:
     # Warn if DATABASE_URL is set but psycopg2 is missing
     if os.environ.get('DATABASE_URL'):
         print("[DB WARNING] DATABASE_URL is set but psycopg2 is not installed! Falling back to SQLite.")
@@ -18,6 +20,36 @@ def is_postgres():
     # FIX: Only return True if we actually have the psycopg2 driver installed!
     return bool(os.environ.get('DATABASE_URL')) and HAS_POSTGRES
 
+# Each is called as observer(sql, seconds) after every execute/executemany
+# (see app/metrics.py and app/query_budget.py)
+_query_observers = []
+
+def add_query_observer(observer):
+    if observer not in _query_observers:
+        _query_observers.append(observer)
+
+def _observe(sql, started):
+    if _query_observers:
+        seconds = time.perf_counter() - started
+        for observer in _query_observers:
+            observer(sql, seconds)
+
+class InstrumentedSQLiteConnection(sqlite3.Connection):
+    """sqlite3 connection that reports each query to the observer."""
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _observe(sql, started)
+    
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _observe(sql, started)
+
 class PostgresRowWrapper:
     """Wrapper to make psycopg2 rows behave like sqlite3.Row."""
     def __init__(self, cursor, row):
@@ -96,6 +128,20 @@ class PostgresCursorWrapper:
         
         return self
     
+    def executemany(self, sql, seq_of_params):
+        """Run one statement for many parameter tuples in batched round-trips."""
+        if '%s' not in sql:
+            sql = sql.replace('?', '%s')
+        sql = self._convert_json_extract(sql)
+        sql = sql.replace('CURRENT_TIMESTAMP', 'NOW()')
+        from psycopg2.extras import execute_batch
+        execute_batch(self._cursor, sql, seq_of_params, page_size=500)
+        return self
+    
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+    
     def _convert_json_extract(self, sql):
         """Convert SQLite json_extract to PostgreSQL JSON operators."""
         import re
@@ -123,17 +169,31 @@ class PostgresConnectionWrapper:
         self._cursor = None
     
     def execute(self, sql, params=None):
+        started = time.perf_counter()
         cursor = self._connection.cursor()
         wrapper = PostgresCursorWrapper(cursor, self._connection)
-        wrapper.execute(sql, params)
+        try:
+            wrapper.execute(sql, params)
+        finally:
+            _observe(sql, started)
+        return wrapper
+    
+    def executemany(self, sql, seq_of_params):
+        started = time.perf_counter()
+        cursor = self._connection.cursor()
+        wrapper = PostgresCursorWrapper(cursor, self._connection)
+        try:
+            wrapper.executemany(sql, seq_of_params)
+        finally:
+            _observe(sql, started)
         return wrapper
     
     def commit(self):
         try:
             self._connection.commit()
-            print("[DB] PostgreSQL commit successful")
+            log.debug("PostgreSQL commit successful")
         except Exception as e:
-            print(f"[DB] PostgreSQL commit FAILED: {e}")
+            log.error("PostgreSQL commit FAILED: %s", e)
             raise
     
     def rollback(self):
@@ -161,19 +221,18 @@ def get_db():
             # Set autocommit to False (default) but ensure we handle transactions properly
             conn.autocommit = False
             g.db = PostgresConnectionWrapper(conn)
-            print("[DB] Connected to PostgreSQL")
+            log.debug("Connected to PostgreSQL")
         else:
             db_path = current_app.config['DATABASE']
-            g.db = sqlite3.connect(db_path)
+            g.db = sqlite3.connect(db_path, factory=InstrumentedSQLiteConnection)
             g.db.row_factory = sqlite3.Row
-            print(f"[DB] Connected to SQLite: {db_path}")
+            log.debug("Connected to SQLite: %s", db_path)
     return g.db
 
 def close_db(e=None):
     db = g.pop('db', None)
     if db is not None:
-        if is_postgres():
-            print("[DB] Closing PostgreSQL connection")
+        log.debug("Closing %s connection", "PostgreSQL" if is_postgres() else "SQLite")
         db.close()
 
 def init_db(app):
@@ -246,6 +305,13 @@ def _init_postgres_tables(db):
             city TEXT,
             neighborhood TEXT,
             trim TEXT,
+            fair_price REAL,
+            fair_low REAL,
+            fair_high REAL,
+            deal_score REAL,
+            fair_price_version TEXT,
+            price_scored_at TIMESTAMP,
+            import_key TEXT,
             created_at TIMESTAMP DEFAULT NOW(),
             updated_at TIMESTAMP DEFAULT NOW()
         )
@@ -337,6 +403,20 @@ def _init_postgres_tables(db):
         "ALTER TABLE cars ADD COLUMN IF NOT EXISTS city TEXT",
         "ALTER TABLE cars ADD COLUMN IF NOT EXISTS neighborhood TEXT",
         "ALTER TABLE cars ADD COLUMN IF NOT EXISTS trim TEXT",
+        # Fair-price annotations written by the deal scorer
+        "ALTER TABLE cars ADD COLUMN IF NOT EXISTS fair_price REAL",
+        "ALTER TABLE cars ADD COLUMN IF NOT EXISTS fair_low REAL",
+        "ALTER TABLE cars ADD COLUMN IF NOT EXISTS fair_high REAL",
+        "ALTER TABLE cars ADD COLUMN IF NOT EXISTS deal_score REAL",
+        "ALTER TABLE cars ADD COLUMN IF NOT EXISTS fair_price_version TEXT",
+        "ALTER TABLE cars ADD COLUMN IF NOT EXISTS price_scored_at TIMESTAMP",
+        "CREATE INDEX IF NOT EXISTS idx_cars_deal_score ON cars (deal_score DESC NULLS LAST)",
+        # Natural key of rows loaded by import_sql_data.py, so re-imports update in place
+        "ALTER TABLE cars ADD COLUMN IF NOT EXISTS import_key TEXT",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_cars_import_key ON cars (import_key)",
+        # Resized copies of the main image (see services/image_variants.py)
+        "ALTER TABLE cars ADD COLUMN IF NOT EXISTS image_variants TEXT",
+        "CREATE INDEX IF NOT EXISTS idx_cars_image_url ON cars (image_url)",
         # User columns
         "ALTER TABLE users ADD COLUMN IF NOT EXISTS is_admin BOOLEAN DEFAULT FALSE",
         "ALTER TABLE users ADD COLUMN IF NOT EXISTS google_id TEXT",
@@ -359,6 +439,81 @@ def _init_postgres_tables(db):
         )
     ''')
     
+    # Create Car Views Table (per-car, per-day counters flushed by the view tracker)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS car_views (
+            car_id INTEGER NOT NULL,
+            view_date DATE NOT NULL,
+            views INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (car_id, view_date)
+        )
+    ''')
+    
+    # Create Import Jobs Table (bulk listing uploads, polled for progress)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS import_jobs (
+            id TEXT PRIMARY KEY,
+            owner_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            status TEXT NOT NULL DEFAULT 'queued',
+            format TEXT,
+            filename TEXT,
+            processed INTEGER DEFAULT 0,
+            inserted INTEGER DEFAULT 0,
+            failed INTEGER DEFAULT 0,
+            truncated INTEGER DEFAULT 0,
+            results TEXT,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT NOW(),
+            updated_at TIMESTAMP DEFAULT NOW(),
+            finished_at TIMESTAMP
+        )
+    ''')
+    
+    # Create Jobs Table (durable background job queue, see services/job_queue.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id SERIAL PRIMARY KEY,
+            kind TEXT NOT NULL,
+            payload TEXT,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 5,
+            run_at DOUBLE PRECISION NOT NULL,
+            locked_at DOUBLE PRECISION,
+            finished_at DOUBLE PRECISION,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT NOW()
+        )
+    ''')
+    # Epoch seconds: REAL is float4 in Postgres, only good to ~2 minutes at today's values
+    for column in ('run_at', 'locked_at', 'finished_at'):
+        cursor.execute(f"ALTER TABLE jobs ALTER COLUMN {column} TYPE DOUBLE PRECISION")
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs (status, run_at)')
+    
+    # Create Media Uploads Table (local upload -> Cloudinary copy, for redirects)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS media_uploads (
+            filename TEXT PRIMARY KEY,
+            kind TEXT,
+            remote_url TEXT,
+            public_id TEXT,
+            content_hash TEXT,
+            size INTEGER,
+            variants TEXT,
+            ref_count INTEGER DEFAULT 0,
+            unreferenced_since DOUBLE PRECISION,
+            created_at TIMESTAMP DEFAULT NOW()
+        )
+    ''')
+    # Content hash (ETag) of each local upload, see services/media_files.py
+    cursor.execute("ALTER TABLE media_uploads ADD COLUMN IF NOT EXISTS content_hash TEXT")
+    cursor.execute("ALTER TABLE media_uploads ADD COLUMN IF NOT EXISTS size INTEGER")
+    cursor.execute("ALTER TABLE media_uploads ADD COLUMN IF NOT EXISTS variants TEXT")
+    # Listing references per blob, see services/media_store.py
+    cursor.execute("ALTER TABLE media_uploads ADD COLUMN IF NOT EXISTS ref_count INTEGER DEFAULT 0")
+    cursor.execute("ALTER TABLE media_uploads ADD COLUMN IF NOT EXISTS unreferenced_since DOUBLE PRECISION")
+    cursor.execute("ALTER TABLE media_uploads ALTER COLUMN unreferenced_since TYPE DOUBLE PRECISION")
+    
     db._connection.commit()
     print("[DB] PostgreSQL tables initialized")
 
@@ -427,6 +582,13 @@ def _init_sqlite_tables(db):
             city TEXT,
             neighborhood TEXT,
             trim TEXT,
+            fair_price REAL,
+            fair_low REAL,
+            fair_high REAL,
+            deal_score REAL,
+            fair_price_version TEXT,
+            price_scored_at TIMESTAMP,
+            import_key TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
@@ -520,11 +682,91 @@ def _init_sqlite_tables(db):
         )
     ''')
     
+    # Create Car Views Table (per-car, per-day counters flushed by the view tracker)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS car_views (
+            car_id INTEGER NOT NULL,
+            view_date TEXT NOT NULL,
+            views INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (car_id, view_date)
+        )
+    ''')
+    
+    # Create Import Jobs Table (bulk listing uploads, polled for progress)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS import_jobs (
+            id TEXT PRIMARY KEY,
+            owner_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            status TEXT NOT NULL DEFAULT 'queued',
+            format TEXT,
+            filename TEXT,
+            processed INTEGER DEFAULT 0,
+            inserted INTEGER DEFAULT 0,
+            failed INTEGER DEFAULT 0,
+            truncated INTEGER DEFAULT 0,
+            results TEXT,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    
+    # Create Jobs Table (durable background job queue, see services/job_queue.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 5,
+            run_at REAL NOT NULL,
+            locked_at REAL,
+            finished_at REAL,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs (status, run_at)')
+    
+    # Create Media Uploads Table (local upload -> Cloudinary copy, for redirects)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS media_uploads (
+            filename TEXT PRIMARY KEY,
+            kind TEXT,
+            remote_url TEXT,
+            public_id TEXT,
+            content_hash TEXT,
+            size INTEGER,
+            variants TEXT,
+            ref_count INTEGER DEFAULT 0,
+            unreferenced_since REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
     # Migrations for SQLite (doesn't support IF NOT EXISTS for ALTER)
     sqlite_migrations = [
         "ALTER TABLE cars ADD COLUMN odometer_km INTEGER",
         "ALTER TABLE users ADD COLUMN google_id TEXT",
         "ALTER TABLE users ADD COLUMN avatar_url TEXT",
+        "ALTER TABLE cars ADD COLUMN fair_price REAL",
+        "ALTER TABLE cars ADD COLUMN fair_low REAL",
+        "ALTER TABLE cars ADD COLUMN fair_high REAL",
+        "ALTER TABLE cars ADD COLUMN deal_score REAL",
+        "ALTER TABLE cars ADD COLUMN fair_price_version TEXT",
+        "ALTER TABLE cars ADD COLUMN price_scored_at TIMESTAMP",
+        "CREATE INDEX IF NOT EXISTS idx_cars_deal_score ON cars (deal_score)",
+        "ALTER TABLE cars ADD COLUMN import_key TEXT",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_cars_import_key ON cars (import_key)",
+        "ALTER TABLE media_uploads ADD COLUMN content_hash TEXT",
+        "ALTER TABLE media_uploads ADD COLUMN size INTEGER",
+        "ALTER TABLE media_uploads ADD COLUMN variants TEXT",
+        "ALTER TABLE media_uploads ADD COLUMN ref_count INTEGER DEFAULT 0",
+        "ALTER TABLE media_uploads ADD COLUMN unreferenced_since REAL",
+        "ALTER TABLE cars ADD COLUMN image_variants TEXT",
+        "CREATE INDEX IF NOT EXISTS idx_cars_image_url ON cars (image_url)",
     ]
     for migration in sqlite_migrations:
         try:
@@ -0,0 +1,74 @@
+"""
+Deferred imports for optional, heavy dependencies.
+
+google.generativeai, google-auth, cloudinary, psycopg2, joblib and Pillow are
+only needed by a few endpoints but together dominate the import time of
+``create_app()``. ``lazy_import`` checks that a module is installed (a cheap
+finder lookup, nothing is executed) and returns a proxy that imports the real
+module on first attribute access. Set LAZY_IMPORTS=0 to import everything at
+startup again, e.g. to surface a broken install at boot instead of on the
+first request that needs it.
+"""
+
+import os
+import importlib
+import importlib.util
+import sys
+
+LAZY_IMPORTS = os.environ.get('LAZY_IMPORTS', '1') != '0'
+
+
+def module_available(name):
+    """True if ``name`` can be imported. Only the finders run; parent packages may be imported."""
+    if name in sys.modules:
+        return True
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+class LazyModule:
+    """Module proxy that performs the real import on first attribute access."""
+
+    def __init__(self, name):
+        self.__dict__['_lazy_name'] = name
+        self.__dict__['_lazy_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_lazy_module']
+        if module is None:
+            # import_module takes the per-module import lock, so concurrent first uses are safe
+            module = importlib.import_module(self.__dict__['_lazy_name'])
+            self.__dict__['_lazy_module'] = module
+        return module
+
+    @property
+    def is_loaded(self):
+        return self.__dict__['_lazy_module'] is not None
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        state = 'loaded' if self.is_loaded else 'not loaded'
+        return f"<lazy module '{self.__dict__['_lazy_name']}' ({state})>"
+
+
+def lazy_import(name, probe=None):
+    """
+    Return a lazy proxy for module ``name``, or None if it is not installed.
+    ``probe`` is the module whose presence decides availability; pass a
+    top-level package to avoid importing ``name``'s parents just to check.
+    """
+    if not module_available(probe or name):
+        return None
+    if not LAZY_IMPORTS:
+        try:
+            return importlib.import_module(name)
+        except ImportError:
+            return None
+    return LazyModule(name)
@@ -0,0 +1,131 @@
+"""
+Logging for request hot paths.
+
+``print`` in a handler takes the stdout lock and writes on every call,
+whether anyone reads the line or not. Code on hot paths uses
+``get_logger(tag)`` instead:
+
+    log = get_logger('Reviews')
+    log.debug('Found %d reviews for car %s', len(reviews), car_id)
+
+* Levels: ``LOG_LEVEL`` (default INFO) for everything, and ``LOG_LEVELS`` for
+  single loggers, e.g. ``LOG_LEVELS=DB=DEBUG,Semantic Search=WARNING``. A
+  disabled call returns after one cached level check.
+* Lazy formatting: arguments are %-formatted only for records that are
+  emitted. Expensive values go behind ``log.isEnabledFor(logging.DEBUG)``.
+* Sampling: ``LOG_SAMPLE=DB=0.01`` keeps about 1% of the DB logger's
+  DEBUG/INFO records. Warnings and errors are never sampled.
+* Async output: records go through a QueueHandler. A listener thread does
+  the stdout writes, so a slow terminal or log shipper never blocks a request.
+* ``LOG_FORMAT=json`` writes one JSON object per line, including any
+  ``extra=`` fields. The default text format keeps the ``[Tag] message`` style
+  of the existing prints.
+"""
+
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+ROOT_LOGGER = 'intelliwheels'
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text').lower()
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'tag'}
+
+_setup_lock = threading.Lock()
+_listener = None
+
+
+def _parse_mapping(value):
+    """'DB=DEBUG, Reviews=0.1' -> {'DB': 'DEBUG', 'Reviews': '0.1'}"""
+    mapping = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            key, _, setting = item.rpartition('=')
+            mapping[key.strip()] = setting.strip()
+    return mapping
+
+
+LOG_LEVELS = _parse_mapping(os.environ.get('LOG_LEVELS'))
+LOG_SAMPLE = {tag: float(rate) for tag, rate in _parse_mapping(os.environ.get('LOG_SAMPLE')).items()}
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a ``rate`` fraction of records below WARNING."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        message = record.getMessage()
+        if record.levelno >= logging.WARNING:
+            message = f'{record.levelname}: {message}'
+        line = f'[{record.tag}] {message}'
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'logger': record.tag,
+            'msg': record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_FIELDS})
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _TagFilter(logging.Filter):
+    """Adds ``record.tag``, the logger name without the package prefix."""
+
+    def filter(self, record):
+        record.tag = record.name[len(ROOT_LOGGER) + 1:] or ROOT_LOGGER
+        return True
+
+
+def _setup():
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else TextFormatter())
+        _listener = QueueListener(queue.SimpleQueue(), stream_handler, respect_handler_level=False)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+        queue_handler = QueueHandler(_listener.queue)
+        queue_handler.addFilter(_TagFilter())
+        root = logging.getLogger(ROOT_LOGGER)
+        root.addHandler(queue_handler)
+        root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+        root.propagate = False
+
+
+def get_logger(tag):
+    """Logger for one component; ``tag`` is what prints as ``[Tag]``."""
+    _setup()
+    logger = logging.getLogger(f'{ROOT_LOGGER}.{tag}')
+    if tag in LOG_LEVELS and not logger.level:
+        logger.setLevel(getattr(logging, LOG_LEVELS[tag].upper(), logging.NOTSET))
+    if tag in LOG_SAMPLE and not any(isinstance(f, SamplingFilter) for f in logger.filters):
+        logger.addFilter(SamplingFilter(LOG_SAMPLE[tag]))
+    return logger
@@ -0,0 +1,236 @@
+"""
+Request and database instrumentation, exposed at /api/metrics.
+
+Every request is timed by endpoint (the URL rule, not the raw path), method
+and status. The database layer reports each ``execute``/``executemany`` call
+(see ``db.add_query_observer``), so each request also records how many
+queries it ran and how long they took. Queries slower than ``SLOW_QUERY_MS``
+are logged and counted under their normalized SQL, with literals replaced by
+``?`` and IN lists collapsed, so the same query with different values counts
+as one.
+
+``/api/metrics`` returns the Prometheus text format. It needs no client
+library. It requires ``Authorization: Bearer <METRICS_TOKEN>``; without a
+``METRICS_TOKEN`` it is only served in debug or testing, since endpoint names
+and normalized SQL describe the app's internals.
+Responses carry a ``Server-Timing`` header (app and db time, which browser
+dev tools display) only in debug or testing, or when the request presents
+``X-Metrics-Token: <METRICS_TOKEN>``. Anyone else would learn per-request
+database time and query counts from it.
+
+Metrics are kept per process. The Render deployment runs one gunicorn
+worker process, so a scrape sees all traffic. With several workers, scrape
+each one or put the numbers behind a shared exporter.
+"""
+
+import os
+import re
+import hmac
+import time
+import bisect
+import threading
+
+from flask import g, request, has_request_context, current_app, Response, jsonify
+
+from .log import get_logger
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '200'))
+# Distinct slow statements tracked; later ones are counted as "other"
+SLOW_QUERY_TOP = int(os.environ.get('SLOW_QUERY_TOP', '100'))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+slow_log = get_logger('DB Slow')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))+\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """One line of SQL with literals and placeholder lists folded, for grouping."""
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _PLACEHOLDER_LIST.sub('(...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()[:300]
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = [(labels, list(s[0]), s[1], s[2]) for labels, s in self._series.items()]
+        for labels, counts, total, count in sorted(items):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                le = 'le="%s"' % (bound if bound == '+Inf' else _number(bound))
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {total!r}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, labels):
+        return labels in self._values
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}')
+        return lines
+
+
+REQUEST_LATENCY = Histogram(
+    'intelliwheels_http_request_duration_seconds', 'Request latency by endpoint.',
+    ('endpoint', 'method', 'status'), LATENCY_BUCKETS,
+)
+REQUEST_QUERIES = Histogram(
+    'intelliwheels_http_request_db_queries', 'Database queries per request.',
+    ('endpoint',), COUNT_BUCKETS,
+)
+REQUEST_DB_TIME = Histogram(
+    'intelliwheels_http_request_db_seconds', 'Database time per request.',
+    ('endpoint',), LATENCY_BUCKETS,
+)
+QUERY_LATENCY = Histogram(
+    'intelliwheels_db_query_duration_seconds', 'Duration of single database calls.',
+    ('operation',), QUERY_BUCKETS,
+)
+SLOW_QUERIES = Counter(
+    'intelliwheels_db_slow_queries_total', f'Queries slower than {SLOW_QUERY_MS:g}ms, by normalized SQL.',
+    ('query',),
+)
+SLOW_QUERY_SECONDS = Counter(
+    'intelliwheels_db_slow_query_seconds_total', 'Time spent in slow queries, by normalized SQL.',
+    ('query',),
+)
+REGISTRY = (REQUEST_LATENCY, REQUEST_QUERIES, REQUEST_DB_TIME, QUERY_LATENCY, SLOW_QUERIES, SLOW_QUERY_SECONDS)
+
+
+def observe_query(sql, seconds):
+    """Query observer installed in db.py; runs after every execute/executemany."""
+    operation = sql.lstrip().split(None, 1)[0].lower() if sql and sql.strip() else 'other'
+    if operation not in ('select', 'insert', 'update', 'delete', 'with'):
+        operation = 'other'
+    QUERY_LATENCY.observe(seconds, operation)
+
+    if has_request_context():
+        g.db_queries = g.get('db_queries', 0) + 1
+        g.db_seconds = g.get('db_seconds', 0.0) + seconds
+
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        normalized = normalize_sql(sql)
+        key = (normalized,) if (normalized,) in SLOW_QUERIES or len(SLOW_QUERIES) < SLOW_QUERY_TOP else ('other',)
+        SLOW_QUERIES.inc(1, *key)
+        SLOW_QUERY_SECONDS.inc(seconds, *key)
+        where = f" in {request.method} {request.path}" if has_request_context() else ''
+        slow_log.warning("%.0fms%s: %s", seconds * 1000, where, normalized, extra={'duration_ms': round(seconds * 1000, 1)})
+
+
+def _start_timer():
+    g.request_started = time.perf_counter()
+    g.db_queries = 0
+    g.db_seconds = 0.0
+
+
+def _record_request(response):
+    started = g.get('request_started')
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    REQUEST_LATENCY.observe(elapsed, endpoint, request.method, str(response.status_code))
+    REQUEST_QUERIES.observe(g.db_queries, endpoint)
+    REQUEST_DB_TIME.observe(g.db_seconds, endpoint)
+    if _timing_allowed():
+        response.headers['Server-Timing'] = (
+            f'app;dur={elapsed * 1000:.1f}, db;dur={g.db_seconds * 1000:.1f};desc="{g.db_queries} queries"'
+        )
+    return response
+
+
+def _timing_allowed():
+    if current_app.debug or current_app.testing:
+        return True
+    # Not Authorization: on API requests that carries the user's session token
+    return bool(METRICS_TOKEN) and hmac.compare_digest(request.headers.get('X-Metrics-Token', ''), METRICS_TOKEN)
+
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view():
+    if not METRICS_TOKEN:
+        if not (current_app.debug or current_app.testing):
+            return jsonify({'success': False, 'error': 'Metrics are disabled; set METRICS_TOKEN'}), 403
+    elif not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {METRICS_TOKEN}'):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    from .db import add_query_observer
+
+    add_query_observer(observe_query)
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    app.add_url_rule('/api/metrics', 'metrics', metrics_view)
@@ -0,0 +1,140 @@
+"""
+Per-request query budget and N+1 detection, for development and CI.
+
+Every query a request runs is grouped by its normalized SQL (the same shapes
+/api/metrics uses). A request breaks its budget when it runs more than
+``QUERY_BUDGET`` queries in total, or the same statement more than
+``QUERY_REPEAT_LIMIT`` times. Repeats are the N+1 case: a lookup per row
+inside a loop. The detector records the stack of the query that crossed the
+line, so the report points at the loop, not only the endpoint.
+
+``QUERY_BUDGET_MODE`` (env or app config) chooses what happens:
+
+* ``raise``: the request fails with ``QueryBudgetExceeded`` once the
+  response is built. Handlers that catch their own exceptions cannot hide
+  it. This is the default with ``TESTING`` set, so a test run fails when a
+  regression adds queries.
+* ``warn``: logs the summary and the responsible stack. This is the
+  default when ``FLASK_ENV=development`` or debug is on.
+* ``off``: nothing is recorded. This is the default everywhere else,
+  including production.
+
+A view that legitimately needs more queries raises its own limits:
+
+    @bp.route('/dashboard')
+    @query_budget(max_queries=60)
+    def dashboard(): ...
+"""
+
+import os
+import traceback
+
+from flask import g, request, has_request_context, current_app
+
+from .log import get_logger
+from .metrics import normalize_sql
+
+QUERY_BUDGET = int(os.environ.get('QUERY_BUDGET', '25'))
+QUERY_REPEAT_LIMIT = int(os.environ.get('QUERY_REPEAT_LIMIT', '5'))
+MODES = ('off', 'warn', 'raise')
+
+log = get_logger('Query Budget')
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+def query_budget(max_queries=None, max_repeats=None):
+    """Raise the total and/or per-statement query limits for one view."""
+    def decorator(view):
+        view.query_budget = (max_queries, max_repeats)
+        return view
+    return decorator
+
+
+def _mode(app):
+    mode = app.config.get('QUERY_BUDGET_MODE') or os.environ.get('QUERY_BUDGET_MODE')
+    if not mode:
+        if app.testing:
+            mode = 'raise'
+        elif app.debug or os.environ.get('FLASK_ENV') == 'development':
+            mode = 'warn'
+        else:
+            mode = 'off'
+    mode = mode.lower()
+    if mode not in MODES:
+        raise ValueError(f"QUERY_BUDGET_MODE must be one of {', '.join(MODES)}, not {mode!r}")
+    return mode
+
+
+def _start_request():
+    view = current_app.view_functions.get(request.endpoint)
+    max_queries, max_repeats = getattr(view, 'query_budget', (None, None))
+    g.query_budget = {
+        'max_queries': max_queries if max_queries is not None else QUERY_BUDGET,
+        'max_repeats': max_repeats if max_repeats is not None else QUERY_REPEAT_LIMIT,
+        'total': 0,
+        'shapes': {},
+        'violation': None,
+    }
+
+
+def observe_query(sql, seconds):
+    """Query observer (see db.add_query_observer); a no-op outside tracked requests."""
+    if not has_request_context():
+        return
+    budget = g.get('query_budget')
+    if budget is None:
+        return
+    shape = normalize_sql(sql)
+    budget['total'] += 1
+    repeats = budget['shapes'][shape] = budget['shapes'].get(shape, 0) + 1
+    if budget['violation'] is not None:
+        return
+    if repeats > budget['max_repeats']:
+        reason = f"statement ran more than {budget['max_repeats']} times (likely N+1): {shape}"
+    elif budget['total'] > budget['max_queries']:
+        reason = f"more than {budget['max_queries']} queries"
+    else:
+        return
+    # Keep application frames only: no Flask/werkzeug dispatch, db.py or this module
+    stack = [frame for frame in traceback.extract_stack()[:-1]
+             if 'site-packages' not in frame.filename
+             and not frame.filename.endswith(('app/db.py', 'app/query_budget.py'))]
+    budget['violation'] = (reason, ''.join(traceback.format_list(stack[-6:])))
+
+
+def _report(budget):
+    reason, stack = budget['violation']
+    top = sorted(budget['shapes'].items(), key=lambda item: -item[1])[:5]
+    lines = [f"{request.method} {request.path}: {reason}",
+             f"{budget['total']} queries, {len(budget['shapes'])} distinct. Most repeated:"]
+    lines += [f"  {count}x {shape}" for shape, count in top]
+    lines += ['First over budget at:', stack.rstrip()]
+    return '\n'.join(lines)
+
+
+def _make_after_request(mode):
+    def check_budget(response):
+        budget = g.pop('query_budget', None)
+        if budget is None or budget['violation'] is None:
+            return response
+        report = _report(budget)
+        if mode == 'raise':
+            raise QueryBudgetExceeded(report)
+        log.warning('%s', report)
+        return response
+    return check_budget
+
+
+def init_app(app):
+    from .db import add_query_observer
+
+    mode = _mode(app)
+    app.config['QUERY_BUDGET_MODE'] = mode
+    if mode == 'off':
+        return
+    add_query_observer(observe_query)
+    app.before_request(_start_request)
+    app.after_request(_make_after_request(mode))
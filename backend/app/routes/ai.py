@@ -1,8 +1,24 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from ..services.ai_service import ai_service
-from ..security import sanitize_string, validate_text_field, require_auth
+from ..services.ai_executor import AIUnavailableError
+import os
+import json
+from ..security import sanitize_string, validate_text_field, validate_integer, require_auth
+from ..log import get_logger
+
+PRICE_BATCH_MAX = int(os.environ.get('PRICE_BATCH_MAX', '500'))
 
 bp = Blueprint('ai', __name__, url_prefix='/api')
+search_log = get_logger('Semantic Search')
+
+
+@bp.errorhandler(AIUnavailableError)
+def ai_unavailable(e):
+    """Shed AI calls with a 503 when the pool is full, a call timed out, or the breaker is open."""
+    response = jsonify({'success': False, 'error': str(e), 'retry_after': e.retry_after})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
 
 
 @bp.route('/chatbot', methods=['POST'])
@@ -41,6 +57,9 @@ def chatbot():
     if image_base64 and len(image_base64) > 10 * 1024 * 1024:  # 10MB limit
         return jsonify({'success': False, 'error': 'Image too large'}), 400
     
+    if data.get('stream') or request.args.get('stream') or 'text/event-stream' in request.headers.get('Accept', ''):
+        return _stream_chat(query, history, image_base64)
+    
     result = ai_service.chat(query, history, image_base64)
     
     if isinstance(result, dict):
@@ -53,6 +72,30 @@ def chatbot():
     
     return jsonify({'success': True, 'response': result})
 
+def _stream_chat(query, history, image_base64):
+    """
+    Stream a chat reply as Server-Sent Events, or as NDJSON when the client
+    asks for application/x-ndjson. Event types: delta, listing, done, error.
+    """
+    ndjson = 'application/x-ndjson' in request.headers.get('Accept', '')
+    
+    def generate():
+        for event in ai_service.chat_stream(query, history, image_base64):
+            payload = json.dumps(event, ensure_ascii=False)
+            if ndjson:
+                yield payload + '\n'
+            else:
+                yield f"event: {event['type']}\ndata: {payload}\n\n"
+    
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson' if ndjson else 'text/event-stream'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies (nginx, Render) from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @bp.route('/price-estimate', methods=['POST'])
 def price_estimate():
     if not request.is_json:
@@ -79,9 +122,70 @@ def price_estimate():
         'range': {
             'low': result['low'],
             'high': result['high']
-        }
+        },
+        'source': result.get('source')
     })
 
+@bp.route('/price-estimate/batch', methods=['POST'])
+def price_estimate_batch():
+    """Price many listings with a single model call."""
+    if not request.is_json:
+        return jsonify({'success': False, 'error': 'Content-Type must be application/json'}), 400
+    
+    data = request.get_json(silent=True)
+    cars = data.get('cars') if isinstance(data, dict) else None
+    if not isinstance(cars, list) or not cars:
+        return jsonify({'success': False, 'error': 'cars must be a non-empty list'}), 400
+    if len(cars) > PRICE_BATCH_MAX:
+        return jsonify({'success': False, 'error': f'At most {PRICE_BATCH_MAX} cars per request'}), 400
+    
+    valid, errors = [], {}
+    for index, car in enumerate(cars):
+        if not isinstance(car, dict):
+            errors[index] = 'Each car must be an object'
+            continue
+        make = sanitize_string(car.get('make', ''))[:50]
+        model = sanitize_string(car.get('model', ''))[:100]
+        if not make or not model:
+            errors[index] = 'Make and model are required'
+            continue
+        year = car.get('year')
+        if year not in (None, ''):
+            ok, error = validate_integer(year, 'Year', min_val=1900, max_val=2100)
+            if not ok:
+                errors[index] = error
+                continue
+            year = int(year)
+        odometer_km = car.get('odometer_km')
+        if odometer_km not in (None, ''):
+            ok, error = validate_integer(odometer_km, 'Odometer', min_val=0, max_val=10000000)
+            if not ok:
+                errors[index] = error
+                continue
+        specs = car.get('specs')
+        valid.append((index, {
+            'make': make,
+            'model': model,
+            'year': year or None,
+            'specs': specs if isinstance(specs, dict) else {},
+        }))
+    
+    results = ai_service.estimate_prices([car for _, car in valid]) if valid else []
+    estimates = [None] * len(cars)
+    for (index, _), result in zip(valid, results):
+        estimates[index] = {
+            'index': index,
+            'success': True,
+            'estimate': result['value'],
+            'currency': result['currency'],
+            'range': {'low': result['low'], 'high': result['high']},
+            'source': result.get('source')
+        }
+    for index, error in errors.items():
+        estimates[index] = {'index': index, 'success': False, 'error': error}
+    
+    return jsonify({'success': True, 'count': len(valid), 'estimates': estimates})
+
 @bp.route('/semantic-search', methods=['GET'])
 def semantic_search():
     query = sanitize_string(request.args.get('q', ''))[:500]
@@ -93,9 +197,8 @@ def semantic_search():
     except ValueError:
         limit = 6
     
-    print(f"[Semantic Search] Query: {query}, Limit: {limit}")
     results = ai_service.semantic_search(query, limit)
-    print(f"[Semantic Search] Found {len(results)} results")
+    search_log.info("Query %r (limit %d): %d results", query, limit, len(results))
     return jsonify({'success': True, 'results': results})
 
 @bp.route('/vision-helper', methods=['POST'])
@@ -1,33 +1,28 @@
 from flask import Blueprint, request, jsonify, g, redirect
 from werkzeug.security import generate_password_hash, check_password_hash
 from ..db import get_db, is_postgres
+from ..lazy_imports import lazy_import
+from ..services.mailer import queue_email
+from ..log import get_logger
 from ..security import (
     validate_username, validate_email, validate_password,
     sanitize_string, rate_limit, validate_json_request
 )
 import secrets
 import os
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta, timezone
 
-# Google OAuth
-try:
-    from google.oauth2 import id_token
-    from google.auth.transport import requests as google_requests
-    HAS_GOOGLE_AUTH = True
-except ImportError:
-    HAS_GOOGLE_AUTH = False
+# Google OAuth, imported on the first Google sign-in
+id_token = lazy_import('google.oauth2.id_token', probe='google.auth')
+google_requests = lazy_import('google.auth.transport.requests', probe='google.auth')
+HAS_GOOGLE_AUTH = id_token is not None and google_requests is not None
+if not HAS_GOOGLE_AUTH:
     print("[Auth] google-auth not installed - Google OAuth disabled")
 
 bp = Blueprint('auth', __name__, url_prefix='/api/auth')
+verify_log = get_logger('Auth Verify')
 
-# Email config
-SMTP_HOST = os.getenv('SMTP_HOST', '')
-SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
-SMTP_USER = os.getenv('SMTP_USER', '')
-SMTP_PASS = os.getenv('SMTP_PASS', '')
+# Email config (SMTP settings live in services/mailer.py)
 ADMIN_EMAIL = os.getenv('ADMIN_EMAIL', '')
 
 # Google OAuth config
@@ -36,27 +31,8 @@ GOOGLE_CLIENT_SECRET = os.getenv('GOOGLE_CLIENT_SECRET', '')
 FRONTEND_URL = os.getenv('FRONTEND_ORIGIN', 'http://localhost:3000')
 
 def send_auth_email(to_email, subject, body):
-    """Send an authentication email (password reset, etc.)."""
-    if not SMTP_HOST or not SMTP_USER:
-        print(f"[Auth Email] Would send to {to_email}: {subject}")
-        return False
-    
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = SMTP_USER
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'html'))
-        
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_USER, SMTP_PASS)
-            server.send_message(msg)
-        print(f"[Auth Email] Sent to {to_email}")
-        return True
-    except Exception as e:
-        print(f"[Auth Email Error] Failed to send: {e}")
-        return False
+    """Queue an authentication email (password reset, etc.); sent by the job workers."""
+    return queue_email(to_email, subject, body, log_tag='Auth Email')
 
 def generate_token():
     return secrets.token_urlsafe(32)
@@ -294,9 +270,8 @@ def logout():
 @rate_limit(max_requests=30, window_seconds=60)
 def verify_session():
     token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    print(f"[Auth Verify] Checking token: {token[:10]}..." if token else "[Auth Verify] No token provided")
     user = get_user_from_token(token)
-    print(f"[Auth Verify] User lookup result: {user['username'] if user else 'None'}")
+    verify_log.debug("Session %s (%s)", "valid" if user else "rejected", user['username'] if user else '-')
     
     if user:
         return jsonify({'success': True, 'authenticated': True, 'user': user})
@@ -1,6 +1,16 @@
 from flask import Blueprint, request, jsonify, current_app
 from ..db import get_db, is_postgres
-from ..security import sanitize_string, sanitize_search_query, validate_text_field, validate_integer, validate_float, require_auth
+from ..security import sanitize_string, sanitize_search_query, validate_integer, validate_float, require_auth
+from ..services.view_tracker import view_tracker
+from ..services.catalog_index import catalog_index
+from ..services.deal_scorer import deal_scorer, deal_rating
+from ..services.image_variants import build_srcset, variants_for_image
+from ..services.media_store import listing_refs, add_refs, drop_refs, update_refs
+from ..services.listing_import import (
+    listing_importer, parse_listing, listing_params, ListingValidationError, ImportUploadError,
+    detect_format, spool_upload, job_row_to_dict, BULK_IMPORT_SYNC_BYTES,
+)
+import os
 import json
 
 bp = Blueprint('cars', __name__, url_prefix='/api/cars')
@@ -8,7 +18,7 @@ bp = Blueprint('cars', __name__, url_prefix='/api/cars')
 def car_row_to_dict(row):
     """Helper to convert DB row to dictionary with parsed JSON fields."""
     d = dict(row)
-    for field in ['specs', 'engines', 'statistics', 'gallery_images', 'media_gallery', 'image_urls', 'source_sheets']:
+    for field in ['specs', 'engines', 'statistics', 'gallery_images', 'media_gallery', 'image_urls', 'source_sheets', 'image_variants']:
         if d.get(field):
             # Handle both string (SQLite) and already-parsed (PostgreSQL JSONB) data
             if isinstance(d[field], str):
@@ -20,6 +30,10 @@ def car_row_to_dict(row):
     # Map image_url to image for frontend compatibility
     if d.get('image_url') and not d.get('image'):
         d['image'] = d['image_url']
+    # Resized copies of a local upload, ready for <img srcset> (see services/image_variants.py)
+    if isinstance(d.get('image_variants'), dict):
+        d['imageVariants'] = d['image_variants']
+        d['imageSrcset'] = build_srcset(d['image_variants'])
     # Map gallery_images to galleryImages for frontend compatibility (camelCase)
     if d.get('gallery_images'):
         d['galleryImages'] = d['gallery_images']
@@ -46,6 +60,13 @@ def car_row_to_dict(row):
     # Map owner_id to user_id for messaging compatibility
     if d.get('owner_id') is not None:
         d['user_id'] = d['owner_id']
+    # Precomputed fair-price annotations (see services/deal_scorer.py)
+    if d.get('fair_price') is not None:
+        d['fairPrice'] = d['fair_price']
+        d['fairPriceRange'] = {'low': d.get('fair_low'), 'high': d.get('fair_high')}
+    if d.get('deal_score') is not None:
+        d['dealScore'] = d['deal_score']
+        d['dealRating'] = deal_rating(d['deal_score'])
     return d
 
 @bp.route('', methods=['GET'])
@@ -101,6 +122,16 @@ def get_cars():
         base_query += f" AND (make LIKE {ph} ESCAPE '\\' OR model LIKE {ph} ESCAPE '\\')"
         params.extend([search_pattern, search_pattern])
 
+    # Deal filter: only listings priced at least this far below their fair price
+    min_deal_score = args.get('minDealScore')
+    if min_deal_score not in (None, ''):
+        try:
+            min_deal_score = max(-1.0, min(1.0, float(min_deal_score)))
+        except ValueError:
+            return jsonify({'success': False, 'error': 'minDealScore must be a number'}), 400
+        base_query += f" AND deal_score >= {ph}"
+        params.append(min_deal_score)
+
     # Get total count first
     try:
         count_cursor = db.execute(f"SELECT COUNT(*) as total {base_query}", params)
@@ -121,7 +152,12 @@ def get_cars():
         limit = 1000
         offset = 0
     
-    query = f"SELECT * {base_query} ORDER BY created_at DESC LIMIT {ph} OFFSET {ph}"
+    # Best deals first uses idx_cars_deal_score; unscored listings go last
+    if args.get('sort') == 'deal':
+        order_by = "deal_score DESC NULLS LAST, created_at DESC"
+    else:
+        order_by = "created_at DESC"
+    query = f"SELECT * {base_query} ORDER BY {order_by} LIMIT {ph} OFFSET {ph}"
     params.extend([limit, offset])
 
     try:
@@ -148,6 +184,7 @@ def get_car(id):
         ph = '%s' if is_postgres() else '?'
         row = db.execute(f"SELECT * FROM cars WHERE id = {ph}", (id,)).fetchone()
         if row:
+            view_tracker.record(id)
             return jsonify({'success': True, 'car': car_row_to_dict(row)})
         return jsonify({'success': False, 'error': 'Car not found'}), 404
     except Exception as e:
@@ -171,77 +208,12 @@ def create_car():
     if not data:
         return jsonify({'success': False, 'error': 'Invalid JSON body'}), 400
     
-    # Validate and sanitize required fields
-    make = sanitize_string(data.get('make', ''))
-    model = sanitize_string(data.get('model', ''))
-    
-    valid, error = validate_text_field(make, 'Make', required=True, max_length=50)
-    if not valid:
-        return jsonify({'success': False, 'error': error}), 400
-    
-    valid, error = validate_text_field(model, 'Model', required=True, max_length=100)
-    if not valid:
-        return jsonify({'success': False, 'error': error}), 400
-    
-    # Validate optional numeric fields
-    year = data.get('year')
-    if year is not None:
-        valid, error = validate_integer(year, 'Year', min_val=1900, max_val=2100)
-        if not valid:
-            return jsonify({'success': False, 'error': error}), 400
-        year = int(year)
-    
-    price = data.get('price')
-    if price is not None:
-        valid, error = validate_float(price, 'Price', min_val=0, max_val=100000000)
-        if not valid:
-            return jsonify({'success': False, 'error': error}), 400
-        price = float(price)
-    
-    # Sanitize text fields
-    currency = sanitize_string(data.get('currency', 'JOD'))[:10]
-    description = sanitize_string(data.get('description', ''))[:5000]
-    
-    # Handle odometer
-    odometer_km = data.get('odometerKm')
-    if odometer_km is not None:
-        valid, error = validate_integer(odometer_km, 'Odometer', min_val=0, max_val=10000000)
-        if not valid:
-            return jsonify({'success': False, 'error': error}), 400
-        odometer_km = int(odometer_km)
-    
-    # Handle specs as JSON
-    specs = data.get('specs', {})
-    if not isinstance(specs, dict):
-        specs = {}
-    
-    # Handle image fields
-    image_url = sanitize_string(data.get('image', ''))[:500]
-    video_url = sanitize_string(data.get('videoUrl', ''))[:500]
-    
-    # Handle gallery images as JSON array
-    gallery_images = data.get('galleryImages', [])
-    if not isinstance(gallery_images, list):
-        gallery_images = []
-    gallery_images = [sanitize_string(url)[:500] for url in gallery_images if isinstance(url, str)]
-    
-    # Handle media gallery as JSON array
-    media_gallery = data.get('mediaGallery', [])
-    if not isinstance(media_gallery, list):
-        media_gallery = []
-    
-    # Handle new optional fields
-    category = sanitize_string(data.get('category', 'car'))[:20]
-    condition = sanitize_string(data.get('condition', 'used'))[:20]
-    exterior_color = sanitize_string(data.get('exteriorColor', ''))[:50]
-    interior_color = sanitize_string(data.get('interiorColor', ''))[:50]
-    transmission = sanitize_string(data.get('transmission', ''))[:20]
-    fuel_type = sanitize_string(data.get('fuelType', ''))[:20]
-    regional_spec = sanitize_string(data.get('regionalSpec', ''))[:20]
-    payment_type = sanitize_string(data.get('paymentType', 'cash'))[:20]
-    city = sanitize_string(data.get('city', ''))[:100]
-    neighborhood = sanitize_string(data.get('neighborhood', ''))[:100]
-    trim = sanitize_string(data.get('trim', ''))[:50]
+    # Validate and sanitize (shared with the bulk import)
+    try:
+        listing = parse_listing(data)
+    except ListingValidationError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    params = listing_params(listing, owner_id)
     
     db = get_db()
     try:
@@ -249,17 +221,23 @@ def create_car():
             cursor = db.execute(
                 '''INSERT INTO cars (owner_id, make, model, year, price, currency, odometer_km, description, specs, image_url, video_url, gallery_images, media_gallery, category, condition, exterior_color, interior_color, transmission, fuel_type, regional_spec, payment_type, city, neighborhood, trim)
                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id''',
-                (owner_id, make, model, year, price, currency, odometer_km, description, json.dumps(specs), image_url, video_url, json.dumps(gallery_images), json.dumps(media_gallery), category, condition, exterior_color, interior_color, transmission, fuel_type, regional_spec, payment_type, city, neighborhood, trim)
+                params
             )
             new_id = cursor.fetchone()['id']
         else:
             cursor = db.execute(
                 '''INSERT INTO cars (owner_id, make, model, year, price, currency, odometer_km, description, specs, image_url, video_url, gallery_images, media_gallery, category, condition, exterior_color, interior_color, transmission, fuel_type, regional_spec, payment_type, city, neighborhood, trim)
                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                (owner_id, make, model, year, price, currency, odometer_km, description, json.dumps(specs), image_url, video_url, json.dumps(gallery_images), json.dumps(media_gallery), category, condition, exterior_color, interior_color, transmission, fuel_type, regional_spec, payment_type, city, neighborhood, trim)
+                params
             )
             new_id = cursor.lastrowid
+        image_variants = variants_for_image(db, listing['image_url'])
+        if image_variants:
+            db.execute('UPDATE cars SET image_variants = ? WHERE id = ?', (image_variants, new_id))
+        add_refs(db, listing_refs(listing))
         db.commit()
+        catalog_index.add_car(listing['make'], listing['model'], listing['specs'], listing['trim'])
+        deal_scorer.notify()
         return jsonify({'success': True, 'id': new_id}), 201
     except Exception as e:
         import traceback
@@ -272,6 +250,70 @@ def create_car():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@bp.route('/import', methods=['POST'])
+def import_cars():
+    """
+    Bulk-create listings from a CSV or NDJSON upload (multipart ``file`` or raw body).
+    Small files are imported right away (200 with the per-row report); larger ones
+    become a background job (202) to poll at GET /api/cars/import/<job_id>.
+    """
+    user = require_auth()
+    if not user:
+        return jsonify({'success': False, 'error': 'Authentication required'}), 401
+
+    upload = request.files.get('file')
+    try:
+        fmt = detect_format(
+            upload.filename if upload else None,
+            upload.mimetype if upload else request.mimetype,
+            request.args.get('format'),
+        )
+        path, size = spool_upload(upload.stream if upload else request.stream)
+    except ImportUploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if size == 0:
+        os.unlink(path)
+        return jsonify({'success': False, 'error': 'Empty upload'}), 400
+
+    filename = sanitize_string(upload.filename if upload else '')[:200] or None
+    background = size > BULK_IMPORT_SYNC_BYTES or request.args.get('async') in ('1', 'true')
+    db = get_db()
+    try:
+        job_id = listing_importer.create_job(db, user['id'], fmt, filename)
+    except Exception as e:
+        print(f"Import job error: {e}")
+        os.unlink(path)
+        try:
+            db.rollback()
+        except:
+            pass
+        return jsonify({'success': False, 'error': 'Database error'}), 500
+
+    if background:
+        listing_importer.submit(job_id, path, fmt, user['id'])
+        return jsonify({
+            'success': True,
+            'job': job_row_to_dict(listing_importer.get_job(db, job_id)),
+            'statusUrl': f'/api/cars/import/{job_id}',
+        }), 202
+
+    listing_importer.run(db, job_id, path, fmt, user['id'])
+    return jsonify({'success': True, 'job': job_row_to_dict(listing_importer.get_job(db, job_id))})
+
+
+@bp.route('/import/<job_id>', methods=['GET'])
+def get_import_job(job_id):
+    """Progress of a bulk import; the per-row report is included once it completes."""
+    user = require_auth()
+    if not user:
+        return jsonify({'success': False, 'error': 'Authentication required'}), 401
+    db = get_db()
+    row = listing_importer.get_job(db, sanitize_string(job_id)[:64])
+    if not row or row['owner_id'] != user['id']:
+        return jsonify({'success': False, 'error': 'Import job not found'}), 404
+    return jsonify({'success': True, 'job': job_row_to_dict(row)})
+
+
 @bp.route('/<int:id>', methods=['PATCH', 'PUT'])
 def update_car(id):
     """Update a car listing (only by owner)."""
@@ -360,6 +402,8 @@ def update_car(id):
         image_url = sanitize_string(data['image'])[:500]
         updates.append(f"image_url = {ph}")
         params.append(image_url)
+        updates.append(f"image_variants = {ph}")
+        params.append(variants_for_image(db, image_url))
     
     if 'videoUrl' in data:
         video_url = sanitize_string(data['videoUrl'])[:500]
@@ -416,6 +460,8 @@ def update_car(id):
     
     # Add updated_at timestamp
     updates.append("updated_at = CURRENT_TIMESTAMP")
+    # Have the deal scorer re-price this listing
+    updates.append("price_scored_at = NULL")
     
     # Add car ID to params
     params.append(id)
@@ -423,10 +469,14 @@ def update_car(id):
     try:
         query = f"UPDATE cars SET {', '.join(updates)} WHERE id = {ph}"
         db.execute(query, params)
-        db.commit()
         
         # Return updated car
         updated_car = db.execute(f"SELECT * FROM cars WHERE id = {ph}", (id,)).fetchone()
+        update_refs(db, car, updated_car)
+        db.commit()
+        catalog_index.remove_row(car)
+        catalog_index.add_row(updated_car)
+        deal_scorer.notify()
         return jsonify({'success': True, 'car': car_row_to_dict(updated_car)})
     except Exception as e:
         print(f"Update car error: {e}")
@@ -466,8 +516,13 @@ def delete_car(id):
         return jsonify({'success': False, 'error': 'Not authorized to delete this listing'}), 403
     
     try:
+        # Before the cars DELETE: forget() waits for an in-flight view flush,
+        # which must not queue behind this transaction's write lock
+        view_tracker.forget(db, id)
         db.execute(f"DELETE FROM cars WHERE id = {ph}", (id,))
+        drop_refs(db, listing_refs(car))
         db.commit()
+        catalog_index.remove_row(car)
         return jsonify({'success': True, 'message': 'Listing deleted'})
     except Exception as e:
         print(f"Delete car error: {e}")
@@ -1,43 +1,22 @@
 from flask import Blueprint, jsonify, request, g
 from ..db import get_db, is_postgres
 from ..security import token_required
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from ..services.mailer import queue_email, is_configured as email_configured
 import os
 from datetime import datetime
 
 bp = Blueprint('dealers', __name__, url_prefix='/api/dealers')
 
-# Email configuration (set these in environment variables for production)
-SMTP_HOST = os.getenv('SMTP_HOST', '')
-SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
-SMTP_USER = os.getenv('SMTP_USER', '')
-SMTP_PASS = os.getenv('SMTP_PASS', '')
+# Email configuration (SMTP settings live in services/mailer.py)
 ADMIN_EMAIL = os.getenv('ADMIN_EMAIL', 'admin@intelliwheels.co')
 
 def send_email(to_email, subject, body):
-    """Send an email notification. Returns True if sent, False otherwise."""
-    if not SMTP_HOST or not SMTP_USER:
+    """Queue an email notification. Returns True if queued, False if email is not configured."""
+    if not email_configured():
         print(f"[Email] Would send to {to_email}: {subject}")
         print(f"[Email] Body: {body}")
         return False  # Email not configured
-    
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = SMTP_USER
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'html'))
-        
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_USER, SMTP_PASS)
-            server.send_message(msg)
-        return True
-    except Exception as e:
-        print(f"[Email Error] Failed to send: {e}")
-        return False
+    return queue_email(to_email, subject, body)
 
 @bp.route('', methods=['GET'])
 def get_dealers():
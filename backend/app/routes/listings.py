@@ -2,6 +2,8 @@ from flask import Blueprint, jsonify, request
 from ..db import get_db, is_postgres
 from .auth import get_user_from_token
 from .cars import car_row_to_dict
+from ..services.view_tracker import view_tracker
+from ..services.catalog_index import catalog_index
 
 # This blueprint will attach directly to /api to handle root-level resource endpoints
 # like /api/makes and /api/my-listings
@@ -9,57 +11,49 @@ bp = Blueprint('listings', __name__, url_prefix='/api')
 
 @bp.route('/makes', methods=['GET'])
 def get_makes():
-    db = get_db()
-    cursor = db.execute('SELECT DISTINCT make FROM cars ORDER BY make ASC')
-    makes = [row['make'] for row in cursor.fetchall()]
-    return jsonify({'success': True, 'makes': makes})
+    return jsonify({'success': True, 'makes': catalog_index.makes()})
 
 @bp.route('/models', methods=['GET'])
 def get_models():
     """Get models for a specific make, or all make-model pairs."""
-    db = get_db()
     make = request.args.get('make')
     
     if make:
-        cursor = db.execute(
-            'SELECT DISTINCT model FROM cars WHERE LOWER(make) = LOWER(?) ORDER BY model ASC',
-            (make,)
-        )
-        models = [row['model'] for row in cursor.fetchall()]
-        return jsonify({'success': True, 'models': models})
-    else:
-        # Return all make-model pairs grouped
-        cursor = db.execute(
-            'SELECT DISTINCT make, model FROM cars ORDER BY make ASC, model ASC'
-        )
-        result = {}
-        for row in cursor.fetchall():
-            make_name = row['make']
-            if make_name not in result:
-                result[make_name] = []
-            result[make_name].append(row['model'])
-        return jsonify({'success': True, 'models_by_make': result})
+        return jsonify({'success': True, 'models': catalog_index.models(make)})
+    # Return all make-model pairs grouped
+    return jsonify({'success': True, 'models_by_make': catalog_index.models_by_make()})
 
 @bp.route('/engines', methods=['GET'])
 def get_engines():
     """Get engines for a specific make/model."""
-    db = get_db()
     make = request.args.get('make')
     model = request.args.get('model')
     
     if not make or not model:
         return jsonify({'success': False, 'error': 'make and model required'}), 400
     
-    cursor = db.execute(
-        '''SELECT DISTINCT json_extract(specs, '$.engine') as engine 
-           FROM cars 
-           WHERE LOWER(make) = LOWER(?) AND LOWER(model) = LOWER(?)
-           AND json_extract(specs, '$.engine') IS NOT NULL
-           ORDER BY engine ASC''',
-        (make, model)
-    )
-    engines = [row['engine'] for row in cursor.fetchall() if row['engine']]
-    return jsonify({'success': True, 'engines': engines})
+    return jsonify({'success': True, 'engines': catalog_index.engines(make, model)})
+
+@bp.route('/trims', methods=['GET'])
+def get_trims():
+    """Get trims for a specific make/model."""
+    make = request.args.get('make')
+    model = request.args.get('model')
+    
+    if not make or not model:
+        return jsonify({'success': False, 'error': 'make and model required'}), 400
+    
+    return jsonify({'success': True, 'trims': catalog_index.trims(make, model)})
+
+@bp.route('/catalog/autocomplete', methods=['GET'])
+def catalog_autocomplete():
+    """Prefix suggestions for makes and make/model pairs."""
+    query = request.args.get('q', '')[:100]
+    try:
+        limit = min(max(int(request.args.get('limit', 10)), 1), 50)
+    except ValueError:
+        limit = 10
+    return jsonify({'success': True, 'suggestions': catalog_index.autocomplete(query, limit)})
 
 @bp.route('/my-listings', methods=['GET'])
 def get_my_listings():
@@ -171,6 +165,9 @@ def get_my_listings_analytics():
             result = rating_cursor.fetchone()
             avg_rating = round(result['avg_rating'], 1) if result['avg_rating'] else 0
         
+        # Views: flushed daily counters plus this worker's unflushed buffer
+        total_views = view_tracker.total_views(db, car_ids)
+        
         # Recent listings (last 5)
         recent = sorted(cars, key=lambda x: x.get('created_at', ''), reverse=True)[:5]
         recent_listings = [{
@@ -196,7 +193,7 @@ def get_my_listings_analytics():
                 'listings_by_body_style': listings_by_body_style,
                 'recent_listings': recent_listings,
                 'performance': {
-                    'total_views': 0,  # TODO: implement view tracking
+                    'total_views': total_views,
                     'total_favorites': favorites_count,
                     'avg_rating': avg_rating
                 }
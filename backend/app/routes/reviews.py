@@ -1,9 +1,11 @@
 from flask import Blueprint, request, jsonify
 from ..db import get_db, is_postgres
 from ..security import sanitize_string, validate_text_field, require_auth
+from ..log import get_logger
 import json
 
 bp = Blueprint('reviews', __name__, url_prefix='/api/reviews')
+log = get_logger('Reviews')
 
 
 @bp.route('/car/<int:car_id>', methods=['GET'])
@@ -48,7 +50,7 @@ def get_car_reviews(car_id):
             ''')
         db.commit()
     except Exception as e:
-        print(f"Reviews table creation note: {e}")
+        log.warning("Reviews table creation note: %s", e)
         try:
             db.rollback()
         except:
@@ -56,7 +58,6 @@ def get_car_reviews(car_id):
     
     try:
         # Get reviews with user info - use LEFT JOIN to handle missing users gracefully
-        print(f"[Reviews] Fetching reviews for car_id: {car_id}")
         if is_postgres():
             cursor = db.execute('''
                 SELECT r.id, r.car_id, r.user_id, r.rating, r.comment, r.created_at, r.updated_at,
@@ -88,7 +89,6 @@ def get_car_reviews(car_id):
                 'created_at': str(row['created_at']) if row['created_at'] else None,
                 'updated_at': str(row['updated_at']) if row['updated_at'] else None
             }
-            print(f"[Reviews] Found review: {review_data}")
             reviews.append(review_data)
         
         # Calculate average rating
@@ -112,10 +112,10 @@ def get_car_reviews(car_id):
                 'total_reviews': int(stats['count']) if stats['count'] else 0
             }
         }
-        print(f"[Reviews] Returning: {result}")
+        log.debug("Returning %d reviews for car %s", len(reviews), car_id)
         return jsonify(result)
     except Exception as e:
-        print(f"Get reviews error: {e}")
+        log.error("Get reviews error: %s", e)
         try:
             db.rollback()
         except:
@@ -1,16 +1,18 @@
-from flask import Blueprint, jsonify, send_from_directory, current_app, request
+from flask import Blueprint, jsonify, current_app, request, redirect
 import os
-import uuid
 from werkzeug.utils import secure_filename
 from ..db import get_db
+from ..lazy_imports import lazy_import
+from ..services.job_queue import job_queue
+from ..services.media_files import send_media
+from ..services.media_store import save_upload, adopt_file
+from ..services.image_variants import queue_variants, VARIANT_DIR
+from ..services.chunked_upload import ChunkedUploads, UploadSessionError, UPLOAD_CHUNK_MAX
 
-# Try to import Cloudinary for cloud storage
-try:
-    import cloudinary
-    import cloudinary.uploader
-    HAS_CLOUDINARY = True
-except ImportError:
-    HAS_CLOUDINARY = False
+# Cloudinary for cloud storage, imported on the first upload
+cloudinary = lazy_import('cloudinary')
+cloudinary_uploader = lazy_import('cloudinary.uploader', probe='cloudinary')
+HAS_CLOUDINARY = cloudinary is not None
 
 bp = Blueprint('system', __name__, url_prefix='/api')
 
@@ -38,6 +40,60 @@ def init_cloudinary():
     )
     return True
 
+# Upload options per media kind, applied by the background Cloudinary job
+CLOUDINARY_UPLOAD_OPTIONS = {
+    'image': {
+        'folder': 'intelliwheels/images',
+        'resource_type': 'image',
+        'transformation': [{'quality': 'auto:good', 'fetch_format': 'auto'}],
+    },
+    'video': {
+        'folder': 'intelliwheels/videos',
+        'resource_type': 'video',
+        'eager': [{'format': 'mp4', 'quality': 'auto'}],
+        'eager_async': True,
+    },
+}
+
+
+@job_queue.handler('cloudinary_upload')
+def upload_to_cloudinary(payload):
+    """
+    Move a locally saved upload to Cloudinary. The local URL keeps working:
+    once the file is gone it redirects to the Cloudinary copy (see serve_uploaded_image).
+    """
+    if not init_cloudinary():
+        raise RuntimeError('Cloudinary is not configured')
+    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], payload['filename'])
+    db = get_db()
+    if not os.path.exists(filepath):
+        row = db.execute('SELECT remote_url FROM media_uploads WHERE filename = ?', (payload['filename'],)).fetchone()
+        if row and row['remote_url']:
+            return  # an earlier attempt already moved it
+        # Lost with the local disk (a restart on ephemeral storage): fail loudly so the
+        # job is retried and then recorded as failed, instead of marked done
+        raise FileNotFoundError(f"{payload['filename']} is missing locally and has no Cloudinary copy")
+    result = cloudinary_uploader.upload(filepath, **CLOUDINARY_UPLOAD_OPTIONS[payload['kind']])
+    db.execute('''
+        INSERT INTO media_uploads (filename, kind, remote_url, public_id) VALUES (?, ?, ?, ?)
+        ON CONFLICT (filename) DO UPDATE SET remote_url = excluded.remote_url, public_id = excluded.public_id
+    ''', (payload['filename'], payload['kind'], result['secure_url'], result['public_id']))
+    db.commit()
+    os.remove(filepath)
+    print(f"[Cloudinary] Uploaded {payload['filename']} -> {result['public_id']}")
+
+
+def _serve_upload(filename):
+    """Serve a local upload, or redirect to its Cloudinary copy once the background job moved it."""
+    upload_dir = current_app.config['UPLOAD_FOLDER']
+    db = get_db()
+    if not os.path.exists(os.path.join(upload_dir, filename)):
+        row = db.execute('SELECT remote_url FROM media_uploads WHERE filename = ?', (filename,)).fetchone()
+        if row and row['remote_url']:
+            return redirect(row['remote_url'], code=301)
+    return send_media(db, upload_dir, filename)
+
+
 def allowed_image_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_IMAGE_EXTENSIONS
 
@@ -48,6 +104,10 @@ def allowed_video_file(filename):
 def allowed_file(filename):
     return allowed_image_file(filename)
 
+def max_video_size():
+    """Max video size: 500MB for 4K videos, but Cloudinary free tier limits to ~100MB."""
+    return 100 * 1024 * 1024 if is_cloudinary_configured() else 500 * 1024 * 1024
+
 @bp.route('/health')
 def health_check():
     # Check if GEMINI_API_KEY is configured
@@ -56,6 +116,7 @@ def health_check():
     
     # Check which model is actually active
     from ..services.ai_service import ai_service
+    from ..services.price_model import price_model
     active_model = getattr(ai_service, 'active_model_name', None)
     gemini_working = ai_service.gemini_model is not None
     init_error = getattr(ai_service, '_init_error', None)
@@ -70,11 +131,16 @@ def health_check():
         'ai_enabled': ai_configured,
         'ai_working': gemini_working,
         'ai_model': active_model,
+        'ai_initializing': ai_service.initializing,
         'ai_error': init_error if not gemini_working else None,
         'frontend_origin': os.environ.get('FRONTEND_ORIGIN', 'not set'),
         'database_type': 'postgresql' if os.environ.get('DATABASE_URL') else 'sqlite',
         'database_url_set': bool(os.environ.get('DATABASE_URL')),
         'cloudinary_enabled': cloudinary_configured,
+        'ai_cache': ai_service.response_cache.stats(),
+        'ai_executor': ai_service.executor.stats(),
+        'price_model': price_model.stats(),
+        'job_queue': job_queue.stats(),
         'storage_type': 'cloudinary' if cloudinary_configured else 'local (ephemeral)'
     })
 
@@ -362,13 +428,28 @@ def platform_stats():
 
 @bp.route('/uploads/images/<path:filename>')
 def serve_uploaded_image(filename):
-    upload_dir = current_app.config['UPLOAD_FOLDER']
-    return send_from_directory(upload_dir, filename)
+    return _serve_upload(filename)
 
 @bp.route('/uploads/videos/<path:filename>')
 def serve_uploaded_video(filename):
-    upload_dir = current_app.config['UPLOAD_FOLDER']
-    return send_from_directory(upload_dir, filename)
+    return _serve_upload(filename)
+
+@bp.route('/uploads/variants/<path:filename>')
+def serve_image_variant(filename):
+    # Variants are named by their content hash, which doubles as the ETag
+    variants_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], VARIANT_DIR)
+    return send_media(get_db(), variants_dir, filename, etag=os.path.splitext(os.path.basename(filename))[0])
+
+def _queue_cloud_upload(filename, kind):
+    """Queue the Cloudinary copy of a saved upload. Returns 'queued', or None when it stays local."""
+    if not is_cloudinary_configured():
+        return None
+    try:
+        job_queue.enqueue('cloudinary_upload', {'filename': filename, 'kind': kind})
+        return 'queued'
+    except Exception as e:
+        print(f"[Cloudinary] Could not queue {kind} upload, keeping it local: {e}")
+        return None
 
 @bp.route('/uploads/images', methods=['POST', 'OPTIONS'])
 def upload_image():
@@ -388,36 +469,14 @@ def upload_image():
     if not allowed_image_file(file.filename):
         return jsonify({'success': False, 'error': 'File type not allowed. Allowed: png, jpg, jpeg, gif, webp'}), 400
     
-    # Try Cloudinary first for persistent cloud storage
-    if init_cloudinary():
-        try:
-            # Upload directly to Cloudinary
-            result = cloudinary.uploader.upload(
-                file,
-                folder="intelliwheels/images",
-                resource_type="image",
-                transformation=[{"quality": "auto:good", "fetch_format": "auto"}]
-            )
-            return jsonify({
-                'success': True,
-                'url': result['secure_url'],
-                'path': result['public_id'],
-                'filename': result['public_id'].split('/')[-1]
-            })
-        except Exception as e:
-            print(f"[Cloudinary] Image upload error: {e}")
-            # Fall back to local storage
-    
-    # Local storage fallback
-    ext = file.filename.rsplit('.', 1)[1].lower()
-    unique_filename = f"{uuid.uuid4().hex}.{ext}"
-    safe_filename = secure_filename(unique_filename)
-    
-    upload_dir = current_app.config['UPLOAD_FOLDER']
-    os.makedirs(upload_dir, exist_ok=True)
-    
-    filepath = os.path.join(upload_dir, safe_filename)
-    file.save(filepath)
+    # Stored under its content hash, so a re-upload reuses the existing file.
+    # Saved locally; when Cloudinary is configured a background job moves it there
+    ext = secure_filename(file.filename.rsplit('.', 1)[1].lower())
+    safe_filename, created = save_upload(get_db(), current_app.config['UPLOAD_FOLDER'], file.stream, ext, 'image')
+    cloud_upload = _queue_cloud_upload(safe_filename, 'image') if created else None
+    if created and cloud_upload is None:
+        # Cloudinary resizes on request; local files get pre-rendered sizes
+        queue_variants(safe_filename)
     
     backend_url = os.environ.get('BACKEND_URL', '')
     if backend_url:
@@ -429,7 +488,9 @@ def upload_image():
         'success': True,
         'url': url,
         'path': f"/api/uploads/images/{safe_filename}",
-        'filename': safe_filename
+        'filename': safe_filename,
+        'deduplicated': not created,
+        'cloudUpload': cloud_upload
     })
 
 @bp.route('/uploads/videos', methods=['POST', 'OPTIONS'])
@@ -455,40 +516,15 @@ def upload_video():
     file_size = file.tell()
     file.seek(0)  # Seek back to start
     
-    max_size = 100 * 1024 * 1024 if is_cloudinary_configured() else 500 * 1024 * 1024
+    max_size = max_video_size()
     if file_size > max_size:
         return jsonify({'success': False, 'error': f'Video file too large. Maximum size is {max_size // (1024*1024)}MB'}), 400
     
-    # Try Cloudinary first for persistent cloud storage
-    if init_cloudinary():
-        try:
-            result = cloudinary.uploader.upload(
-                file,
-                folder="intelliwheels/videos",
-                resource_type="video",
-                eager=[{"format": "mp4", "quality": "auto"}],
-                eager_async=True
-            )
-            return jsonify({
-                'success': True,
-                'url': result['secure_url'],
-                'path': result['public_id'],
-                'filename': result['public_id'].split('/')[-1]
-            })
-        except Exception as e:
-            print(f"[Cloudinary] Video upload error: {e}")
-            # Fall back to local storage
-    
-    # Local storage fallback
-    ext = file.filename.rsplit('.', 1)[1].lower()
-    unique_filename = f"{uuid.uuid4().hex}.{ext}"
-    safe_filename = secure_filename(unique_filename)
-    
-    upload_dir = current_app.config['UPLOAD_FOLDER']
-    os.makedirs(upload_dir, exist_ok=True)
-    
-    filepath = os.path.join(upload_dir, safe_filename)
-    file.save(filepath)
+    # Stored under its content hash, so a re-upload reuses the existing file.
+    # Saved locally; when Cloudinary is configured a background job moves it there
+    ext = secure_filename(file.filename.rsplit('.', 1)[1].lower())
+    safe_filename, created = save_upload(get_db(), current_app.config['UPLOAD_FOLDER'], file.stream, ext, 'video')
+    cloud_upload = _queue_cloud_upload(safe_filename, 'video') if created else None
     
     backend_url = os.environ.get('BACKEND_URL', '')
     if backend_url:
@@ -500,5 +536,101 @@ def upload_video():
         'success': True,
         'url': url,
         'path': f"/api/uploads/videos/{safe_filename}",
-        'filename': safe_filename
+        'filename': safe_filename,
+        'deduplicated': not created,
+        'cloudUpload': cloud_upload
     })
+
+
+# ============================================================
+# Resumable video uploads
+# ============================================================
+# POST   /uploads/videos/sessions            {filename, size} -> {uploadId, offset, chunkSize}
+# PUT    /uploads/videos/sessions/<id>       raw chunk body, Upload-Offset header -> {offset}
+# GET    /uploads/videos/sessions/<id>       current offset, to resume after a dropped connection
+# POST   /uploads/videos/sessions/<id>/complete  -> same response as POST /uploads/videos
+# DELETE /uploads/videos/sessions/<id>       abandon the upload
+
+def _video_sessions():
+    return ChunkedUploads(current_app.config['UPLOAD_FOLDER'])
+
+def _session_json(meta):
+    return {
+        'success': True,
+        'uploadId': meta['id'],
+        'offset': meta['offset'],
+        'size': meta['size'],
+        'chunkSize': UPLOAD_CHUNK_MAX,
+    }
+
+def _session_error(e):
+    body = {'success': False, 'error': str(e)}
+    if e.offset is not None:
+        body['offset'] = e.offset
+    return jsonify(body), e.status
+
+@bp.route('/uploads/videos/sessions', methods=['POST'])
+def create_video_upload_session():
+    data = request.get_json(silent=True) or {}
+    filename = str(data.get('filename') or '')
+    if not allowed_video_file(filename):
+        return jsonify({'success': False, 'error': 'File type not allowed. Allowed: mp4, mov, avi, mkv, webm'}), 400
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'size (in bytes) is required'}), 400
+    max_size = max_video_size()
+    if size <= 0 or size > max_size:
+        return jsonify({'success': False, 'error': f'Video file too large. Maximum size is {max_size // (1024*1024)}MB'}), 400
+
+    meta = _video_sessions().create(filename.rsplit('.', 1)[1].lower(), size)
+    return jsonify(_session_json(meta)), 201
+
+@bp.route('/uploads/videos/sessions/<upload_id>', methods=['GET'])
+def get_video_upload_session(upload_id):
+    try:
+        return jsonify(_session_json(_video_sessions().status(upload_id)))
+    except UploadSessionError as e:
+        return _session_error(e)
+
+@bp.route('/uploads/videos/sessions/<upload_id>', methods=['PUT'])
+def append_video_chunk(upload_id):
+    try:
+        offset = int(request.headers.get('Upload-Offset', request.args.get('offset', '')))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Upload-Offset header is required'}), 400
+    try:
+        # request.stream reads the body as it arrives instead of buffering it
+        meta = _video_sessions().append(upload_id, offset, request.stream, request.content_length)
+    except UploadSessionError as e:
+        return _session_error(e)
+    return jsonify(_session_json(meta))
+
+@bp.route('/uploads/videos/sessions/<upload_id>/complete', methods=['POST'])
+def complete_video_upload(upload_id):
+    upload_dir = current_app.config['UPLOAD_FOLDER']
+    try:
+        safe_filename, created = _video_sessions().finalize(
+            upload_id, lambda path, ext: adopt_file(get_db(), upload_dir, path, ext, 'video')
+        )
+    except UploadSessionError as e:
+        return _session_error(e)
+    cloud_upload = _queue_cloud_upload(safe_filename, 'video') if created else None
+
+    backend_url = os.environ.get('BACKEND_URL', '')
+    return jsonify({
+        'success': True,
+        'url': f"{backend_url}/api/uploads/videos/{safe_filename}",
+        'path': f"/api/uploads/videos/{safe_filename}",
+        'filename': safe_filename,
+        'deduplicated': not created,
+        'cloudUpload': cloud_upload
+    })
+
+@bp.route('/uploads/videos/sessions/<upload_id>', methods=['DELETE'])
+def abort_video_upload(upload_id):
+    try:
+        _video_sessions().abort(upload_id)
+    except UploadSessionError as e:
+        return _session_error(e)
+    return jsonify({'success': True})
@@ -0,0 +1,150 @@
+"""
+Content-addressed cache and single-flight coalescing for Gemini calls.
+
+Identical prompts (same normalized text, history window and image bytes) map
+to the same key. A cached answer is returned until its TTL expires; while an
+answer is being generated, concurrent callers with the same key wait for that
+one upstream call instead of issuing their own.
+"""
+
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+AI_CACHE_TTL = int(os.environ.get('AI_CACHE_TTL', '3600'))
+AI_CACHE_MAX_ENTRIES = int(os.environ.get('AI_CACHE_MAX_ENTRIES', '512'))
+AI_CACHE_MAX_BYTES = int(os.environ.get('AI_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    """Collapse whitespace and case so trivially different prompts share a key."""
+    return _WHITESPACE.sub(' ', text).strip().casefold()
+
+
+def prompt_key(model_name, parts):
+    """Hash a Gemini prompt (text and inline image parts) into a cache key."""
+    digest = hashlib.sha256()
+    digest.update((model_name or '').encode('utf-8'))
+    for part in parts:
+        if isinstance(part, dict) and 'data' in part:
+            digest.update(b'\x00img:')
+            digest.update(str(part.get('mime_type', '')).encode('utf-8'))
+            digest.update(hashlib.sha256(part['data']).digest())
+        else:
+            digest.update(b'\x00txt:')
+            digest.update(normalize_text(str(part)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class _InFlight:
+    __slots__ = ('event', 'value', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResponseCache:
+    def __init__(self, ttl=AI_CACHE_TTL, max_entries=AI_CACHE_MAX_ENTRIES, max_bytes=AI_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._bytes = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _drop(self, key):
+        _, value = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    def _put(self, key, value):
+        if self.ttl <= 0 or len(value) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._bytes += len(value)
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._drop(next(iter(self._entries)))
+
+    def peek(self, key):
+        """Return the cached string for ``key`` without computing it."""
+        with self._lock:
+            value = self._get(key)
+            if value is not None:
+                self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._put(key, value)
+
+    def get_or_compute(self, key, compute):
+        """Return the cached string for ``key``, computing it at most once across threads."""
+        with self._lock:
+            value = self._get(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _InFlight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = compute()
+            with self._lock:
+                self._put(key, call.value)
+            return call.value
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            call.event.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+            }
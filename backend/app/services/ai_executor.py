@@ -0,0 +1,220 @@
+"""
+Bounded execution pool and circuit breaker for upstream AI calls.
+
+Gemini calls run on a small thread pool instead of the request thread, each
+with a deadline. When the pool and its queue are full, new AI requests are
+shed with a 503 straight away instead of tying up more workers. Repeated
+quota/timeout failures open a circuit breaker, so the API stops calling a
+degraded backend for a cool-down period and then lets a single probe through.
+"""
+
+import os
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+AI_MAX_CONCURRENCY = int(os.environ.get('AI_MAX_CONCURRENCY', '4'))
+AI_MAX_QUEUE = int(os.environ.get('AI_MAX_QUEUE', '8'))
+AI_CALL_TIMEOUT = float(os.environ.get('AI_CALL_TIMEOUT', '30'))
+AI_BREAKER_THRESHOLD = int(os.environ.get('AI_BREAKER_THRESHOLD', '5'))
+AI_BREAKER_COOLDOWN = float(os.environ.get('AI_BREAKER_COOLDOWN', '60'))
+
+# Error substrings that mean the backend is degraded rather than the request being bad
+_DEGRADED_MARKERS = ('quota', 'resource', 'exhausted', '429', '503', 'unavailable', 'deadline', 'timeout')
+
+
+class AIUnavailableError(Exception):
+    """The AI backend cannot take this call right now (shed, timed out or circuit open)."""
+
+    def __init__(self, message, retry_after=5):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AIOverloadedError(AIUnavailableError):
+    pass
+
+
+class AITimeoutError(AIUnavailableError):
+    pass
+
+
+class AICircuitOpenError(AIUnavailableError):
+    pass
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, threshold=AI_BREAKER_THRESHOLD, cooldown=AI_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self.cooldown - (time.monotonic() - self.opened_at)
+                if remaining > 0:
+                    raise AICircuitOpenError('AI service temporarily unavailable', retry_after=int(remaining) + 1)
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    raise AICircuitOpenError('AI service temporarily unavailable', retry_after=5)
+                self._probe_in_flight = True
+
+    def release_probe(self):
+        """Give back a half-open probe slot without judging the backend."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self, degraded):
+        with self._lock:
+            self._probe_in_flight = False
+            if not degraded:
+                if self.state == self.HALF_OPEN:
+                    self.state = self.CLOSED
+                return
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                if self.state != self.OPEN:
+                    print(f"[AI] Circuit breaker opened after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+def is_degraded_error(error):
+    if isinstance(error, (AITimeoutError, FutureTimeout)):
+        return True
+    error_lower = str(error).lower()
+    return any(marker in error_lower for marker in _DEGRADED_MARKERS)
+
+
+class AIExecutor:
+    def __init__(self, max_concurrency=AI_MAX_CONCURRENCY, max_queue=AI_MAX_QUEUE,
+                 timeout=AI_CALL_TIMEOUT, breaker=None):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self._pool = None
+        self._pool_pid = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.shed = 0
+        self.timeouts = 0
+
+    def _get_pool(self):
+        # Threads do not survive a fork, so each gunicorn worker builds its own pool
+        if self._pool is None or self._pool_pid != os.getpid():
+            self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='ai-call')
+            self._pool_pid = os.getpid()
+            self._pending = 0
+        return self._pool
+
+    def _admit(self):
+        with self._lock:
+            pool = self._get_pool()
+            if self._pending >= self.max_concurrency + self.max_queue:
+                self.shed += 1
+                raise AIOverloadedError('AI service is busy. Please try again shortly.', retry_after=5)
+            self._pending += 1
+            return pool
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._pending = max(0, self._pending - 1)
+
+    def run(self, fn, timeout=None):
+        """Run ``fn`` on the pool and wait at most ``timeout`` seconds for its result."""
+        self.breaker.before_call()
+        try:
+            pool = self._admit()
+        except AIUnavailableError:
+            self.breaker.release_probe()
+            raise
+        future = pool.submit(fn)
+        # The slot stays taken until the upstream call really finishes, even after we give up waiting
+        future.add_done_callback(self._release)
+        try:
+            result = future.result(timeout=timeout or self.timeout)
+        except FutureTimeout:
+            self.timeouts += 1
+            self.breaker.record_failure(degraded=True)
+            raise AITimeoutError('AI service took too long to respond. Please try again.', retry_after=10)
+        except Exception as e:
+            self.breaker.record_failure(degraded=is_degraded_error(e))
+            raise
+        self.breaker.record_success()
+        return result
+
+    def stream(self, fn, timeout=None):
+        """
+        Run ``fn`` (which returns an iterable) on the pool and yield its items
+        as they arrive. ``timeout`` bounds the whole stream.
+        """
+        self.breaker.before_call()
+        try:
+            pool = self._admit()
+        except AIUnavailableError:
+            self.breaker.release_probe()
+            raise
+        items = queue.Queue()
+        done = object()
+
+        def pump():
+            try:
+                for item in fn():
+                    items.put((item, None))
+            except Exception as e:
+                items.put((None, e))
+            finally:
+                items.put((done, None))
+
+        future = pool.submit(pump)
+        future.add_done_callback(self._release)
+        deadline = time.monotonic() + (timeout or self.timeout)
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                item, error = items.get(timeout=max(remaining, 0))
+            except queue.Empty:
+                self.timeouts += 1
+                self.breaker.record_failure(degraded=True)
+                raise AITimeoutError('AI service took too long to respond. Please try again.', retry_after=10)
+            if error is not None:
+                self.breaker.record_failure(degraded=is_degraded_error(error))
+                raise error
+            if item is done:
+                self.breaker.record_success()
+                return
+            try:
+                yield item
+            except GeneratorExit:
+                # Client went away mid-stream; says nothing about backend health
+                self.breaker.release_probe()
+                raise
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': self._pending,
+                'max_concurrency': self.max_concurrency,
+                'max_queue': self.max_queue,
+                'timeout_seconds': self.timeout,
+                'shed': self.shed,
+                'timeouts': self.timeouts,
+                'breaker_state': self.breaker.state,
+                'breaker_failures': self.breaker.failures,
+            }
@@ -1,15 +1,38 @@
 import os
+import re
 import json
-import joblib
-import base64
+import time
+import hashlib
+import logging
+import tempfile
+import threading
 from flask import current_app
+from ..lazy_imports import lazy_import
+from .ai_cache import ResponseCache, prompt_key
+from .ai_executor import AIExecutor, AIUnavailableError
+from .image_processing import prepare_image, ImageRejectedError
+from .price_model import price_model
+from ..log import get_logger
 
-try:
-    import google.generativeai as genai
-    GEMINI_AVAILABLE = True
-except ImportError:
-    GEMINI_AVAILABLE = False
-    genai = None
+# Heavy imports are deferred until Gemini setup runs
+genai = lazy_import('google.generativeai')
+GEMINI_AVAILABLE = genai is not None
+
+chat_log = get_logger('Chat')
+search_log = get_logger('Semantic Search')
+
+# 'background' starts Gemini setup on a thread at import, 'lazy' waits for the
+# first AI request, 'eager' keeps the old blocking behaviour
+AI_INIT_MODE = os.environ.get('AI_INIT_MODE', 'background')
+AI_INIT_WAIT = float(os.environ.get('AI_INIT_WAIT', '10'))
+# list_models() is a network round trip; its result is shared by all workers through this file
+GEMINI_MODEL_CACHE_PATH = os.environ.get(
+    'GEMINI_MODEL_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'intelliwheels_gemini_models.json')
+)
+GEMINI_MODEL_CACHE_TTL = int(os.environ.get('GEMINI_MODEL_CACHE_TTL', str(24 * 3600)))
+
+LISTING_MARKER = '```json_listing'
+LISTING_BLOCK_RE = re.compile(r'```json_listing\s*({.*?})\s*```', re.DOTALL)
 
 class AIService:
     _instance = None
@@ -30,8 +53,100 @@ class AIService:
         self.gemini_model = None
         self.active_model_name = None
         self._init_error = None
-        self._init_gemini()
-        
+        self.response_cache = ResponseCache()
+        self.executor = AIExecutor()
+        self._init_lock = threading.Lock()
+        self._init_thread = None
+        self._init_pid = None
+        if AI_INIT_MODE == 'eager':
+            self._init_gemini()
+        elif AI_INIT_MODE == 'background':
+            self.start_background_init()
+
+    def start_background_init(self):
+        """Run Gemini setup on a daemon thread so importing the service never blocks."""
+        with self._init_lock:
+            if self.gemini_model or self._initializing():
+                return
+            self._init_pid = os.getpid()
+            self._init_thread = threading.Thread(target=self._init_gemini, name='ai-init', daemon=True)
+            self._init_thread.start()
+
+    def _initializing(self):
+        # A thread started before a fork does not exist in the child
+        return (self._init_thread is not None and self._init_pid == os.getpid()
+                and self._init_thread.is_alive())
+
+    @property
+    def initializing(self):
+        return self._initializing()
+
+    def ensure_gemini(self, timeout=AI_INIT_WAIT):
+        """
+        Make sure Gemini setup has run. Waits up to ``timeout`` seconds for a
+        background init in progress, otherwise (re)tries it inline.
+        """
+        if self.gemini_model:
+            return True
+        thread = self._init_thread
+        if self._initializing():
+            thread.join(timeout)
+            return self.gemini_model is not None
+        with self._init_lock:
+            # Another request may have finished the retry while we waited for the lock
+            if not self.gemini_model:
+                self._init_gemini()
+        return self.gemini_model is not None
+
+    @staticmethod
+    def _key_fingerprint(api_key):
+        return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+
+    def _read_model_cache(self, api_key):
+        try:
+            with open(GEMINI_MODEL_CACHE_PATH, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if cached.get('key') != self._key_fingerprint(api_key):
+            return None
+        if time.time() - cached.get('fetched_at', 0) > GEMINI_MODEL_CACHE_TTL:
+            return None
+        return cached.get('models')
+
+    def _write_model_cache(self, api_key, model_names):
+        payload = {'key': self._key_fingerprint(api_key), 'fetched_at': time.time(), 'models': model_names}
+        try:
+            directory = os.path.dirname(GEMINI_MODEL_CACHE_PATH) or '.'
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.gemini_models.')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(payload, f)
+            # Atomic rename so a worker never reads a half-written file
+            os.replace(tmp_path, GEMINI_MODEL_CACHE_PATH)
+        except OSError as e:
+            print(f"Could not write Gemini model cache: {e}")
+
+    def _discover_models(self, api_key):
+        """Names of models supporting generateContent, from the shared cache file when fresh."""
+        cached = self._read_model_cache(api_key)
+        if cached is not None:
+            print(f"Available Gemini models (cached): {cached[:10]}")
+            return cached
+
+        available_model_names = []
+        try:
+            for m in genai.list_models():
+                methods = getattr(m, 'supported_generation_methods', [])
+                if 'generateContent' in methods:
+                    available_model_names.append(m.name)
+            print(f"Available Gemini models: {available_model_names[:10]}")
+        except Exception as e:
+            print(f"Could not list models: {e}")
+            # Continue anyway - we'll try our predefined list
+            return available_model_names
+        self._write_model_cache(api_key, available_model_names)
+        return available_model_names
+
     def _init_gemini(self):
         if not GEMINI_AVAILABLE:
             print("Warning: google-generativeai not installed")
@@ -47,16 +162,7 @@ class AIService:
             genai.configure(api_key=api_key)
             
             # List available models to find the right one
-            available_model_names = []
-            try:
-                for m in genai.list_models():
-                    methods = getattr(m, 'supported_generation_methods', [])
-                    if 'generateContent' in methods:
-                        available_model_names.append(m.name)
-                print(f"Available Gemini models: {available_model_names[:10]}")
-            except Exception as e:
-                print(f"Could not list models: {e}")
-                # Continue anyway - we'll try our predefined list
+            available_model_names = self._discover_models(api_key)
             
             # Try to use a model from the environment variable first
             env_model = os.environ.get('GEMINI_TEXT_MODEL')
@@ -123,120 +229,51 @@ class AIService:
             cls._instance = AIService()
         return cls._instance
 
+    def _generate_text(self, parts):
+        """Call Gemini through the response cache; identical concurrent prompts share one call."""
+        key = prompt_key(self.active_model_name, parts)
+        model = self.gemini_model
+        return self.response_cache.get_or_compute(
+            key, lambda: self.executor.run(lambda: model.generate_content(parts).text)
+        )
+
     def load_models(self):
         # Lazy load models
         if self.price_model:
             return
-
-        base_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-        model_path = os.path.join(base_dir, 'models', 'fair_price_model.joblib')
-        
-        if os.path.exists(model_path):
-            try:
-                self.price_model = joblib.load(model_path)
-                print("Loaded price model")
-            except Exception as e:
-                print(f"Failed to load price model: {e}")
+        if price_model.load():
+            self.price_model = price_model
 
     def estimate_price(self, make, model, year, specs, currency='JOD'):
         """Estimate car price based on make, model, year and specs."""
+        return self.estimate_prices([{'make': make, 'model': model, 'year': year, 'specs': specs}])[0]
+
+    def estimate_prices(self, cars):
+        """Estimate many cars in one model call. Falls back to heuristics per car."""
         self.load_models()
+        return price_model.estimate_batch(cars)
+
+    def _chat_prompt(self, message, history):
+        """Pick the system prompt (Arabic or English) and build the conversation context."""
+        # Detect if message is in Arabic
+        def is_arabic(text):
+            if not text:
+                return False
+            arabic_chars = sum(1 for c in text if '\u0600' <= c <= '\u06FF' or '\u0750' <= c <= '\u077F')
+            return arabic_chars > len(text) * 0.3
         
-        # Base prices by make category (in JOD)
-        luxury_makes = ['mercedes', 'bmw', 'audi', 'lexus', 'porsche', 'bentley', 'rolls-royce', 'maserati', 'jaguar', 'land rover', 'range rover']
-        premium_makes = ['volvo', 'infiniti', 'acura', 'lincoln', 'cadillac', 'genesis', 'alfa romeo']
-        standard_makes = ['toyota', 'honda', 'nissan', 'mazda', 'hyundai', 'kia', 'ford', 'chevrolet', 'volkswagen', 'subaru']
-        budget_makes = ['suzuki', 'mitsubishi', 'renault', 'peugeot', 'citroen', 'fiat', 'dacia']
-        
-        make_lower = (make or '').lower()
-        
-        # Determine base price range
-        if any(m in make_lower for m in luxury_makes):
-            base_price = 45000
-            variance = 0.35
-        elif any(m in make_lower for m in premium_makes):
-            base_price = 30000
-            variance = 0.30
-        elif any(m in make_lower for m in standard_makes):
-            base_price = 18000
-            variance = 0.25
-        elif any(m in make_lower for m in budget_makes):
-            base_price = 12000
-            variance = 0.20
-        else:
-            base_price = 20000
-            variance = 0.25
-        
-        # Adjust for year (depreciation)
-        current_year = 2026
-        if year:
-            age = current_year - int(year)
-            if age <= 0:
-                base_price *= 1.1  # New car premium
-            elif age <= 3:
-                base_price *= (1 - age * 0.08)  # 8% per year for first 3 years
-            elif age <= 7:
-                base_price *= (0.76 - (age - 3) * 0.05)  # 5% per year for years 4-7
-            else:
-                base_price *= max(0.3, 0.56 - (age - 7) * 0.03)  # 3% per year after, min 30%
-        
-        # Adjust for specs
-        if specs:
-            if specs.get('horsepower'):
-                hp = int(specs.get('horsepower', 0))
-                if hp > 300:
-                    base_price *= 1.15
-                elif hp > 200:
-                    base_price *= 1.05
-            
-            body_style = (specs.get('bodyStyle') or '').lower()
-            if body_style in ['suv', 'crossover']:
-                base_price *= 1.10
-            elif body_style in ['coupe', 'convertible']:
-                base_price *= 1.08
+        use_arabic = is_arabic(message) if message else False
         
-        # Calculate range
-        low_price = base_price * (1 - variance)
-        high_price = base_price * (1 + variance)
+        # Check history for Arabic as well
+        if not use_arabic and history:
+            for h in history[-3:]:
+                if is_arabic(h.get('text', '')):
+                    use_arabic = True
+                    break
         
-        return {
-            'value': round(base_price),
-            'low': round(low_price),
-            'high': round(high_price),
-            'currency': 'JOD'
-        }
-
-    def chat(self, message, history, image_base64=None):
-        if not self.gemini_model:
-            # Re-attempt initialization in case env was loaded after service init
-            self._init_gemini()
-            
-        if not self.gemini_model:
-            error = getattr(self, '_init_error', 'Unknown error')
-            if 'Invalid API key' in error:
-                return {'text': f"AI service error: Your Gemini API key is invalid. Please update it in the Render dashboard with a valid key from https://aistudio.google.com/app/apikey"}
-            return {'text': f"I am the IntelliWheels AI Assistant. The AI service is currently unavailable. Error: {error}"}
-
-        try:
-            # Detect if message is in Arabic
-            def is_arabic(text):
-                if not text:
-                    return False
-                arabic_chars = sum(1 for c in text if '\u0600' <= c <= '\u06FF' or '\u0750' <= c <= '\u077F')
-                return arabic_chars > len(text) * 0.3
-            
-            use_arabic = is_arabic(message) if message else False
-            
-            # Check history for Arabic as well
-            if not use_arabic and history:
-                for h in history[-3:]:
-                    if is_arabic(h.get('text', '')):
-                        use_arabic = True
-                        break
-            
-            # Build conversation context
-            if use_arabic:
-                system_prompt = """أنت مساعد إنتلي ويلز الذكي، مستشار سيارات خبير لسوق السيارات في الأردن.
+        # Build conversation context
+        if use_arabic:
+            system_prompt = """أنت مساعد إنتلي ويلز الذكي، مستشار سيارات خبير لسوق السيارات في الأردن.
 تساعد المستخدمين في:
 - البحث عن السيارات ومقارنتها
 - تقدير أسعار السوق العادلة
@@ -265,8 +302,8 @@ class AIService:
 - فخمة (BMW 7، مرسيدس S-Class): 30,000 - 80,000 دينار
 
 كن مفيداً وموجزاً وعلى دراية بالسيارات. أجب دائماً باللغة العربية."""
-            else:
-                system_prompt = """You are IntelliWheels AI Assistant, an expert automotive consultant for a car marketplace in Jordan. 
+        else:
+            system_prompt = """You are IntelliWheels AI Assistant, an expert automotive consultant for a car marketplace in Jordan. 
 You help users:
 - Find and compare cars
 - Estimate fair market prices
@@ -296,88 +333,179 @@ Price references for used cars in Jordan:
 
 Be helpful, concise, and knowledgeable about cars."""
 
-            # Build message content
-            contents = []
-            
-            # Add history context
-            if history:
-                history_text = "\\n".join([f"{'User' if h.get('role') == 'user' else 'Assistant'}: {h.get('text', '')}" for h in history[-5:]])
-                contents.append(f"Previous conversation:\\n{history_text}\\n\\n")
-            
-            # Add current message
-            if message:
-                contents.append(f"User: {message}")
+        # Build message content
+        contents = []
+        
+        # Add history context
+        if history:
+            history_text = "\\n".join([f"{'User' if h.get('role') == 'user' else 'Assistant'}: {h.get('text', '')}" for h in history[-5:]])
+            contents.append(f"Previous conversation:\\n{history_text}\\n\\n")
+        
+        # Add current message
+        if message:
+            contents.append(f"User: {message}")
+        return system_prompt, contents
+
+    def _chat_image_parts(self, system_prompt, contents, message, image_base64):
+        """Prompt parts for a chat turn that includes an image."""
+        image_part = prepare_image(image_base64)
+        
+        prompt_parts = [system_prompt]
+        if contents:
+            prompt_parts.append("\\n".join(contents))
+        if not message:
+            prompt_parts.append("Please analyze this car image and provide details about the vehicle:")
+        prompt_parts.append(image_part)
+        return prompt_parts
+
+    @staticmethod
+    def _extract_listing(response_text):
+        """Split a trailing ```json_listing``` block off the reply. Returns (text, listing_data)."""
+        listing_data = None
+        if '```json_listing' in response_text:
+            try:
+                match = LISTING_BLOCK_RE.search(response_text)
+                if match:
+                    listing_data = json.loads(match.group(1))
+                    # Remove the JSON block from the user-facing text
+                    response_text = response_text.replace(match.group(0), '').strip()
+            except Exception as e:
+                chat_log.warning("Failed to parse listing JSON: %s", e)
+        return response_text, listing_data
+
+    def _unavailable_chat_text(self):
+        error = getattr(self, '_init_error', 'Unknown error')
+        if 'Invalid API key' in error:
+            return f"AI service error: Your Gemini API key is invalid. Please update it in the Render dashboard with a valid key from https://aistudio.google.com/app/apikey"
+        return f"I am the IntelliWheels AI Assistant. The AI service is currently unavailable. Error: {error}"
+
+    @staticmethod
+    def _chat_error_text(e):
+        error_msg = str(e)
+        chat_log.error("Gemini API error: %s", error_msg)
+        # Provide clear error messages - prioritize API key errors
+        error_lower = error_msg.lower()
+        if any(x in error_lower for x in ['api_key', 'api key', 'invalid', 'authentication', '400', '401', '403']):
+            return "AI service error: The API key needs to be updated. Please contact support or update GEMINI_API_KEY in your environment."
+        elif 'blocked' in error_lower or 'safety' in error_lower:
+            return "I cannot process that request. Please rephrase your question."
+        elif 'quota' in error_lower or 'resource' in error_lower:
+            return "AI service temporarily unavailable. Please try again in a few minutes."
+        return f"I encountered an issue: {error_msg[:150]}"
+
+    def chat(self, message, history, image_base64=None):
+        # Waits for the background init, or re-attempts it in case env was loaded after service init
+        if not self.ensure_gemini():
+            return {'text': self._unavailable_chat_text()}
+
+        try:
+            system_prompt, contents = self._chat_prompt(message, history)
             
             # Handle image if provided
             if image_base64:
                 try:
-                    # Remove data URL prefix if present
-                    if ',' in image_base64:
-                        image_base64 = image_base64.split(',')[1]
-                    
-                    image_data = base64.b64decode(image_base64)
-                    image_part = {
-                        'mime_type': 'image/jpeg',
-                        'data': image_data
-                    }
-                    
-                    prompt_parts = [system_prompt]
-                    if contents:
-                        prompt_parts.append("\\n".join(contents))
-                    if not message:
-                        prompt_parts.append("Please analyze this car image and provide details about the vehicle:")
-                    prompt_parts.append(image_part)
-                    
-                    response_obj = self.gemini_model.generate_content(prompt_parts)
+                    prompt_parts = self._chat_image_parts(system_prompt, contents, message, image_base64)
+                    response_text = self._generate_text(prompt_parts)
+                except AIUnavailableError:
+                    raise
                 except Exception as e:
-                    print(f"Image processing error: {e}")
+                    chat_log.warning("Image processing error: %s", e)
                     # Fall back to text-only if image fails
                     if message:
-                        response_obj = self.gemini_model.generate_content([
+                        response_text = self._generate_text([
                             system_prompt,
                             "\\n".join(contents)
                         ])
                     else:
                         return {'text': f"I couldn't process that image. Error: {str(e)[:100]}"}
             else:
-                response_obj = self.gemini_model.generate_content([
+                response_text = self._generate_text([
                     system_prompt,
                     "\\n".join(contents)
                 ])
             
             # Parse response for listing intent
-            response_text = response_obj.text
-            listing_data = None
-            
-            if '```json_listing' in response_text:
-                try:
-                    import re
-                    match = re.search(r'```json_listing\s*({.*?})\s*```', response_text, re.DOTALL)
-                    if match:
-                        json_str = match.group(1)
-                        listing_data = json.loads(json_str)
-                        # Remove the JSON block from the user-facing text
-                        response_text = response_text.replace(match.group(0), '').strip()
-                except Exception as e:
-                    print(f"Failed to parse listing JSON: {e}")
+            response_text, listing_data = self._extract_listing(response_text)
 
             return {
                 'text': response_text,
                 'listing_data': listing_data
             }
             
+        except AIUnavailableError:
+            raise
         except Exception as e:
-            error_msg = str(e)
-            print(f"Gemini API error: {error_msg}")
-            # Provide clear error messages - prioritize API key errors
-            error_lower = error_msg.lower()
-            if any(x in error_lower for x in ['api_key', 'api key', 'invalid', 'authentication', '400', '401', '403']):
-                return {'text': "AI service error: The API key needs to be updated. Please contact support or update GEMINI_API_KEY in your environment."}
-            elif 'blocked' in error_lower or 'safety' in error_lower:
-                return {'text': "I cannot process that request. Please rephrase your question."}
-            elif 'quota' in error_lower or 'resource' in error_lower:
-                return {'text': "AI service temporarily unavailable. Please try again in a few minutes."}
-            return {'text': f"I encountered an issue: {error_msg[:150]}"}
+            return {'text': self._chat_error_text(e)}
+
+    def chat_stream(self, message, history, image_base64=None):
+        """
+        Streaming variant of chat(). Yields event dicts:
+          {'type': 'delta', 'text': ...}          visible text as it arrives
+          {'type': 'listing', 'listing_data': ...} parsed ```json_listing``` block, if any
+          {'type': 'done', 'text': ...}           full user-facing text
+          {'type': 'error', 'error': ...}         friendly error message
+        The json_listing block is held back from the deltas and only emitted as
+        the structured 'listing' event.
+        """
+        if not self.ensure_gemini():
+            yield {'type': 'error', 'error': self._unavailable_chat_text()}
+            return
+
+        try:
+            system_prompt, contents = self._chat_prompt(message, history)
+            if image_base64:
+                prompt_parts = self._chat_image_parts(system_prompt, contents, message, image_base64)
+            else:
+                prompt_parts = [system_prompt, "\\n".join(contents)]
+
+            key = prompt_key(self.active_model_name, prompt_parts)
+            cached = self.response_cache.peek(key)
+            if cached is not None:
+                chunks = [cached]
+            else:
+                model = self.gemini_model
+                chunks = self.executor.stream(
+                    lambda: (chunk.text for chunk in model.generate_content(prompt_parts, stream=True))
+                )
+
+            full_text = ''
+            emitted = 0
+            held = False
+            for chunk_text in chunks:
+                if not chunk_text:
+                    continue
+                full_text += chunk_text
+                if held:
+                    continue
+                marker_at = full_text.find(LISTING_MARKER, emitted)
+                if marker_at != -1:
+                    safe_end = marker_at
+                    held = True
+                else:
+                    # Keep back anything that could be the start of the marker
+                    safe_end = max(emitted, len(full_text) - len(LISTING_MARKER) + 1)
+                if safe_end > emitted:
+                    yield {'type': 'delta', 'text': full_text[emitted:safe_end]}
+                    emitted = safe_end
+
+            if cached is None:
+                self.response_cache.put(key, full_text)
+
+            response_text, listing_data = self._extract_listing(full_text)
+            if not held and emitted < len(full_text):
+                yield {'type': 'delta', 'text': full_text[emitted:]}
+            elif held and listing_data is None:
+                # Marker seen but block unparseable - show the rest as plain text
+                yield {'type': 'delta', 'text': full_text[emitted:]}
+            if listing_data is not None:
+                yield {'type': 'listing', 'listing_data': listing_data}
+            yield {'type': 'done', 'text': response_text}
+        except AIUnavailableError as e:
+            yield {'type': 'error', 'error': str(e), 'retry_after': e.retry_after}
+        except ImageRejectedError as e:
+            yield {'type': 'error', 'error': f"I couldn't process that image. {e}"}
+        except Exception as e:
+            yield {'type': 'error', 'error': self._chat_error_text(e)}
 
     def semantic_search(self, query, limit):
         """Search cars using semantic scoring - always returns results ranked by relevance."""
@@ -386,12 +514,11 @@ Be helpful, concise, and knowledgeable about cars."""
         
         try:
             db = get_db()
-            print(f"[Semantic Search] Using shared DB connection")
             
             # Get ALL cars from database to score them
             cursor = db.execute("SELECT id, make, model, year, price, currency, image_url, specs FROM cars")
             all_cars = cursor.fetchall()
-            print(f"[Semantic Search] Total cars in DB: {len(all_cars)}")
+            search_log.debug("Total cars in DB: %d", len(all_cars))
             
             if not all_cars:
                 return []
@@ -512,7 +639,7 @@ Be helpful, concise, and knowledgeable about cars."""
             
             # Take top results
             top_results = scored_cars[:limit]
-            print(f"[Semantic Search] Returning {len(top_results)} results (top score: {top_results[0][0] if top_results else 0})")
+            search_log.debug("Returning %d results (top score: %s)", len(top_results), top_results[0][0] if top_results else 0)
             
             # Format results
             results = []
@@ -543,20 +670,16 @@ Be helpful, concise, and knowledgeable about cars."""
                     "score": score
                 })
             
-            print(f"[Semantic Search] Results: {[(r['car']['make'], r['car']['model'], r['score']) for r in results]}")
+            if search_log.isEnabledFor(logging.DEBUG):
+                search_log.debug("Results: %s", [(r['car']['make'], r['car']['model'], r['score']) for r in results])
             return results
             
         except Exception as e:
-            import traceback
-            print(f"[Semantic Search] ERROR: {e}")
-            traceback.print_exc()
+            search_log.exception("Search failed: %s", e)
             return []
 
     def analyze_image(self, image_base64):
-        if not self.gemini_model:
-            self._init_gemini()
-            
-        if not self.gemini_model:
+        if not self.ensure_gemini():
             error = getattr(self, '_init_error', 'AI service unavailable')
             return {
                 "make": "",
@@ -569,15 +692,8 @@ Be helpful, concise, and knowledgeable about cars."""
             }
 
         try:
-            # Remove data URL prefix if present
-            if ',' in image_base64:
-                image_base64 = image_base64.split(',')[1]
-            
-            image_data = base64.b64decode(image_base64)
-            image_part = {
-                'mime_type': 'image/jpeg',
-                'data': image_data
-            }
+            # Decode, downscale and strip metadata before the upload to Gemini
+            image_part = prepare_image(image_base64)
             
             prompt = """Analyze this car image and provide the following information in JSON format:
 {
@@ -601,10 +717,8 @@ PRICE GUIDE for used cars in Jordan (JOD):
 
 Only respond with the JSON, no other text."""
 
-            response = self.gemini_model.generate_content([prompt, image_part])
-            
             # Parse JSON from response
-            response_text = response.text.strip()
+            response_text = self._generate_text([prompt, image_part]).strip()
             # Remove markdown code blocks if present
             if response_text.startswith('```'):
                 response_text = response_text.split('```')[1]
@@ -616,6 +730,18 @@ Only respond with the JSON, no other text."""
             result['error'] = False
             return result
             
+        except AIUnavailableError:
+            raise
+        except ImageRejectedError as e:
+            return {
+                "make": "",
+                "model": "",
+                "year": None,
+                "bodyStyle": "",
+                "estimatedPrice": None,
+                "conditionDescription": f"{e}. Please upload a JPEG, PNG or WebP photo.",
+                "error": True
+            }
         except json.JSONDecodeError as e:
             print(f"Vision JSON parse error: {e}, response was: {response_text[:200] if 'response_text' in dir() else 'N/A'}")
             return {
@@ -651,10 +777,7 @@ Only respond with the JSON, no other text."""
             }
 
     def listing_assistant(self, query, history):
-        if not self.gemini_model:
-            self._init_gemini()
-            
-        if not self.gemini_model:
+        if not self.ensure_gemini():
             return {
                 "success": True,
                 "response": "I can help you draft a listing, but the AI service is currently unavailable.",
@@ -722,12 +845,12 @@ If you need more information, just respond normally without the listing_data."""
             if history:
                 history_text = "\n".join([f"{'User' if h.get('role') == 'user' else 'Assistant'}: {h.get('text', '')}" for h in history[-5:]])
             
-            response = self.gemini_model.generate_content([
+            raw_text = self._generate_text([
                 system_prompt,
                 f"Conversation history:\n{history_text}\n\nUser: {query}"
             ])
             
-            response_text = response.text.strip()
+            response_text = raw_text.strip()
             
             # Try to parse as JSON
             try:
@@ -746,11 +869,13 @@ If you need more information, just respond normally without the listing_data."""
             except json.JSONDecodeError:
                 return {
                     "success": True,
-                    "response": response.text,
+                    "response": raw_text,
                     "action_type": None,
                     "listing_data": None
                 }
                 
+        except AIUnavailableError:
+            raise
         except Exception as e:
             print(f"Listing assistant error: {e}")
             error_msg = str(e)
@@ -0,0 +1,236 @@
+"""
+In-memory make -> model -> engine/trim catalog.
+
+The listing form calls ``/api/makes``, ``/api/models`` and ``/api/engines`` on
+every render. Instead of running ``SELECT DISTINCT`` over the whole cars table
+each time, the catalog is built once at startup, kept current by the car write
+handlers in this worker, and rebuilt in the background every
+``CATALOG_REFRESH_SECONDS`` to pick up writes made by other workers.
+"""
+
+import os
+import json
+import time
+import bisect
+import threading
+from collections import Counter
+
+from ..db import get_db
+
+CATALOG_REFRESH_SECONDS = int(os.environ.get('CATALOG_REFRESH_SECONDS', '300'))
+
+
+def _engine_of(specs):
+    """Pull the engine name out of a specs dict or JSON string."""
+    if not specs:
+        return None
+    if isinstance(specs, str):
+        try:
+            specs = json.loads(specs)
+        except (TypeError, ValueError):
+            return None
+    if not isinstance(specs, dict):
+        return None
+    engine = specs.get('engine')
+    return str(engine).strip() if engine not in (None, '') else None
+
+
+def _key(value):
+    return (value or '').strip().lower()
+
+
+class CatalogIndex:
+    def __init__(self, refresh_seconds=CATALOG_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._makes = {}
+        self._terms = []
+        self._terms_dirty = True
+        self._lock = threading.RLock()
+        self._app = None
+        self._built_at = 0.0
+        self._refreshing = False
+
+    def init_app(self, app):
+        self._app = app
+        app.extensions['catalog_index'] = self
+        self.rebuild()
+
+    # ------------------------------------------------------------------
+    # Building and incremental updates
+    # ------------------------------------------------------------------
+
+    def rebuild(self):
+        """Rebuild the whole catalog from the cars table."""
+        if self._app is None:
+            return
+        makes = {}
+        try:
+            with self._app.app_context():
+                db = get_db()
+                rows = db.execute('SELECT make, model, specs, trim FROM cars').fetchall()
+                for row in rows:
+                    self._add(makes, row['make'], row['model'], _engine_of(row['specs']), row['trim'])
+        except Exception as e:
+            print(f"[Catalog] Rebuild failed, keeping previous catalog: {e}")
+            return
+        with self._lock:
+            self._makes = makes
+            self._terms_dirty = True
+            self._built_at = time.monotonic()
+
+    def _maybe_refresh(self):
+        """Kick off a background rebuild once the catalog is older than the refresh window."""
+        if self._app is None or self._refreshing:
+            return
+        if time.monotonic() - self._built_at < self.refresh_seconds:
+            return
+        self._refreshing = True
+
+        def run():
+            try:
+                self.rebuild()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name='catalog-refresh', daemon=True).start()
+
+    @staticmethod
+    def _add(makes, make, model, engine, trim):
+        make_key, model_key = _key(make), _key(model)
+        if not make_key or not model_key:
+            return
+        make_entry = makes.setdefault(make_key, {'name': make.strip(), 'count': 0, 'models': {}})
+        make_entry['count'] += 1
+        model_entry = make_entry['models'].setdefault(
+            model_key, {'name': model.strip(), 'count': 0, 'engines': Counter(), 'trims': Counter()}
+        )
+        model_entry['count'] += 1
+        if engine:
+            model_entry['engines'][engine] += 1
+        if trim:
+            model_entry['trims'][trim.strip()] += 1
+
+    def add_car(self, make, model, specs=None, trim=None):
+        with self._lock:
+            self._add(self._makes, make, model, _engine_of(specs), trim)
+            self._terms_dirty = True
+
+    def remove_car(self, make, model, specs=None, trim=None):
+        make_key, model_key = _key(make), _key(model)
+        engine = _engine_of(specs)
+        with self._lock:
+            make_entry = self._makes.get(make_key)
+            if not make_entry or model_key not in make_entry['models']:
+                return
+            model_entry = make_entry['models'][model_key]
+            if engine:
+                model_entry['engines'][engine] -= 1
+                if model_entry['engines'][engine] <= 0:
+                    del model_entry['engines'][engine]
+            if trim:
+                model_entry['trims'][trim.strip()] -= 1
+                if model_entry['trims'][trim.strip()] <= 0:
+                    del model_entry['trims'][trim.strip()]
+            model_entry['count'] -= 1
+            if model_entry['count'] <= 0:
+                del make_entry['models'][model_key]
+            make_entry['count'] -= 1
+            if make_entry['count'] <= 0:
+                del self._makes[make_key]
+            self._terms_dirty = True
+
+    def add_row(self, row):
+        self.add_car(row['make'], row['model'], row['specs'], row['trim'])
+
+    def remove_row(self, row):
+        self.remove_car(row['make'], row['model'], row['specs'], row['trim'])
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+
+    def makes(self):
+        self._maybe_refresh()
+        with self._lock:
+            return sorted(entry['name'] for entry in self._makes.values())
+
+    def models(self, make):
+        self._maybe_refresh()
+        with self._lock:
+            entry = self._makes.get(_key(make))
+            if not entry:
+                return []
+            return sorted(m['name'] for m in entry['models'].values())
+
+    def models_by_make(self):
+        self._maybe_refresh()
+        with self._lock:
+            return {
+                entry['name']: sorted(m['name'] for m in entry['models'].values())
+                for entry in sorted(self._makes.values(), key=lambda e: e['name'])
+            }
+
+    def _model_entry(self, make, model):
+        entry = self._makes.get(_key(make))
+        if not entry:
+            return None
+        return entry['models'].get(_key(model))
+
+    def engines(self, make, model):
+        self._maybe_refresh()
+        with self._lock:
+            entry = self._model_entry(make, model)
+            return sorted(entry['engines']) if entry else []
+
+    def trims(self, make, model):
+        self._maybe_refresh()
+        with self._lock:
+            entry = self._model_entry(make, model)
+            return sorted(entry['trims']) if entry else []
+
+    def _build_terms(self):
+        terms = []
+        for make_key, make_entry in self._makes.items():
+            # '' marks the make itself; unlike None it sorts against a model key
+            # when a model is named like its make (Mini Mini)
+            terms.append((make_key, make_key, ''))
+            for model_key in make_entry['models']:
+                terms.append((model_key, make_key, model_key))
+                terms.append((f"{make_key} {model_key}", make_key, model_key))
+        terms.sort()
+        self._terms = terms
+        self._terms_dirty = False
+
+    def autocomplete(self, prefix, limit=10):
+        """Return make and make/model suggestions whose name starts with ``prefix``."""
+        prefix = _key(prefix)
+        if not prefix:
+            return []
+        self._maybe_refresh()
+        with self._lock:
+            if self._terms_dirty:
+                self._build_terms()
+            suggestions = []
+            seen = set()
+            start = bisect.bisect_left(self._terms, (prefix,))
+            for term, make_key, model_key in self._terms[start:]:
+                if not term.startswith(prefix) or len(suggestions) >= limit:
+                    break
+                if (make_key, model_key) in seen:
+                    continue
+                seen.add((make_key, model_key))
+                make_entry = self._makes[make_key]
+                if not model_key:
+                    suggestions.append({'type': 'make', 'make': make_entry['name'], 'count': make_entry['count']})
+                else:
+                    model_entry = make_entry['models'][model_key]
+                    suggestions.append({
+                        'type': 'model',
+                        'make': make_entry['name'],
+                        'model': model_entry['name'],
+                        'count': model_entry['count'],
+                    })
+            return suggestions
+
+
+catalog_index = CatalogIndex()
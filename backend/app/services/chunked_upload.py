@@ -0,0 +1,211 @@
+"""
+Resumable chunked uploads for large videos.
+
+A client opens a session with the file name and total size, then sends the
+file as raw request bodies of at most ``UPLOAD_CHUNK_MAX`` bytes, each tagged
+with the byte offset it starts at. Every chunk is streamed from the request
+straight onto the end of a ``.part`` file, so a worker holds one small
+buffer rather than the whole video, and the connection only lives as long as
+one chunk. After a dropped connection the client asks for the current offset
+and carries on from there.
+
+Finalizing hashes the ``.part`` file once and renames it to its content name
+in the upload folder (see services/media_store.py). It sits in the same
+directory tree, so no bytes are copied. Session state is kept next to the
+data (``<id>.json``) and the offset is just the ``.part`` file's size. That
+means any gunicorn worker can take the next chunk. Sessions untouched
+for ``UPLOAD_SESSION_TTL`` seconds are removed.
+
+Appending and finalizing hold an exclusive lock on the session: ``flock`` on
+the ``.part`` file, shared by every worker process on the host. The offset
+check, the write and the size it leaves behind are one step, so a chunk
+retried while the first copy is still streaming gets a 409 instead of writing
+over it.
+"""
+
+import os
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+UPLOAD_CHUNK_MAX = int(os.environ.get('UPLOAD_CHUNK_MAX', str(16 * 1024 * 1024)))
+UPLOAD_SESSION_TTL = float(os.environ.get('UPLOAD_SESSION_TTL', str(24 * 3600)))
+COPY_BUFFER = 1024 * 1024
+
+PARTIAL_DIR = '.partial'
+
+# Per-session locks where flock is unavailable (single process only)
+_session_locks = {}
+_session_locks_guard = threading.Lock()
+
+
+class UploadSessionError(Exception):
+    """Rejected session operation; ``status`` is the HTTP code to answer with."""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class ChunkedUploads:
+    def __init__(self, upload_dir):
+        self.upload_dir = upload_dir
+        self.partial_dir = os.path.join(upload_dir, PARTIAL_DIR)
+
+    def _paths(self, upload_id):
+        # Ids are uuid4 hex; anything else could escape the directory
+        if not upload_id or len(upload_id) != 32 or not upload_id.isalnum():
+            raise UploadSessionError('Upload session not found', 404)
+        base = os.path.join(self.partial_dir, upload_id)
+        return base + '.part', base + '.json'
+
+    def _load(self, upload_id):
+        part_path, meta_path = self._paths(upload_id)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            raise UploadSessionError('Upload session not found', 404)
+        meta['offset'] = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        return meta
+
+    @contextmanager
+    def _locked(self, upload_id):
+        """Hold the session's lock; a second writer gets a 409 instead of waiting."""
+        part_path, _ = self._paths(upload_id)
+        busy = UploadSessionError('Another request is writing to this upload; check its offset and retry', 409)
+        if not HAS_FCNTL:
+            with _session_locks_guard:
+                lock = _session_locks.setdefault(upload_id, threading.Lock())
+            if not lock.acquire(blocking=False):
+                raise busy
+            try:
+                yield
+            finally:
+                lock.release()
+            return
+        try:
+            handle = open(part_path, 'r+b')
+        except OSError:
+            raise UploadSessionError('Upload session not found', 404)
+        with handle:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                raise busy
+            yield
+
+    def create(self, ext, size):
+        os.makedirs(self.partial_dir, exist_ok=True)
+        self.prune()
+        upload_id = uuid.uuid4().hex
+        part_path, meta_path = self._paths(upload_id)
+        meta = {
+            'id': upload_id,
+            'ext': ext,
+            'size': size,
+            'created_at': time.time(),
+        }
+        open(part_path, 'wb').close()
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f)
+        meta['offset'] = 0
+        return meta
+
+    def status(self, upload_id):
+        return self._load(upload_id)
+
+    def append(self, upload_id, offset, stream, length):
+        """
+        Write ``length`` bytes from ``stream`` at ``offset``. The offset must be
+        the current end of the file. A retried chunk that was already stored
+        gets a 409 carrying the real offset, so the client can skip ahead.
+        """
+        with self._locked(upload_id):
+            meta = self._load(upload_id)
+            if offset != meta['offset']:
+                raise UploadSessionError('Offset does not match the stored size', 409, meta['offset'])
+            if length is None:
+                raise UploadSessionError('Content-Length is required', 411)
+            if length > UPLOAD_CHUNK_MAX:
+                raise UploadSessionError(f'Chunk too large. Maximum is {UPLOAD_CHUNK_MAX // (1024 * 1024)}MB', 413)
+            if offset + length > meta['size']:
+                raise UploadSessionError('Chunk runs past the declared file size', 400, meta['offset'])
+
+            part_path, _ = self._paths(upload_id)
+            written = 0
+            with open(part_path, 'r+b') as f:
+                f.seek(offset)
+                while written < length:
+                    block = stream.read(min(COPY_BUFFER, length - written))
+                    if not block:
+                        break
+                    f.write(block)
+                    written += len(block)
+                # A short body (client went away) leaves no half-written tail behind
+                if written < length:
+                    f.truncate(offset)
+                    raise UploadSessionError('Chunk body ended early', 400, offset)
+            meta['offset'] = offset + written
+            return meta
+
+    def finalize(self, upload_id, store):
+        """
+        Hand the completed file to ``store(path, ext)``, which moves it into
+        storage, and close the session. Returns what ``store`` returns.
+        """
+        with self._locked(upload_id):
+            meta = self._load(upload_id)
+            if meta['offset'] != meta['size']:
+                raise UploadSessionError('Upload is incomplete', 409, meta['offset'])
+            part_path, meta_path = self._paths(upload_id)
+            result = store(part_path, meta['ext'])
+            os.remove(meta_path)
+        with _session_locks_guard:
+            _session_locks.pop(upload_id, None)
+        return result
+
+    def abort(self, upload_id):
+        self._load(upload_id)
+        for path in self._paths(upload_id):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        with _session_locks_guard:
+            _session_locks.pop(upload_id, None)
+
+    def prune(self):
+        """Delete sessions with no writes for ``UPLOAD_SESSION_TTL`` seconds."""
+        cutoff = time.time() - UPLOAD_SESSION_TTL
+        try:
+            names = os.listdir(self.partial_dir)
+        except OSError:
+            return 0
+        removed = 0
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            try:
+                part_path, meta_path = self._paths(name[:-5])
+                # The .part file's mtime moves with every chunk
+                last_write = os.path.getmtime(part_path if os.path.exists(part_path) else meta_path)
+            except (OSError, UploadSessionError):
+                continue
+            if last_write < cutoff:
+                for path in (part_path, meta_path):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                removed += 1
+        return removed
@@ -0,0 +1,254 @@
+"""
+Precomputed fair-price annotations for listings.
+
+Catalog cards show a "good deal / overpriced" badge, so every listing carries
+``fair_price``, ``fair_low``, ``fair_high`` and ``deal_score`` columns. A
+background thread prices the cars that need it in batches of
+``DEAL_SCORE_BATCH`` with one model call each: new listings and edited
+listings (``price_scored_at`` is cleared on update), and every listing after
+the price model changes (``fair_price_version``). It runs every
+``DEAL_SCORE_INTERVAL`` seconds and right after a car is created or edited.
+
+Writes are compare-and-set: a car edited while its batch was being priced
+keeps its cleared ``price_scored_at`` and is scored again on the next pass.
+A car that cannot be scored is written with a NULL score, so one bad row
+does not fail its batch on every run.
+
+deal_score = (fair_price - price) / fair_price, clamped to [-1, 1]. A positive
+score means the listing is cheaper than the model's fair price.
+"""
+
+import os
+import json
+import tempfile
+import threading
+
+from ..db import get_db
+from ..log import get_logger
+from .price_model import price_model, JOD_RATES
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+DEAL_SCORE_INTERVAL = int(os.environ.get('DEAL_SCORE_INTERVAL', '300'))
+DEAL_SCORE_BATCH = int(os.environ.get('DEAL_SCORE_BATCH', '500'))
+# Only one worker per host scores at a time; the others skip the round
+DEAL_SCORE_LOCK_PATH = os.environ.get(
+    'DEAL_SCORE_LOCK_PATH', os.path.join(tempfile.gettempdir(), 'intelliwheels_deal_scorer.lock')
+)
+
+log = get_logger('Deals')
+
+# (minimum score, label), checked in order
+DEAL_RATINGS = [
+    (0.15, 'great'),
+    (0.05, 'good'),
+    (-0.05, 'fair'),
+    (-0.15, 'high'),
+]
+
+SELECT_DIRTY_SQL = '''
+    SELECT id, make, model, year, price, currency, specs, updated_at FROM cars
+    WHERE id > ? AND (price_scored_at IS NULL OR fair_price_version IS NULL OR fair_price_version <> ?)
+    ORDER BY id LIMIT ?
+'''
+
+# Only written if the car is still unscored and unchanged since it was read
+UPDATE_SQL = '''
+    UPDATE cars SET fair_price = ?, fair_low = ?, fair_high = ?, deal_score = ?,
+        fair_price_version = ?, price_scored_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+        AND (price = ? OR (price IS NULL AND ? IS NULL))
+        AND (updated_at = ? OR (updated_at IS NULL AND ? IS NULL))
+        AND (price_scored_at IS NULL OR fair_price_version IS NULL OR fair_price_version <> ?)
+'''
+
+
+def deal_rating(score):
+    """Badge label for a deal score, or None if the car has not been scored."""
+    if score is None:
+        return None
+    for threshold, label in DEAL_RATINGS:
+        if score >= threshold:
+            return label
+    return 'overpriced'
+
+
+def _parse_specs(raw):
+    if isinstance(raw, dict):
+        return raw
+    if not raw:
+        return {}
+    try:
+        specs = json.loads(raw)
+    except (TypeError, ValueError):
+        return {}
+    return specs if isinstance(specs, dict) else {}
+
+
+def _update_params(row, values, version):
+    price, updated_at = row['price'], row['updated_at']
+    return (*values, version, row['id'], price, price, updated_at, updated_at, version)
+
+
+def score_rows(rows, version):
+    """Parameters for UPDATE_SQL, one tuple per row, from a single batched estimate."""
+    cars = [{
+        'make': row['make'],
+        'model': row['model'],
+        'year': row['year'],
+        'specs': _parse_specs(row['specs']),
+    } for row in rows]
+    estimates = price_model.estimate_batch(cars)
+
+    params = []
+    for row, estimate in zip(rows, estimates):
+        rate = JOD_RATES.get((row['currency'] or 'JOD').upper())
+        price = row['price']
+        if not rate or not price or price <= 0:
+            # Nothing to compare against; mark it scored so it is not picked up again
+            params.append(_update_params(row, (None, None, None, None), version))
+            continue
+        # Estimates are in JOD; store them in the listing's own currency
+        fair = estimate['value'] / rate
+        low = estimate['low'] / rate
+        high = estimate['high'] / rate
+        score = max(-1.0, min(1.0, (fair - price) / fair)) if fair > 0 else None
+        params.append(_update_params(row, (round(fair, 2), round(low, 2), round(high, 2),
+                                           round(score, 4) if score is not None else None), version))
+    return params
+
+
+class DealScorer:
+    def __init__(self, interval=DEAL_SCORE_INTERVAL, batch_size=DEAL_SCORE_BATCH):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._wake = threading.Event()
+        self._run_lock = threading.Lock()
+        self._app = None
+        self._thread = None
+        self._pid = None
+        self.last_run_scored = 0
+
+    def init_app(self, app):
+        self._app = app
+        app.extensions['deal_scorer'] = self
+        if self.interval > 0:
+            self._ensure_worker()
+
+    def _ensure_worker(self):
+        """Start the scoring thread, and again after a fork (gunicorn workers)."""
+        pid = os.getpid()
+        if self._thread is not None and self._thread.is_alive() and self._pid == pid:
+            return
+        self._pid = pid
+        self._thread = threading.Thread(target=self._run, name='deal-scorer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            self.run_once()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def notify(self):
+        """A listing changed; score it soon instead of at the next interval."""
+        if self._app is None or self.interval <= 0:
+            return
+        self._ensure_worker()
+        self._wake.set()
+
+    def _host_lock(self):
+        if not HAS_FCNTL:
+            return None
+        try:
+            handle = open(DEAL_SCORE_LOCK_PATH, 'a')
+        except OSError:
+            return None
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            raise
+        return handle
+
+    def run_once(self):
+        """Score every car that needs it. Returns the number of cars written."""
+        if self._app is None or not self._run_lock.acquire(blocking=False):
+            return 0
+        try:
+            try:
+                lock_handle = self._host_lock()
+            except OSError:
+                return 0  # another worker on this host is scoring
+            try:
+                return self._score_pending()
+            finally:
+                if lock_handle is not None:
+                    lock_handle.close()
+        finally:
+            self._run_lock.release()
+
+    def _score_pending(self):
+        scored = 0
+        version = price_model.version
+        last_id = 0
+        with self._app.app_context():
+            db = get_db()
+            try:
+                while True:
+                    rows = db.execute(SELECT_DIRTY_SQL, (last_id, version, self.batch_size)).fetchall()
+                    if not rows:
+                        break
+                    try:
+                        db.executemany(UPDATE_SQL, score_rows(rows, version))
+                        db.commit()
+                    except Exception as e:
+                        log.warning('Batch after car %s failed (%s); scoring it row by row', last_id, e)
+                        db.rollback()
+                        scored += self._score_rows_one_by_one(db, rows, version)
+                    else:
+                        scored += len(rows)
+                    last_id = rows[-1]['id']
+            except Exception as e:
+                log.exception('Scoring failed after %d cars: %s', scored, e)
+                try:
+                    db.rollback()
+                except:
+                    pass
+        if scored:
+            log.info('Scored %d cars with price model %s', scored, version)
+        self.last_run_scored = scored
+        return scored
+
+    def _score_rows_one_by_one(self, db, rows, version):
+        """Score each row on its own; a row that still fails gets a NULL score.
+
+        A row whose NULL score cannot be written either is skipped (and picked
+        up again next pass), so it cannot abort the rest of the batch.
+        Returns the number of rows written.
+        """
+        written = 0
+        for row in rows:
+            try:
+                db.executemany(UPDATE_SQL, score_rows([row], version))
+                db.commit()
+                written += 1
+                continue
+            except Exception as e:
+                log.warning('Could not score car %s: %s', row['id'], e)
+                db.rollback()
+            try:
+                db.execute(UPDATE_SQL, _update_params(row, (None, None, None, None), version))
+                db.commit()
+                written += 1
+            except Exception as e:
+                log.warning('Skipping car %s, could not write its NULL score: %s', row['id'], e)
+                db.rollback()
+        return written
+
+
+deal_scorer = DealScorer()
@@ -0,0 +1,136 @@
+"""
+Image pre-processing for vision calls.
+
+``/api/vision-helper`` and ``/api/chatbot`` accept up to 10MB of base64. Before
+an image goes to Gemini it is decoded once, checked against a pixel budget
+(decompression bombs are rejected before the full decode), downscaled to
+``VISION_MAX_EDGE``, auto-rotated, re-encoded as JPEG at ``VISION_JPEG_QUALITY``
+and stripped of EXIF. The work runs on a small thread pool (Pillow releases
+the GIL while decoding and resampling) with a deadline.
+"""
+
+import os
+import io
+import base64
+import binascii
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from ..lazy_imports import lazy_import
+
+# Pillow is imported on the first image, not at startup
+Image = lazy_import('PIL.Image', probe='PIL')
+ImageOps = lazy_import('PIL.ImageOps', probe='PIL')
+HAS_PIL = Image is not None
+
+VISION_MAX_EDGE = int(os.environ.get('VISION_MAX_EDGE', '1536'))
+VISION_JPEG_QUALITY = int(os.environ.get('VISION_JPEG_QUALITY', '85'))
+VISION_MAX_PIXELS = int(os.environ.get('VISION_MAX_PIXELS', str(40_000_000)))
+IMAGE_PREP_WORKERS = int(os.environ.get('IMAGE_PREP_WORKERS', '2'))
+IMAGE_PREP_TIMEOUT = float(os.environ.get('IMAGE_PREP_TIMEOUT', '15'))
+
+# Magic bytes -> MIME type, used when Pillow is not installed
+_SIGNATURES = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+]
+
+_pool = None
+_pool_pid = None
+
+
+class ImageRejectedError(ValueError):
+    """The uploaded image is not a usable picture (bad encoding, unknown format, too many pixels)."""
+
+
+def sniff_mime_type(data):
+    for signature, mime_type in _SIGNATURES:
+        if data.startswith(signature):
+            return mime_type
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    if data[4:12] in (b'ftypheic', b'ftypheix', b'ftypmif1'):
+        return 'image/heif'
+    return None
+
+
+def decode_base64_image(image_base64):
+    """Strip an optional data-URL prefix and decode the payload."""
+    if ',' in image_base64:
+        image_base64 = image_base64.split(',', 1)[1]
+    try:
+        return base64.b64decode(image_base64, validate=False)
+    except (binascii.Error, ValueError):
+        raise ImageRejectedError('Image is not valid base64')
+
+
+def flatten_to_rgb(img):
+    """RGB/L image for JPEG output; transparency is composited onto white."""
+    if img.mode in ('RGB', 'L'):
+        return img
+    background = Image.new('RGB', img.size, (255, 255, 255))
+    rgba = img.convert('RGBA')
+    background.paste(rgba, mask=rgba.split()[-1])
+    return background
+
+
+def _process(data, max_edge, quality):
+    if not HAS_PIL:
+        mime_type = sniff_mime_type(data)
+        if not mime_type:
+            raise ImageRejectedError('Unsupported image format')
+        return {'mime_type': mime_type, 'data': data}
+
+    try:
+        img = Image.open(io.BytesIO(data))
+    except Image.DecompressionBombError:
+        raise ImageRejectedError('Image is too large')
+    except Exception:
+        raise ImageRejectedError('Unsupported image format')
+
+    # The header is parsed lazily, so this check runs before any pixel is decoded
+    width, height = img.size
+    source_format = img.format
+    if width * height > VISION_MAX_PIXELS:
+        raise ImageRejectedError(f'Image is too large ({width}x{height} pixels)')
+
+    try:
+        if source_format == 'JPEG':
+            # Let libjpeg decode at a reduced scale instead of full size
+            img.draft('RGB', (max_edge, max_edge))
+        img = flatten_to_rgb(ImageOps.exif_transpose(img))
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        out = io.BytesIO()
+        # No exif= argument, so metadata (GPS, camera serials) is dropped
+        img.save(out, format='JPEG', quality=quality, optimize=True)
+    except ImageRejectedError:
+        raise
+    except Exception as e:
+        raise ImageRejectedError(f'Could not process image: {str(e)[:100]}')
+
+    # Always the re-encoded bytes, even when the original is smaller: it may carry EXIF/GPS
+    return {'mime_type': 'image/jpeg', 'data': out.getvalue()}
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = ThreadPoolExecutor(max_workers=IMAGE_PREP_WORKERS, thread_name_prefix='image-prep')
+        _pool_pid = os.getpid()
+    return _pool
+
+
+def prepare_image(image_base64, max_edge=VISION_MAX_EDGE, quality=VISION_JPEG_QUALITY):
+    """
+    Decode, validate and shrink a base64 image for a vision call.
+    Returns a Gemini inline part: {'mime_type': ..., 'data': bytes}.
+    Raises ImageRejectedError for anything that is not a usable picture.
+    """
+    data = decode_base64_image(image_base64)
+    if not data:
+        raise ImageRejectedError('Image is empty')
+    future = _get_pool().submit(_process, data, max_edge, quality)
+    try:
+        return future.result(timeout=IMAGE_PREP_TIMEOUT)
+    except FutureTimeout:
+        raise ImageRejectedError('Image took too long to process')
@@ -0,0 +1,189 @@
+"""
+Responsive variants of uploaded listing photos.
+
+Catalog grids only need a few hundred pixels per card, but local uploads are
+stored at full camera resolution. After an image is uploaded (and is staying
+local, since Cloudinary resizes on the fly), an ``image_variants`` job renders
+``thumb``, ``card`` and ``full`` sizes in WebP and JPEG. The Pillow work runs
+on a small thread pool (``IMAGE_VARIANT_WORKERS``); Pillow releases the GIL
+while it decodes, resizes and encodes, so large photos do not stall request
+threads, and no worker process has to be forked from a threaded server.
+
+Each variant is stored under its content hash (``uploads/variants/ab/<hash>.webp``).
+The same bytes are written once however many listings use them, and every
+URL is immutable. The variant map is saved in ``media_uploads.variants`` and
+copied onto ``cars.image_variants`` for listings whose main image is that
+upload, so ``car_row_to_dict`` can build ``srcset`` strings without a query.
+"""
+
+import io
+import os
+import re
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from ..db import get_db
+from ..log import get_logger
+from .image_processing import Image, ImageOps, HAS_PIL, VISION_MAX_PIXELS, flatten_to_rgb
+from .job_queue import job_queue
+
+IMAGE_VARIANT_WORKERS = int(os.environ.get('IMAGE_VARIANT_WORKERS', '2'))
+IMAGE_VARIANT_TIMEOUT = float(os.environ.get('IMAGE_VARIANT_TIMEOUT', '120'))
+IMAGE_VARIANT_QUALITY = int(os.environ.get('IMAGE_VARIANT_QUALITY', '80'))
+
+# name -> longest edge in pixels, largest first
+VARIANT_SIZES = (('full', 1600), ('card', 640), ('thumb', 320))
+# format -> (Pillow format, file extension, save options)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', 'webp', {'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'optimize': True, 'progressive': True}),
+}
+VARIANT_DIR = 'variants'
+
+log = get_logger('Variants')
+
+UPLOAD_URL = re.compile(r'/api/uploads/images/([0-9a-f]{32}\.[a-z0-9]+)$')
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def render_variants(source_path, out_dir, quality=IMAGE_VARIANT_QUALITY):
+    """
+    Decode ``source_path`` once and write every size/format under ``out_dir``.
+    Returns {size: {'width', 'height', fmt: relative path}}. Runs on a pool thread.
+    """
+    with Image.open(source_path) as img:
+        width, height = img.size
+        if width * height > VISION_MAX_PIXELS:
+            raise ValueError(f'Image is too large ({width}x{height} pixels)')
+        largest = VARIANT_SIZES[0][1]
+        if img.format == 'JPEG':
+            img.draft('RGB', (largest, largest))
+        current = flatten_to_rgb(ImageOps.exif_transpose(img))
+
+    variants = {}
+    for name, edge in VARIANT_SIZES:
+        # Each size is scaled down from the previous one, not from the original
+        if max(current.size) > edge:
+            current = current.copy()
+            current.thumbnail((edge, edge), Image.LANCZOS)
+        entry = {'width': current.width, 'height': current.height}
+        for fmt, (pil_format, ext, options) in VARIANT_FORMATS.items():
+            buf = io.BytesIO()
+            current.save(buf, format=pil_format, quality=quality, **options)
+            entry[fmt] = _store(out_dir, buf.getvalue(), ext)
+        variants[name] = entry
+    return variants
+
+
+def _store(out_dir, data, ext):
+    """Write ``data`` under its content hash, unless that file already exists."""
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    relative = f'{digest[:2]}/{digest}.{ext}'
+    path = os.path.join(out_dir, relative)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return relative
+
+
+def _get_pool():
+    """
+    Per-process render pool, created again after a fork (gunicorn workers).
+    Returns None with ``IMAGE_VARIANT_WORKERS=0``, and variants are then
+    rendered on the job thread.
+    """
+    global _pool, _pool_pid
+    if IMAGE_VARIANT_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadPoolExecutor(max_workers=IMAGE_VARIANT_WORKERS, thread_name_prefix='image-variants')
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def variant_urls(variants):
+    """Relative variant paths -> public URLs."""
+    base = f"{os.environ.get('BACKEND_URL', '')}/api/uploads/{VARIANT_DIR}/"
+    return {
+        name: {key: (base + value if key in VARIANT_FORMATS else value) for key, value in entry.items()}
+        for name, entry in variants.items()
+    }
+
+
+def build_srcset(variants):
+    """{'webp': 'url 320w, url 640w, ...', 'jpeg': ...} from a stored variant map."""
+    entries = sorted(variants.values(), key=lambda entry: entry['width'])
+    srcset = {}
+    for fmt in VARIANT_FORMATS:
+        seen, parts = set(), []
+        for entry in entries:
+            if entry.get(fmt) and entry['width'] not in seen:
+                seen.add(entry['width'])
+                parts.append(f"{entry[fmt]} {entry['width']}w")
+        if parts:
+            srcset[fmt] = ', '.join(parts)
+    return srcset
+
+
+def _upload_urls(filename):
+    """The two forms of an image's URL stored on listings: with and without BACKEND_URL."""
+    path = f'/api/uploads/images/{filename}'
+    return path, f"{os.environ.get('BACKEND_URL', '')}{path}"
+
+
+def variants_for_image(db, image_url):
+    """Stored variant map (JSON text) for a local upload URL, or None."""
+    match = UPLOAD_URL.search(image_url or '')
+    if not match:
+        return None
+    row = db.execute('SELECT variants FROM media_uploads WHERE filename = ?', (match.group(1),)).fetchone()
+    return row['variants'] if row else None
+
+
+def queue_variants(filename):
+    """Queue variant rendering for a saved local image; errors only cost the variants."""
+    if not HAS_PIL:
+        return
+    try:
+        job_queue.enqueue('image_variants', {'filename': filename})
+    except Exception as e:
+        log.warning('Could not queue %s: %s', filename, e)
+
+
+@job_queue.handler('image_variants', max_attempts=2)
+def generate_variants(payload):
+    filename = payload['filename']
+    upload_dir = current_app.config['UPLOAD_FOLDER']
+    source_path = os.path.join(upload_dir, filename)
+    if not os.path.exists(source_path):
+        log.info('%s no longer exists locally, skipping', filename)
+        return
+    out_dir = os.path.join(upload_dir, VARIANT_DIR)
+
+    pool = _get_pool()
+    if pool is None:
+        variants = render_variants(source_path, out_dir)
+    else:
+        variants = pool.submit(render_variants, source_path, out_dir).result(timeout=IMAGE_VARIANT_TIMEOUT)
+    variants_json = json.dumps(variant_urls(variants))
+
+    db = get_db()
+    db.execute('UPDATE media_uploads SET variants = ? WHERE filename = ?', (variants_json, filename))
+    # Listings saved before the variants were ready; an equality match uses idx_cars_image_url
+    db.execute(
+        'UPDATE cars SET image_variants = ? WHERE image_url IN (?, ?)',
+        (variants_json, *_upload_urls(filename)),
+    )
+    db.commit()
+    log.debug('Rendered %d sizes for %s', len(variants), filename)
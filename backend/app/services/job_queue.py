@@ -0,0 +1,226 @@
+"""
+Durable background job queue for slow side effects (email, media uploads).
+
+Request handlers call ``job_queue.enqueue(kind, payload)`` and return right
+away. Jobs are rows in the ``jobs`` table of the app database, so they
+survive a restart and any worker process can run them. Each process runs
+``JOB_QUEUE_WORKERS`` threads that claim due jobs with a conditional UPDATE
+(only one claimer wins), run the handler registered for the job's kind, and
+on failure reschedule it with exponential backoff until ``max_attempts``.
+A job left ``running`` by a crashed worker is picked up again once its lock
+is older than ``JOB_LOCK_TIMEOUT``.
+
+With ``JOB_QUEUE_WORKERS=0`` jobs run inline in ``enqueue`` (scripts, tests).
+"""
+
+import os
+import json
+import time
+import random
+import threading
+
+from ..db import get_db
+from ..log import get_logger
+
+JOB_QUEUE_WORKERS = int(os.environ.get('JOB_QUEUE_WORKERS', '2'))
+JOB_QUEUE_POLL = float(os.environ.get('JOB_QUEUE_POLL', '2'))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '5'))
+JOB_RETRY_BASE = float(os.environ.get('JOB_RETRY_BASE', '5'))
+JOB_RETRY_MAX = float(os.environ.get('JOB_RETRY_MAX', '600'))
+JOB_LOCK_TIMEOUT = float(os.environ.get('JOB_LOCK_TIMEOUT', '600'))
+# Finished jobs are kept this long for inspection, then pruned
+JOB_RETENTION = float(os.environ.get('JOB_RETENTION', str(7 * 24 * 3600)))
+
+log = get_logger('Jobs')
+
+CLAIM_SQL = '''
+    UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_at = ?
+    WHERE id = ? AND (status = 'queued' OR (status = 'running' AND locked_at < ?))
+'''
+
+DUE_SQL = '''
+    SELECT id FROM jobs
+    WHERE (status = 'queued' AND run_at <= ?) OR (status = 'running' AND locked_at < ?)
+    ORDER BY run_at LIMIT 10
+'''
+
+
+def backoff_delay(attempts, base=JOB_RETRY_BASE, cap=JOB_RETRY_MAX):
+    """Exponential backoff with jitter: ~base, 2*base, 4*base... capped."""
+    delay = min(cap, base * (2 ** max(0, attempts - 1)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+class JobQueue:
+    def __init__(self, workers=JOB_QUEUE_WORKERS, poll_interval=JOB_QUEUE_POLL):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._handlers = {}
+        self._app = None
+        self._threads = []
+        self._pid = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        self.stats_counters = {'enqueued': 0, 'succeeded': 0, 'retried': 0, 'failed': 0}
+
+    def handler(self, kind, max_attempts=JOB_MAX_ATTEMPTS):
+        """Decorator registering ``fn(payload)`` as the runner for jobs of ``kind``."""
+        def register(fn):
+            self._handlers[kind] = (fn, max_attempts)
+            return fn
+        return register
+
+    def init_app(self, app):
+        self._app = app
+        app.extensions['job_queue'] = self
+        if self.workers > 0:
+            self._ensure_workers()
+
+    def _ensure_workers(self):
+        """Start the worker threads, and again after a fork (gunicorn workers)."""
+        pid = os.getpid()
+        with self._lock:
+            if self._pid == pid and all(t.is_alive() for t in self._threads):
+                return
+            self._pid = pid
+            self._threads = []
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    # ------------------------------------------------------------------
+    # Producing
+    # ------------------------------------------------------------------
+
+    def enqueue(self, kind, payload, delay=0, db=None):
+        """Queue a job. Returns the job id, or None when it was run inline."""
+        if kind not in self._handlers:
+            raise ValueError(f'No job handler registered for {kind!r}')
+        self.stats_counters['enqueued'] += 1
+        if self.workers <= 0 or self._app is None:
+            self._run_inline(kind, payload)
+            return None
+
+        db = db or get_db()
+        _, max_attempts = self._handlers[kind]
+        cursor = db.execute(
+            'INSERT INTO jobs (kind, payload, status, attempts, max_attempts, run_at) VALUES (?, ?, ?, 0, ?, ?)',
+            (kind, json.dumps(payload), 'queued', max_attempts, time.time() + delay),
+        )
+        db.commit()
+        self._ensure_workers()
+        if not delay:
+            self._wake.set()
+        return cursor.lastrowid
+
+    def _run_inline(self, kind, payload):
+        fn, max_attempts = self._handlers[kind]
+        for attempt in range(1, max_attempts + 1):
+            try:
+                fn(payload)
+                self.stats_counters['succeeded'] += 1
+                return
+            except Exception as e:
+                log.warning('%s attempt %d failed: %s', kind, attempt, e)
+        self.stats_counters['failed'] += 1
+
+    # ------------------------------------------------------------------
+    # Consuming
+    # ------------------------------------------------------------------
+
+    def _run(self):
+        while True:
+            try:
+                ran = self.run_pending()
+            except Exception as e:
+                log.exception('Worker error: %s', e)
+                ran = 0
+            if not ran:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def run_pending(self, limit=10):
+        """Claim and run up to ``limit`` due jobs. Returns how many ran."""
+        ran = 0
+        with self._app.app_context():
+            db = get_db()
+            while ran < limit:
+                job = self._claim(db)
+                if job is None:
+                    break
+                self._execute(db, job)
+                ran += 1
+            self._maybe_prune(db)
+        return ran
+
+    def _claim(self, db):
+        now = time.time()
+        stale = now - JOB_LOCK_TIMEOUT
+        for row in db.execute(DUE_SQL, (now, stale)).fetchall():
+            cursor = db.execute(CLAIM_SQL, (now, row['id'], stale))
+            db.commit()
+            if cursor.rowcount == 1:
+                return db.execute('SELECT * FROM jobs WHERE id = ?', (row['id'],)).fetchone()
+        return None
+
+    def _execute(self, db, job):
+        kind = job['kind']
+        registered = self._handlers.get(kind)
+        try:
+            if registered is None:
+                raise LookupError(f'No handler for job kind {kind!r}')
+            registered[0](json.loads(job['payload'] or '{}'))
+        except Exception as e:
+            # The handler may have failed mid-transaction (Postgres then rejects every
+            # statement until a rollback), so the bookkeeping below starts clean
+            try:
+                db.rollback()
+            except Exception:
+                pass
+            attempts = job['attempts']
+            error = f'{type(e).__name__}: {e}'[:1000]
+            if attempts < (job['max_attempts'] or JOB_MAX_ATTEMPTS):
+                delay = backoff_delay(attempts)
+                db.execute(
+                    "UPDATE jobs SET status = 'queued', run_at = ?, locked_at = NULL, last_error = ? WHERE id = ?",
+                    (time.time() + delay, error, job['id']),
+                )
+                self.stats_counters['retried'] += 1
+                log.warning('%s #%s failed (attempt %d), retrying in %.0fs: %s', kind, job['id'], attempts, delay, e)
+            else:
+                db.execute(
+                    "UPDATE jobs SET status = 'failed', finished_at = ?, last_error = ? WHERE id = ?",
+                    (time.time(), error, job['id']),
+                )
+                self.stats_counters['failed'] += 1
+                log.error('%s #%s gave up after %d attempts: %s', kind, job['id'], attempts, e)
+            db.commit()
+            return
+        db.execute("UPDATE jobs SET status = 'done', finished_at = ?, last_error = NULL WHERE id = ?",
+                   (time.time(), job['id']))
+        db.commit()
+        self.stats_counters['succeeded'] += 1
+
+    def _maybe_prune(self, db):
+        now = time.time()
+        if now - self._last_prune < 3600:
+            return
+        self._last_prune = now
+        db.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (now - JOB_RETENTION,))
+        db.commit()
+
+    def stats(self):
+        """Queue depth by status plus this process's counters (for /api/health)."""
+        counts = {}
+        if self._app is not None and self.workers > 0:
+            try:
+                rows = get_db().execute('SELECT status, COUNT(*) AS n FROM jobs GROUP BY status').fetchall()
+                counts = {row['status']: row['n'] for row in rows}
+            except Exception:
+                pass
+        return {'workers': self.workers, 'jobs': counts, **self.stats_counters}
+
+
+job_queue = JobQueue()
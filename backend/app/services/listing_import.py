@@ -0,0 +1,501 @@
+"""
+Bulk listing import for dealers.
+
+A CSV or NDJSON upload is spooled to a temp file and read back one row at a
+time. Every row goes through the same validation and sanitizing as
+``POST /api/cars`` (``parse_listing``), and valid rows are inserted in
+transactions of ``BULK_IMPORT_BATCH`` rows with one ``executemany`` each,
+instead of one commit per car. If a batch fails in the database, its rows
+are retried one at a time, so only the rows that fail are reported as failed.
+
+Small uploads are imported inside the request. Larger ones run on a small
+background pool while the client polls ``GET /api/cars/import/<job_id>``;
+progress and the per-row report are kept in the ``import_jobs`` table, so any
+worker can answer the poll. Progress is written after every batch; a job
+that has been ``queued`` or ``running`` for ``BULK_IMPORT_STALE_SECONDS``
+without progress lost its worker (a restart or crash) and is marked failed
+when it is next polled.
+"""
+
+import io
+import os
+import csv
+import json
+import uuid
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from ..db import get_db, is_postgres
+from ..log import get_logger
+from ..security import sanitize_string, validate_text_field, validate_integer, validate_float
+from .catalog_index import catalog_index
+from .deal_scorer import deal_scorer
+from .media_store import listing_refs, add_refs
+
+BULK_IMPORT_BATCH = int(os.environ.get('BULK_IMPORT_BATCH', '200'))
+BULK_IMPORT_MAX_ROWS = int(os.environ.get('BULK_IMPORT_MAX_ROWS', '10000'))
+BULK_IMPORT_MAX_BYTES = int(os.environ.get('BULK_IMPORT_MAX_BYTES', str(20 * 1024 * 1024)))
+# Uploads up to this size are imported inline and answered with the full report
+BULK_IMPORT_SYNC_BYTES = int(os.environ.get('BULK_IMPORT_SYNC_BYTES', str(256 * 1024)))
+BULK_IMPORT_WORKERS = int(os.environ.get('BULK_IMPORT_WORKERS', '2'))
+BULK_IMPORT_STALE_SECONDS = int(os.environ.get('BULK_IMPORT_STALE_SECONDS', '900'))
+
+FORMATS = ('csv', 'ndjson')
+
+log = get_logger('Import')
+
+# Column order shared by parse_listing, listing_params and INSERT_SQL
+LISTING_COLUMNS = (
+    'owner_id', 'make', 'model', 'year', 'price', 'currency', 'odometer_km', 'description', 'specs',
+    'image_url', 'video_url', 'gallery_images', 'media_gallery', 'category', 'condition',
+    'exterior_color', 'interior_color', 'transmission', 'fuel_type', 'regional_spec', 'payment_type',
+    'city', 'neighborhood', 'trim',
+)
+INSERT_SQL = (
+    f"INSERT INTO cars ({', '.join(LISTING_COLUMNS)}, import_key) "
+    f"VALUES ({', '.join('?' for _ in LISTING_COLUMNS)}, ?)"
+)
+
+# CSV headers people actually use -> API field names
+CSV_ALIASES = {
+    'odometer_km': 'odometerKm', 'odometer': 'odometerKm', 'mileage': 'odometerKm',
+    'image_url': 'image', 'video_url': 'videoUrl', 'gallery_images': 'galleryImages',
+    'exterior_color': 'exteriorColor', 'interior_color': 'interiorColor', 'fuel_type': 'fuelType',
+    'regional_spec': 'regionalSpec', 'payment_type': 'paymentType',
+}
+
+
+class ListingValidationError(ValueError):
+    pass
+
+
+class ImportUploadError(ValueError):
+    """The upload itself is unusable (format, size)."""
+
+
+def parse_listing(data):
+    """
+    Validate and sanitize one listing payload (``POST /api/cars`` body).
+    Returns a dict keyed by column name; raises ListingValidationError.
+    """
+    make = sanitize_string(data.get('make', ''))
+    model = sanitize_string(data.get('model', ''))
+
+    valid, error = validate_text_field(make, 'Make', required=True, max_length=50)
+    if not valid:
+        raise ListingValidationError(error)
+
+    valid, error = validate_text_field(model, 'Model', required=True, max_length=100)
+    if not valid:
+        raise ListingValidationError(error)
+
+    year = data.get('year')
+    if year is not None:
+        valid, error = validate_integer(year, 'Year', min_val=1900, max_val=2100)
+        if not valid:
+            raise ListingValidationError(error)
+        year = int(year)
+
+    price = data.get('price')
+    if price is not None:
+        valid, error = validate_float(price, 'Price', min_val=0, max_val=100000000)
+        if not valid:
+            raise ListingValidationError(error)
+        price = float(price)
+
+    odometer_km = data.get('odometerKm')
+    if odometer_km is not None:
+        valid, error = validate_integer(odometer_km, 'Odometer', min_val=0, max_val=10000000)
+        if not valid:
+            raise ListingValidationError(error)
+        odometer_km = int(odometer_km)
+
+    specs = data.get('specs', {})
+    if not isinstance(specs, dict):
+        specs = {}
+
+    gallery_images = data.get('galleryImages', [])
+    if not isinstance(gallery_images, list):
+        gallery_images = []
+    gallery_images = [sanitize_string(url)[:500] for url in gallery_images if isinstance(url, str)]
+
+    media_gallery = data.get('mediaGallery', [])
+    if not isinstance(media_gallery, list):
+        media_gallery = []
+
+    return {
+        'make': make,
+        'model': model,
+        'year': year,
+        'price': price,
+        'currency': sanitize_string(data.get('currency', 'JOD'))[:10],
+        'odometer_km': odometer_km,
+        'description': sanitize_string(data.get('description', ''))[:5000],
+        'specs': specs,
+        'image_url': sanitize_string(data.get('image', ''))[:500],
+        'video_url': sanitize_string(data.get('videoUrl', ''))[:500],
+        'gallery_images': gallery_images,
+        'media_gallery': media_gallery,
+        'category': sanitize_string(data.get('category', 'car'))[:20],
+        'condition': sanitize_string(data.get('condition', 'used'))[:20],
+        'exterior_color': sanitize_string(data.get('exteriorColor', ''))[:50],
+        'interior_color': sanitize_string(data.get('interiorColor', ''))[:50],
+        'transmission': sanitize_string(data.get('transmission', ''))[:20],
+        'fuel_type': sanitize_string(data.get('fuelType', ''))[:20],
+        'regional_spec': sanitize_string(data.get('regionalSpec', ''))[:20],
+        'payment_type': sanitize_string(data.get('paymentType', 'cash'))[:20],
+        'city': sanitize_string(data.get('city', ''))[:100],
+        'neighborhood': sanitize_string(data.get('neighborhood', ''))[:100],
+        'trim': sanitize_string(data.get('trim', ''))[:50],
+    }
+
+
+def listing_params(listing, owner_id):
+    """INSERT parameters (in LISTING_COLUMNS order) for a parsed listing."""
+    values = dict(listing, owner_id=owner_id)
+    for column in ('specs', 'gallery_images', 'media_gallery'):
+        values[column] = json.dumps(values[column])
+    return tuple(values[column] for column in LISTING_COLUMNS)
+
+
+# ----------------------------------------------------------------------
+# Reading uploads
+# ----------------------------------------------------------------------
+
+def detect_format(filename=None, content_type=None, requested=None):
+    """'csv' or 'ndjson' from an explicit ?format=, the file name or the content type."""
+    if requested:
+        requested = requested.lower()
+        if requested in ('jsonl', 'json'):
+            requested = 'ndjson'
+        if requested not in FORMATS:
+            raise ImportUploadError(f"Unsupported format '{requested}'; use csv or ndjson")
+        return requested
+    name = (filename or '').lower()
+    ctype = (content_type or '').lower()
+    if name.endswith('.csv') or 'csv' in ctype:
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl')) or 'ndjson' in ctype or 'jsonl' in ctype or 'json-seq' in ctype:
+        return 'ndjson'
+    raise ImportUploadError('Could not tell the file format; upload a .csv or .ndjson file or pass ?format=')
+
+
+def spool_upload(stream, max_bytes=BULK_IMPORT_MAX_BYTES):
+    """Copy an upload to a temp file in chunks. Returns (path, size)."""
+    fd, path = tempfile.mkstemp(prefix='intelliwheels_import_', suffix='.upload')
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(64 * 1024)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ImportUploadError(f'File too large (max {max_bytes // (1024 * 1024)}MB)')
+                out.write(chunk)
+    except Exception:
+        os.unlink(path)
+        raise
+    return path, size
+
+
+def _csv_value(value):
+    value = value.strip()
+    if value[:1] in ('[', '{'):
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+    return value
+
+
+def _spec_value(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return value
+    return int(number) if number.is_integer() else number
+
+
+def csv_record(row):
+    """A CSV row -> API payload. Empty cells are omitted; ``specs.<key>`` columns build specs."""
+    data = {}
+    specs = {}
+    for header, value in row.items():
+        if header is None or value is None or not str(value).strip():
+            continue
+        key = CSV_ALIASES.get(header.strip(), header.strip())
+        if key.startswith(('specs.', 'specs_')):
+            specs[key[6:]] = _spec_value(value.strip())
+        elif key in ('galleryImages', 'mediaGallery'):
+            value = _csv_value(value)
+            data[key] = value if isinstance(value, list) else [part.strip() for part in value.split('|') if part.strip()]
+        else:
+            data[key] = _csv_value(value)
+    if specs:
+        data['specs'] = {**(data['specs'] if isinstance(data.get('specs'), dict) else {}), **specs}
+    return data
+
+
+def iter_records(stream, fmt):
+    """Yield (row_number, payload_dict_or_None, error_or_None) from a text stream."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for number, row in enumerate(reader, start=1):
+            yield number, csv_record(row), None
+        return
+    number = 0
+    for line in stream:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            yield number, None, f'Invalid JSON: {e.msg}'
+            continue
+        if not isinstance(data, dict):
+            yield number, None, 'Each line must be a JSON object'
+            continue
+        yield number, data, None
+
+
+# ----------------------------------------------------------------------
+# Importing
+# ----------------------------------------------------------------------
+
+def _insert_batch(db, batch, owner_id, job_id):
+    """Insert one batch in a single transaction. Returns {row_number: car_id}."""
+    keys = {f'bulk:{job_id}:{number}': number for number, _ in batch}
+    db.executemany(INSERT_SQL, [
+        listing_params(listing, owner_id) + (f'bulk:{job_id}:{number}',) for number, listing in batch
+    ])
+    add_refs(db, [name for _, listing in batch for name in listing_refs(listing)])
+    # executemany has no lastrowid; the per-row import_key finds the new ids
+    placeholders = ', '.join('?' for _ in keys)
+    rows = db.execute(f'SELECT id, import_key FROM cars WHERE import_key IN ({placeholders})', tuple(keys)).fetchall()
+    db.commit()
+    return {keys[row['import_key']]: row['id'] for row in rows}
+
+
+def _insert_rows(db, batch, owner_id, job_id):
+    """
+    Insert a batch, or row by row if the batch fails, so one bad row does not
+    fail the rest. Returns ({row_number: car_id}, {row_number: error}).
+    """
+    try:
+        return _insert_batch(db, batch, owner_id, job_id), {}
+    except Exception as e:
+        log.warning('Batch insert failed for job %s, retrying row by row: %s', job_id, e)
+        _rollback(db)
+    ids, errors = {}, {}
+    for item in batch:
+        try:
+            ids.update(_insert_batch(db, [item], owner_id, job_id))
+        except Exception as e:
+            log.warning('Row %s of job %s failed: %s', item[0], job_id, e)
+            _rollback(db)
+            errors[item[0]] = 'Database error'
+    return ids, errors
+
+
+def _rollback(db):
+    try:
+        db.rollback()
+    except Exception:
+        pass
+
+
+def run_import(db, stream, fmt, owner_id, job_id, batch_size=BULK_IMPORT_BATCH,
+               max_rows=BULK_IMPORT_MAX_ROWS, progress=None):
+    """
+    Validate and insert every record in ``stream``. Returns the summary with a
+    per-row ``results`` list. ``progress(summary)`` is called after each batch.
+    """
+    summary = {'processed': 0, 'inserted': 0, 'failed': 0, 'truncated': False}
+    results = []
+    batch = []
+
+    def flush():
+        if not batch:
+            return
+        ids, errors = _insert_rows(db, batch, owner_id, job_id)
+        for number, listing in batch:
+            car_id = ids.get(number)
+            if car_id is None:
+                results.append({'row': number, 'success': False, 'error': errors.get(number, 'Database error')})
+                summary['failed'] += 1
+                continue
+            results.append({'row': number, 'success': True, 'id': car_id})
+            summary['inserted'] += 1
+            catalog_index.add_car(listing['make'], listing['model'], listing['specs'], listing['trim'])
+        batch.clear()
+        if progress:
+            progress(summary)
+
+    for number, data, error in iter_records(stream, fmt):
+        if summary['processed'] >= max_rows:
+            summary['truncated'] = True
+            break
+        summary['processed'] += 1
+        if error is None:
+            try:
+                batch.append((number, parse_listing(data)))
+            except ListingValidationError as e:
+                error = str(e)
+        if error is not None:
+            results.append({'row': number, 'success': False, 'error': error})
+            summary['failed'] += 1
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    if summary['inserted']:
+        deal_scorer.notify()
+    results.sort(key=lambda result: result['row'])
+    summary['results'] = results
+    return summary
+
+
+def open_upload(path):
+    """Text stream over a spooled upload (BOM-tolerant, csv-safe newlines)."""
+    return io.open(path, 'r', encoding='utf-8-sig', errors='replace', newline='')
+
+
+# ----------------------------------------------------------------------
+# Jobs
+# ----------------------------------------------------------------------
+
+def _timestamp(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def job_row_to_dict(row, include_results=True):
+    job = {
+        'id': row['id'],
+        'status': row['status'],
+        'format': row['format'],
+        'filename': row['filename'],
+        'processed': row['processed'] or 0,
+        'inserted': row['inserted'] or 0,
+        'failed': row['failed'] or 0,
+        'truncated': bool(row['truncated']),
+        'error': row['error'],
+        'createdAt': _timestamp(row['created_at']),
+        'finishedAt': _timestamp(row['finished_at']),
+    }
+    if include_results and row['results']:
+        job['results'] = json.loads(row['results']) if isinstance(row['results'], str) else row['results']
+    return job
+
+
+class ListingImporter:
+    def __init__(self, workers=BULK_IMPORT_WORKERS):
+        self.workers = workers
+        self._app = None
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self._app = app
+        app.extensions['listing_importer'] = self
+
+    def _get_executor(self):
+        """Thread pool for background imports, recreated after a fork (gunicorn workers)."""
+        pid = os.getpid()
+        with self._lock:
+            if self._executor is None or self._pid != pid:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='listing-import')
+                self._pid = pid
+            return self._executor
+
+    def create_job(self, db, owner_id, fmt, filename, status='queued'):
+        job_id = uuid.uuid4().hex
+        db.execute(
+            'INSERT INTO import_jobs (id, owner_id, status, format, filename) VALUES (?, ?, ?, ?, ?)',
+            (job_id, owner_id, status, fmt, filename),
+        )
+        db.commit()
+        return job_id
+
+    def get_job(self, db, job_id):
+        row = db.execute('SELECT * FROM import_jobs WHERE id = ?', (job_id,)).fetchone()
+        if row and row['status'] in ('queued', 'running') and self._reclaim_stale(db, job_id):
+            row = db.execute('SELECT * FROM import_jobs WHERE id = ?', (job_id,)).fetchone()
+        return row
+
+    def _reclaim_stale(self, db, job_id):
+        """Fail a job whose worker stopped writing progress. Returns True if it did."""
+        if is_postgres():
+            stale_before = "NOW() - INTERVAL '1 second' * ?"
+        else:
+            stale_before = "datetime('now', '-' || ? || ' seconds')"
+        cursor = db.execute(
+            f"""UPDATE import_jobs SET status = 'failed', error = ?, updated_at = CURRENT_TIMESTAMP,
+                    finished_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status IN ('queued', 'running') AND updated_at < {stale_before}""",
+            ('Import stopped before finishing; upload the file again', job_id, BULK_IMPORT_STALE_SECONDS),
+        )
+        db.commit()
+        if cursor.rowcount:
+            log.warning('Job %s made no progress for %ss, marked failed', job_id, BULK_IMPORT_STALE_SECONDS)
+        return cursor.rowcount > 0
+
+    def run(self, db, job_id, path, fmt, owner_id):
+        """Import a spooled upload for an existing job and record the outcome. Deletes the file."""
+        def progress(summary):
+            db.execute(
+                'UPDATE import_jobs SET processed = ?, inserted = ?, failed = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+                (summary['processed'], summary['inserted'], summary['failed'], job_id),
+            )
+            db.commit()
+
+        try:
+            cursor = db.execute(
+                "UPDATE import_jobs SET status = 'running', updated_at = CURRENT_TIMESTAMP WHERE id = ? AND status = 'queued'",
+                (job_id,),
+            )
+            db.commit()
+            if cursor.rowcount != 1:
+                log.info('Job %s is no longer queued, skipping', job_id)
+                return
+            with open_upload(path) as stream:
+                summary = run_import(db, stream, fmt, owner_id, job_id, progress=progress)
+            db.execute(
+                '''UPDATE import_jobs SET status = 'completed', processed = ?, inserted = ?, failed = ?, truncated = ?,
+                       results = ?, updated_at = CURRENT_TIMESTAMP, finished_at = CURRENT_TIMESTAMP
+                   WHERE id = ?''',
+                (summary['processed'], summary['inserted'], summary['failed'], 1 if summary['truncated'] else 0,
+                 json.dumps(summary['results']), job_id),
+            )
+            db.commit()
+            log.info('Job %s: %d inserted, %d failed', job_id, summary['inserted'], summary['failed'])
+        except Exception as e:
+            log.exception('Job %s failed: %s', job_id, e)
+            try:
+                db.rollback()
+                db.execute(
+                    "UPDATE import_jobs SET status = 'failed', error = ?, updated_at = CURRENT_TIMESTAMP, finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+                    (str(e)[:500], job_id),
+                )
+                db.commit()
+            except Exception:
+                pass
+        finally:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def submit(self, job_id, path, fmt, owner_id):
+        """Run the import on the background pool."""
+        def task():
+            with self._app.app_context():
+                self.run(get_db(), job_id, path, fmt, owner_id)
+        self._get_executor().submit(task)
+
+
+listing_importer = ListingImporter()
@@ -0,0 +1,117 @@
+"""
+Outgoing email over one reusable SMTP connection.
+
+Opening a connection, upgrading it with STARTTLS and logging in costs several
+round trips, so each job worker thread keeps its session open and reuses it
+for the next message. A session idle for ``SMTP_IDLE_SECONDS`` is closed
+before use (servers drop idle clients), and a send that finds the connection
+dropped reconnects once. Messages are sent by the ``email`` job, so request
+handlers only enqueue them.
+
+For local development point ``SMTP_HOST``/``SMTP_PORT`` at a stub server
+(``python -m aiosmtpd -n -l localhost:1025``) with ``SMTP_STARTTLS=false``.
+"""
+
+import os
+import time
+import smtplib
+import threading
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+from .job_queue import job_queue
+
+SMTP_HOST = os.getenv('SMTP_HOST', '')
+SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
+SMTP_USER = os.getenv('SMTP_USER', '')
+SMTP_PASS = os.getenv('SMTP_PASS', '')
+SMTP_FROM = os.getenv('SMTP_FROM', SMTP_USER)
+SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', 'true').lower() not in ('0', 'false', 'no')
+SMTP_TIMEOUT = float(os.getenv('SMTP_TIMEOUT', '20'))
+SMTP_IDLE_SECONDS = float(os.getenv('SMTP_IDLE_SECONDS', '60'))
+
+
+def is_configured():
+    return bool(SMTP_HOST and SMTP_FROM)
+
+
+def build_message(to_email, subject, body):
+    msg = MIMEMultipart()
+    msg['From'] = SMTP_FROM
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'html'))
+    return msg
+
+
+class Mailer:
+    def __init__(self):
+        self._local = threading.local()
+        self.connections_opened = 0
+
+    def _connect(self):
+        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        if SMTP_STARTTLS:
+            server.starttls()
+        if SMTP_USER and SMTP_PASS:
+            server.login(SMTP_USER, SMTP_PASS)
+        self.connections_opened += 1
+        return server
+
+    def _close(self):
+        server = getattr(self._local, 'server', None)
+        self._local.server = None
+        if server is not None:
+            try:
+                server.quit()
+            except Exception:
+                try:
+                    server.close()
+                except Exception:
+                    pass
+
+    def _session(self):
+        server = getattr(self._local, 'server', None)
+        if server is not None and time.monotonic() - self._local.last_used > SMTP_IDLE_SECONDS:
+            self._close()
+            server = None
+        if server is None:
+            server = self._local.server = self._connect()
+            self._local.last_used = time.monotonic()
+        return server
+
+    def send(self, to_email, subject, body):
+        """Send now on this thread's session. Raises on failure (the job retries)."""
+        msg = build_message(to_email, subject, body)
+        try:
+            self._session().send_message(msg)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            # Stale session: reconnect once, then let the job retry handle anything else
+            self._close()
+            self._session().send_message(msg)
+        self._local.last_used = time.monotonic()
+
+
+mailer = Mailer()
+
+
+@job_queue.handler('email')
+def _send_email_job(payload):
+    mailer.send(payload['to'], payload['subject'], payload['body'])
+    print(f"[Email] Sent to {payload['to']}: {payload['subject']}")
+
+
+def queue_email(to_email, subject, body, log_tag='Email'):
+    """
+    Queue an email for the background workers. Returns True when queued,
+    False when SMTP is not configured (the message is only logged).
+    """
+    if not is_configured():
+        print(f"[{log_tag}] Would send to {to_email}: {subject}")
+        return False
+    try:
+        job_queue.enqueue('email', {'to': to_email, 'subject': subject, 'body': body})
+        return True
+    except Exception as e:
+        print(f"[{log_tag} Error] Failed to queue: {e}")
+        return False
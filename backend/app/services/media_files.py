@@ -0,0 +1,173 @@
+"""
+Serving of files under /api/uploads.
+
+Uploads and image variants are named by a BLAKE2b-128 hash of their content
+(``<32 hex>.<ext>``, see services/media_store.py). A name therefore always
+means the same bytes, so responses for such names carry a one-year
+``immutable`` Cache-Control, and browsers and CDNs do not revalidate them.
+That is only safe while a file under a hashed name is never rewritten with
+other content. Any other name (older uploads, seeded media) gets
+``MEDIA_MUTABLE_MAX_AGE``. The ETag is the same content hash. It is computed
+once, when the file is saved, and kept in ``media_uploads``, so a request
+never hashes a file. Processes also cache hashes in memory, keyed by
+(size, mtime).
+
+Range requests (video scrubbing) return 206 through werkzeug's conditional
+handling. When the WSGI server provides ``wsgi.file_wrapper`` (gunicorn), a
+single-range body is handed over as the file itself, already seeked to the
+range start. Gunicorn then sends it with ``sendfile(2)`` rather than copying
+it through Python.
+
+Behind a reverse proxy, set ``MEDIA_SENDFILE`` to let the proxy send the bytes:
+
+* ``x-accel``: nginx. The response carries ``X-Accel-Redirect:
+  MEDIA_ACCEL_PREFIX + filename``, which must map to an ``internal``
+  location aliased to the uploads folder.
+* ``x-sendfile``: Apache mod_xsendfile or lighttpd. The response carries the
+  absolute path in ``X-Sendfile``.
+"""
+
+import os
+import re
+import hashlib
+import mimetypes
+from collections import OrderedDict
+
+from flask import current_app, request, send_from_directory
+from werkzeug.exceptions import NotFound
+from werkzeug.utils import safe_join
+
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE', '').lower()
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/_uploads/')
+MEDIA_MAX_AGE = int(os.environ.get('MEDIA_MAX_AGE', str(365 * 24 * 3600)))
+# Files not named by us (older uploads, seeded media) may change, so they revalidate sooner
+MEDIA_MUTABLE_MAX_AGE = int(os.environ.get('MEDIA_MUTABLE_MAX_AGE', '3600'))
+MEDIA_BUFFER = 1024 * 1024
+
+IMMUTABLE_NAME = re.compile(r'^[0-9a-f]{32}\.[a-z0-9]+$')
+
+_ETAG_CACHE_SIZE = 4096
+_etag_cache = OrderedDict()
+
+
+def is_immutable_name(filename):
+    return bool(IMMUTABLE_NAME.match(os.path.basename(filename)))
+
+
+def hash_file(path):
+    """BLAKE2b-128 of the file contents, read in 1MB blocks."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(MEDIA_BUFFER), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _remember(filename, stat, content_hash):
+    _etag_cache[filename] = (stat.st_size, stat.st_mtime_ns, content_hash)
+    _etag_cache.move_to_end(filename)
+    while len(_etag_cache) > _ETAG_CACHE_SIZE:
+        _etag_cache.popitem(last=False)
+
+
+def record_upload(db, filename, kind, path):
+    """Hash a freshly saved upload and store it, so serving never has to. Returns the hash."""
+    stat = os.stat(path)
+    content_hash = hash_file(path)
+    db.execute('''
+        INSERT INTO media_uploads (filename, kind, content_hash, size) VALUES (?, ?, ?, ?)
+        ON CONFLICT (filename) DO UPDATE SET content_hash = excluded.content_hash, size = excluded.size
+    ''', (filename, kind, content_hash, stat.st_size))
+    db.commit()
+    _remember(filename, stat, content_hash)
+    return content_hash
+
+
+def media_etag(db, filename, path, stat):
+    """Content hash for ``filename``: memory, then media_uploads, then hashing it once."""
+    cached = _etag_cache.get(filename)
+    if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+        return cached[2]
+    row = db.execute('SELECT content_hash, size FROM media_uploads WHERE filename = ?', (filename,)).fetchone()
+    if row and row['content_hash'] and row['size'] == stat.st_size:
+        _remember(filename, stat, row['content_hash'])
+        return row['content_hash']
+    kind = 'video' if (mimetypes.guess_type(filename)[0] or '').startswith('video/') else 'image'
+    return record_upload(db, filename, kind, path)
+
+
+class _RangeFile:
+    """
+    A file limited to one byte range. Iterating servers read it through
+    ``read`` and stop at the range end. Gunicorn's sendfile path uses
+    ``fileno()`` together with the current offset and Content-Length.
+    """
+
+    def __init__(self, path, start, length):
+        self._file = open(path, 'rb')
+        self._file.seek(start)
+        self._remaining = length
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def read(self, size=-1):
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+
+def _use_sendfile(response, path):
+    """Replace werkzeug's range iterator with a file the server can sendfile()."""
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    content_range = response.content_range
+    if file_wrapper is None or content_range is None or content_range.start is None:
+        return response
+    old = response.response
+    response.response = file_wrapper(
+        _RangeFile(path, content_range.start, content_range.stop - content_range.start), MEDIA_BUFFER
+    )
+    if hasattr(old, 'close'):
+        old.close()
+    return response
+
+
+def send_media(db, directory, filename, etag=None):
+    """
+    Response for an upload with cache headers, ETag, Range and optional proxy
+    offload. Content-addressed files pass their name as ``etag``.
+    """
+    path = safe_join(directory, filename)
+    if path is None:
+        raise NotFound()
+    try:
+        stat = os.stat(path)
+    except OSError:
+        raise NotFound()
+
+    immutable = is_immutable_name(filename)
+    etag = etag or media_etag(db, filename, path, stat)
+    max_age = MEDIA_MAX_AGE if immutable else MEDIA_MUTABLE_MAX_AGE
+
+    if MEDIA_SENDFILE in ('x-accel', 'x-sendfile'):
+        response = current_app.response_class(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.set_etag(etag)
+        response.last_modified = stat.st_mtime
+        response = response.make_conditional(request)
+        if response.status_code != 304:
+            if MEDIA_SENDFILE == 'x-accel':
+                response.headers['X-Accel-Redirect'] = MEDIA_ACCEL_PREFIX + os.path.relpath(path, current_app.config['UPLOAD_FOLDER'])
+            else:
+                response.headers['X-Sendfile'] = os.path.abspath(path)
+    else:
+        response = send_from_directory(directory, filename, etag=etag, max_age=max_age, conditional=True)
+        if response.status_code == 206:
+            response = _use_sendfile(response, path)
+
+    response.headers['Cache-Control'] = f'public, max-age={max_age}' + (', immutable' if immutable else '')
+    return response
@@ -0,0 +1,362 @@
+"""
+Content-addressed upload storage with reference counts.
+
+Uploads are named by a BLAKE2b-128 hash of their bytes. The hash is computed
+as the request body is written to disk. A photo uploaded twice (dealers often
+re-upload the same pictures when editing a listing) is stored once, and both
+listings get the same immutable URL, so browser caches are shared too. With
+Cloudinary configured the upload job moves a blob off local disk; its
+``media_uploads`` row keeps the ``remote_url``, and a re-upload of the same
+bytes reuses that copy instead of uploading it again.
+
+Placing a blob and deleting it take the same per-hash lock (a file lock
+shared by every worker on the host), so the collector cannot unlink a file
+that a concurrent re-upload has just claimed.
+
+``media_uploads.ref_count`` counts the listings that use a blob: the main
+image, gallery, video or media gallery of a car. The car write paths adjust
+it with ``add_refs``/``drop_refs``. When a blob's count reaches zero it gets
+``unreferenced_since``. A new upload has no references until its listing is
+saved.
+
+Garbage collection runs every ``MEDIA_GC_INTERVAL`` seconds. Counts can drift
+(manual SQL, crashes between writes), so the collector does not trust them
+alone. It re-marks every reference from the cars table and repairs the
+counts. It then deletes blobs that are still unreferenced and have been so
+for at least ``MEDIA_GC_GRACE`` seconds, together with the image variants
+that no remaining blob uses.
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from ..db import get_db
+from ..log import get_logger
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+MEDIA_GC_INTERVAL = int(os.environ.get('MEDIA_GC_INTERVAL', '3600'))
+# Time between an upload and the listing that uses it being saved, with room to spare
+MEDIA_GC_GRACE = float(os.environ.get('MEDIA_GC_GRACE', str(24 * 3600)))
+MEDIA_GC_LOCK_PATH = os.environ.get(
+    'MEDIA_GC_LOCK_PATH', os.path.join(tempfile.gettempdir(), 'intelliwheels_media_gc.lock')
+)
+# Lock files for blob placement and deletion, one per leading hash byte
+MEDIA_LOCK_DIR = os.environ.get(
+    'MEDIA_LOCK_DIR', os.path.join(tempfile.gettempdir(), 'intelliwheels_media_locks')
+)
+MEDIA_BUFFER = 1024 * 1024
+MARK_BATCH = 1000
+
+INCOMING_PREFIX = '.incoming-'
+UPLOAD_NAME = re.compile(r'/api/uploads/(?:images|videos)/([0-9a-f]{32}\.[a-z0-9]+)')
+# Names save_upload/adopt_file give blobs; only these are garbage collected.
+# Other files (older uploads, seeded media) can get a media_uploads row when
+# served (for their ETag), but their references are not counted.
+MANAGED_NAME = re.compile(r'^[0-9a-f]{32}\.[a-z0-9]+$')
+REF_COLUMNS = ('image_url', 'video_url', 'gallery_images', 'media_gallery')
+
+log = get_logger('Media GC')
+
+REGISTER_SQL = '''
+    INSERT INTO media_uploads (filename, kind, content_hash, size, ref_count, unreferenced_since)
+    VALUES (?, ?, ?, ?, 0, ?)
+    ON CONFLICT (filename) DO UPDATE SET unreferenced_since = excluded.unreferenced_since
+'''
+ADD_REF_SQL = 'UPDATE media_uploads SET ref_count = ref_count + 1, unreferenced_since = NULL WHERE filename = ?'
+DROP_REF_SQL = '''
+    UPDATE media_uploads SET ref_count = ref_count - 1,
+        unreferenced_since = CASE WHEN ref_count <= 1 THEN ? ELSE unreferenced_since END
+    WHERE filename = ? AND ref_count > 0
+'''
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+@contextmanager
+def _blob_lock(filename):
+    """Serialize placing and deleting a blob across threads and worker processes."""
+    stripe = filename[:2]
+    if not HAS_FCNTL:
+        with _thread_locks_guard:
+            lock = _thread_locks.setdefault(stripe, threading.Lock())
+        with lock:
+            yield
+        return
+    os.makedirs(MEDIA_LOCK_DIR, exist_ok=True)
+    # flock is held per open file, so threads of one process exclude each other too
+    with open(os.path.join(MEDIA_LOCK_DIR, stripe), 'a') as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        yield
+
+
+def _place(db, upload_dir, tmp_path, digest, ext):
+    """Move a hashed file to its content name. Returns (filename, created)."""
+    filename = f'{digest}.{ext}'
+    final_path = os.path.join(upload_dir, filename)
+    if os.path.exists(final_path) or _has_remote_copy(db, filename):
+        os.remove(tmp_path)
+        return filename, False
+    os.replace(tmp_path, final_path)
+    return filename, True
+
+
+def _has_remote_copy(db, filename):
+    row = db.execute('SELECT remote_url FROM media_uploads WHERE filename = ?', (filename,)).fetchone()
+    return bool(row and row['remote_url'])
+
+
+def _register(db, filename, kind, digest, size):
+    # A re-upload of an unreferenced blob restarts its grace period
+    db.execute(REGISTER_SQL, (filename, kind, digest, size, time.time()))
+    db.commit()
+
+
+def _store(db, upload_dir, path, digest, ext, kind, size):
+    filename = f'{digest}.{ext}'
+    with _blob_lock(filename):
+        filename, created = _place(db, upload_dir, path, digest, ext)
+        _register(db, filename, kind, digest, size)
+    return filename, created
+
+
+def save_upload(db, upload_dir, stream, ext, kind):
+    """
+    Write ``stream`` to the upload folder, hashing it on the way.
+    Returns (filename, created); ``created`` is False for a duplicate.
+    """
+    os.makedirs(upload_dir, exist_ok=True)
+    tmp_path = os.path.join(upload_dir, f'{INCOMING_PREFIX}{uuid.uuid4().hex}')
+    digest = hashlib.blake2b(digest_size=16)
+    size = 0
+    try:
+        with open(tmp_path, 'wb') as f:
+            for block in iter(lambda: stream.read(MEDIA_BUFFER), b''):
+                digest.update(block)
+                f.write(block)
+                size += len(block)
+        return _store(db, upload_dir, tmp_path, digest.hexdigest(), ext, kind, size)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def adopt_file(db, upload_dir, path, ext, kind):
+    """Hash a file already on disk (an assembled chunked upload) and move it into storage."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(MEDIA_BUFFER), b''):
+            digest.update(block)
+    return _store(db, upload_dir, path, digest.hexdigest(), ext, kind, os.path.getsize(path))
+
+
+def listing_refs(car):
+    """Names of the uploads a car row or listing dict points at."""
+    refs = set()
+    for column in REF_COLUMNS:
+        value = car.get(column) if hasattr(car, 'get') else car[column]
+        if not value:
+            continue
+        if not isinstance(value, str):
+            value = json.dumps(value)
+        refs.update(UPLOAD_NAME.findall(value))
+    return refs
+
+
+def add_refs(db, filenames):
+    if filenames:
+        db.executemany(ADD_REF_SQL, [(name,) for name in filenames])
+
+
+def drop_refs(db, filenames):
+    if filenames:
+        now = time.time()
+        db.executemany(DROP_REF_SQL, [(now, name) for name in filenames])
+
+
+def update_refs(db, old_car, new_car):
+    """Move references from a listing's old row to its new one (caller commits)."""
+    old_refs, new_refs = listing_refs(old_car), listing_refs(new_car)
+    drop_refs(db, old_refs - new_refs)
+    add_refs(db, new_refs - old_refs)
+
+
+def _variant_files(variants):
+    if not variants:
+        return set()
+    try:
+        variants = json.loads(variants) if isinstance(variants, str) else variants
+    except ValueError:
+        return set()
+    return {
+        url.split('/api/uploads/', 1)[1]
+        for entry in variants.values() for key, url in entry.items()
+        if isinstance(url, str) and '/api/uploads/' in url
+    }
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
+
+
+class MediaStore:
+    def __init__(self, interval=MEDIA_GC_INTERVAL, grace=MEDIA_GC_GRACE):
+        self.interval = interval
+        self.grace = grace
+        self._app = None
+        self._thread = None
+        self._pid = None
+        self._run_lock = threading.Lock()
+        self.last_gc = None
+
+    def init_app(self, app):
+        self._app = app
+        app.extensions['media_store'] = self
+        if self.interval > 0:
+            self._ensure_worker()
+
+    def _ensure_worker(self):
+        """Start the collector thread, and again after a fork (gunicorn workers)."""
+        pid = os.getpid()
+        if self._thread is not None and self._thread.is_alive() and self._pid == pid:
+            return
+        self._pid = pid
+        self._thread = threading.Thread(target=self._run, name='media-gc', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.collect()
+            except Exception as e:
+                log.exception('Failed: %s', e)
+
+    def _host_lock(self):
+        if not HAS_FCNTL:
+            return None
+        try:
+            handle = open(MEDIA_GC_LOCK_PATH, 'a')
+        except OSError:
+            return None
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            raise
+        return handle
+
+    def collect(self):
+        """One mark-and-sweep pass. Returns a summary, or None if another worker is collecting."""
+        if self._app is None or not self._run_lock.acquire(blocking=False):
+            return None
+        try:
+            try:
+                lock_handle = self._host_lock()
+            except OSError:
+                return None
+            try:
+                with self._app.app_context():
+                    self.last_gc = self._collect(get_db(), self._app.config['UPLOAD_FOLDER'])
+            finally:
+                if lock_handle is not None:
+                    lock_handle.close()
+        finally:
+            self._run_lock.release()
+        if self.last_gc['deleted'] or self.last_gc['repaired']:
+            log.info('Deleted %d blobs (%d KB), repaired %d counts', self.last_gc['deleted'],
+                     self.last_gc['freed_bytes'] // 1024, self.last_gc['repaired'])
+        return self.last_gc
+
+    def _mark(self, db):
+        """Reference count per upload, recomputed from the cars table."""
+        counts = {}
+        last_id = 0
+        while True:
+            rows = db.execute(
+                f"SELECT id, {', '.join(REF_COLUMNS)} FROM cars WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, MARK_BATCH),
+            ).fetchall()
+            if not rows:
+                break
+            for row in rows:
+                for name in listing_refs(row):
+                    counts[name] = counts.get(name, 0) + 1
+            last_id = rows[-1]['id']
+        return counts
+
+    def _collect(self, db, upload_dir):
+        now = time.time()
+        counts = self._mark(db)
+        summary = {'deleted': 0, 'freed_bytes': 0, 'repaired': 0, 'at': now}
+
+        rows = db.execute(
+            "SELECT filename, ref_count, unreferenced_since, size, variants FROM media_uploads "
+            "WHERE kind IN ('image', 'video')"
+        ).fetchall()
+        doomed = []
+        for row in rows:
+            if not MANAGED_NAME.match(row['filename']):
+                continue
+            actual = counts.get(row['filename'], 0)
+            if actual != (row['ref_count'] or 0) or (actual == 0 and row['unreferenced_since'] is None):
+                # Conditional on the old count so a concurrent add_refs is not overwritten
+                cursor = db.execute(
+                    'UPDATE media_uploads SET ref_count = ?, unreferenced_since = ? WHERE filename = ? AND ref_count = ?',
+                    (actual, now if actual == 0 else None, row['filename'], row['ref_count'] or 0),
+                )
+                summary['repaired'] += cursor.rowcount
+            elif actual == 0 and row['unreferenced_since'] < now - self.grace:
+                doomed.append(row)
+        db.commit()
+
+        deleted_variants = set()
+        for row in doomed:
+            # A re-upload of this blob either registers before the delete (which then
+            # matches nothing) or places a fresh file after the unlink
+            with _blob_lock(row['filename']):
+                cursor = db.execute(
+                    'DELETE FROM media_uploads WHERE filename = ? AND ref_count = 0 AND unreferenced_since < ?',
+                    (row['filename'], now - self.grace),
+                )
+                db.commit()
+                if cursor.rowcount != 1:
+                    continue
+                _remove(os.path.join(upload_dir, row['filename']))
+            deleted_variants |= _variant_files(row['variants'])
+            summary['deleted'] += 1
+            summary['freed_bytes'] += row['size'] or 0
+
+        if deleted_variants:
+            # Variants are content-addressed too; keep any another blob still lists
+            for row in db.execute('SELECT variants FROM media_uploads WHERE variants IS NOT NULL').fetchall():
+                deleted_variants -= _variant_files(row['variants'])
+            for relative in deleted_variants:
+                _remove(os.path.join(upload_dir, relative))
+
+        # Temp files left by uploads that died mid-write
+        for name in os.listdir(upload_dir) if os.path.isdir(upload_dir) else ():
+            path = os.path.join(upload_dir, name)
+            if name.startswith(INCOMING_PREFIX) and os.path.getmtime(path) < now - 3600:
+                _remove(path)
+        return summary
+
+
+media_store = MediaStore()
@@ -0,0 +1,509 @@
+"""
+Fair-price model serving.
+
+Wraps the pipeline written by ``models/train_price_model.py``
+(``{"pipeline": ..., "metadata": ...}`` joblib artifacts, versioned under
+``models/price_models/`` with a manifest naming the active one).
+Features for a whole batch are built column by column straight into NumPy
+arrays, so pricing N listings costs one DataFrame and one ``predict`` call.
+Artifacts that carry quantile regressors (p10/p50/p90) are served from one
+preprocessing pass: the batch is encoded once and every quantile model
+predicts from the same matrix, giving the fair-price range.
+When the artifact is missing or cannot be loaded, or a prediction is not
+usable, the make-tier heuristics are used instead.
+"""
+
+import os
+import re
+import json
+import math
+import time
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from ..lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+joblib = lazy_import('joblib')
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'models')
+PRICE_MODEL_PATH = os.environ.get('PRICE_MODEL_PATH', os.path.join(MODELS_DIR, 'fair_price_model.joblib'))
+# Versioned artifacts: {"active": "<version>", "versions": {"<version>": {"path": ...}}}
+PRICE_MODEL_MANIFEST = os.environ.get('PRICE_MODEL_MANIFEST', os.path.join(MODELS_DIR, 'price_models', 'manifest.json'))
+PRICE_MODEL_POLL_SECONDS = int(os.environ.get('PRICE_MODEL_POLL_SECONDS', '60'))
+PRICE_ESTIMATE_CACHE_SIZE = int(os.environ.get('PRICE_ESTIMATE_CACHE_SIZE', '2048'))
+
+# Columns the training pipeline's ColumnTransformer selects
+NUMERIC_FEATURES = ('year', 'rating', 'reviews', 'horsepower')
+CATEGORICAL_FEATURES = ('make', 'model', 'body_style')
+
+# Used when a request (or the artifact metadata) does not provide a value
+DEFAULT_FEATURE_VALUES = {'rating': 4.5, 'reviews': 0.0, 'horsepower': 200.0, 'body_style': 'Unknown'}
+
+# Warm-up / sanity check run on every newly loaded artifact
+CANARY_CAR = {'make': 'Toyota', 'model': 'Camry', 'year': 2020, 'specs': {'horsepower': 200, 'bodyStyle': 'Sedan'}}
+
+LUXURY_MAKES = ['mercedes', 'bmw', 'audi', 'lexus', 'porsche', 'bentley', 'rolls-royce', 'maserati', 'jaguar', 'land rover', 'range rover']
+PREMIUM_MAKES = ['volvo', 'infiniti', 'acura', 'lincoln', 'cadillac', 'genesis', 'alfa romeo']
+STANDARD_MAKES = ['toyota', 'honda', 'nissan', 'mazda', 'hyundai', 'kia', 'ford', 'chevrolet', 'volkswagen', 'subaru']
+BUDGET_MAKES = ['suzuki', 'mitsubishi', 'renault', 'peugeot', 'citroen', 'fiat', 'dacia']
+
+# Value of one unit in JOD. JOD, AED, SAR, QAR and BHD are USD-pegged, so fixed rates hold
+JOD_RATES = {'JOD': 1.0, 'USD': 0.709, 'AED': 0.193, 'SAR': 0.189, 'QAR': 0.195, 'BHD': 1.886, 'KWD': 2.31, 'OMR': 1.842}
+
+_NUMBER_RE = re.compile(r'-?\d+(?:\.\d+)?')
+
+
+def _to_float(value):
+    """Parse 300, '300', '300 hp' or '3.5L' into a float; None if there is no number."""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _NUMBER_RE.search(str(value).replace(',', ''))
+    return float(match.group()) if match else None
+
+
+def horsepower_from_specs(specs):
+    """Horsepower from specs['horsepower'] or the average of specs['engines'][*].powerHp."""
+    if not isinstance(specs, dict):
+        return None
+    hp = _to_float(specs.get('horsepower'))
+    if hp:
+        return hp
+    values = []
+    for engine in specs.get('engines') or []:
+        if isinstance(engine, dict):
+            hp = _to_float(engine.get('powerHp') or engine.get('horsepower') or engine.get('power'))
+            if hp:
+                values.append(hp)
+    return sum(values) / len(values) if values else None
+
+
+def tier(make):
+    """(base_price, variance) for the make's market tier, in JOD."""
+    make_lower = (make or '').lower()
+    if any(m in make_lower for m in LUXURY_MAKES):
+        return 45000, 0.35
+    if any(m in make_lower for m in PREMIUM_MAKES):
+        return 30000, 0.30
+    if any(m in make_lower for m in STANDARD_MAKES):
+        return 18000, 0.25
+    if any(m in make_lower for m in BUDGET_MAKES):
+        return 12000, 0.20
+    return 20000, 0.25
+
+
+def heuristic_estimate(make, model, year, specs):
+    """Rule-of-thumb estimate from make tier, depreciation and a few specs."""
+    base_price, variance = tier(make)
+
+    # Adjust for year (depreciation)
+    current_year = 2026
+    # Anything unparsable ('abc', NaN) is treated as an unknown year
+    year = _to_float(year)
+    if year and math.isfinite(year):
+        age = current_year - int(year)
+        if age <= 0:
+            base_price *= 1.1  # New car premium
+        elif age <= 3:
+            base_price *= (1 - age * 0.08)  # 8% per year for first 3 years
+        elif age <= 7:
+            base_price *= (0.76 - (age - 3) * 0.05)  # 5% per year for years 4-7
+        else:
+            base_price *= max(0.3, 0.56 - (age - 7) * 0.03)  # 3% per year after, min 30%
+
+    # Adjust for specs
+    if specs:
+        hp = _to_float(specs.get('horsepower'))
+        if hp:
+            if hp > 300:
+                base_price *= 1.15
+            elif hp > 200:
+                base_price *= 1.05
+
+        body_style = (specs.get('bodyStyle') or '').lower()
+        if body_style in ['suv', 'crossover']:
+            base_price *= 1.10
+        elif body_style in ['coupe', 'convertible']:
+            base_price *= 1.08
+
+    return {
+        'value': round(base_price),
+        'low': round(base_price * (1 - variance)),
+        'high': round(base_price * (1 + variance)),
+        'currency': 'JOD',
+        'source': 'heuristic',
+    }
+
+
+class _LatencyStats:
+    """Prediction latency for one model version (recent window for percentiles)."""
+
+    def __init__(self, window=512):
+        self.count = 0
+        self.rows = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=window)
+
+    def record(self, seconds, rows):
+        self.count += 1
+        self.rows += rows
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def summary(self):
+        recent = sorted(self.recent)
+
+        def pct(q):
+            return round(recent[min(len(recent) - 1, int(q * len(recent)))] * 1000, 3) if recent else None
+
+        return {
+            'calls': self.count,
+            'rows': self.rows,
+            'avg_ms': round(self.total / self.count * 1000, 3) if self.count else None,
+            'p50_ms': pct(0.50),
+            'p95_ms': pct(0.95),
+            'max_ms': round(self.max * 1000, 3),
+        }
+
+
+class _Artifact:
+    """A loaded pipeline and its metadata. Never mutated, so it can be swapped by reference."""
+    __slots__ = ('version', 'pipeline', 'metadata', 'path', 'quantile_models')
+
+    def __init__(self, version, pipeline, metadata, path, quantile_models=()):
+        self.version = version
+        self.pipeline = pipeline
+        self.metadata = metadata
+        self.path = path
+        # (low, median, high) regressors over the pipeline's preprocessed features, or empty
+        self.quantile_models = tuple(quantile_models)
+
+
+def _quantile_models(quantiles):
+    """The (low, median, high) models from an artifact's ``quantiles`` entry, or ()."""
+    if not isinstance(quantiles, dict):
+        return ()
+    levels = list(quantiles.get('levels') or [])
+    models = list(quantiles.get('models') or [])
+    if len(levels) != 3 or len(models) != 3:
+        return ()
+    # Order by level so the columns are always low, median, high
+    return tuple(model for _, model in sorted(zip(levels, models), key=lambda pair: pair[0]))
+
+
+def read_manifest(manifest_path):
+    """(active_version, artifact_path) from a price model manifest, or None."""
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    active = manifest.get('active')
+    entry = (manifest.get('versions') or {}).get(active) if active else None
+    if not entry or not entry.get('path'):
+        return None
+    path = entry['path']
+    if not os.path.isabs(path):
+        path = os.path.join(os.path.dirname(manifest_path), path)
+    return str(active), path
+
+
+class PriceModel:
+    """
+    Serves the active price model. With a manifest
+    (``models/price_models/manifest.json``) a poller thread picks up a newly
+    activated version, loads it in the background, checks it with a canary
+    prediction and swaps it in atomically; in-flight requests finish on the
+    model they started with. Without a manifest the legacy single artifact
+    is loaded once.
+    """
+
+    def __init__(self, path=PRICE_MODEL_PATH, manifest_path=PRICE_MODEL_MANIFEST,
+                 poll_seconds=PRICE_MODEL_POLL_SECONDS):
+        self.path = path
+        self.manifest_path = manifest_path
+        self.poll_seconds = poll_seconds
+        self.load_error = None
+        self.loaded_at = None
+        self._current = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._memo = OrderedDict()
+        self._memo_lock = threading.Lock()
+        self._latency = {}
+        self._latency_lock = threading.Lock()
+        self._manifest_mtime = None
+        self._poller = None
+        self._poller_pid = None
+
+    @property
+    def pipeline(self):
+        current = self._current
+        return current.pipeline if current else None
+
+    @property
+    def metadata(self):
+        current = self._current
+        return current.metadata if current else {}
+
+    def load(self):
+        """Load the active artifact once. Returns True if a pipeline is available."""
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._load_initial()
+                    self._loaded = True
+        self._ensure_poller()
+        return self._current is not None
+
+    def _load_initial(self):
+        target = self._manifest_target()
+        if target is None:
+            if not os.path.exists(self.path):
+                self.load_error = 'model artifact not found'
+                return
+            target = (None, self.path)
+        try:
+            self._swap(self._load_artifact(*target))
+        except Exception as e:
+            self.load_error = str(e)
+            print(f"Failed to load price model: {e}")
+
+    def _manifest_target(self):
+        try:
+            self._manifest_mtime = os.stat(self.manifest_path).st_mtime
+        except OSError:
+            self._manifest_mtime = None
+            return None
+        return read_manifest(self.manifest_path)
+
+    def _load_artifact(self, version, path):
+        artifact = joblib.load(path)
+        quantiles = None
+        if isinstance(artifact, dict):
+            pipeline, metadata = artifact.get('pipeline'), artifact.get('metadata') or {}
+            quantiles = artifact.get('quantiles')
+        else:
+            pipeline, metadata = artifact, {}
+        if pipeline is None:
+            raise ValueError(f'{path} has no pipeline')
+        version = version or str(metadata.get('version') or metadata.get('trained_at') or 'unversioned')
+        loaded = _Artifact(version, pipeline, metadata, path, _quantile_models(quantiles))
+        self._warm(loaded)
+        return loaded
+
+    def _warm(self, artifact):
+        """Canary prediction: fails the load on a broken artifact and pays first-call costs up front."""
+        canary = artifact.metadata.get('canary') or CANARY_CAR
+        low, value, high = self._predict_with(artifact, [canary])[0]
+        if not np.isfinite(value) or value <= 0:
+            raise ValueError(f'canary prediction {float(value)} is not a positive price')
+        if artifact.quantile_models and not (np.isfinite(low) and np.isfinite(high) and 0 < low <= high):
+            raise ValueError(f'canary range {float(low)}..{float(high)} is not a valid price range')
+
+    def _swap(self, artifact):
+        previous = self._current
+        self._current = artifact
+        self.loaded_at = datetime.now(timezone.utc).isoformat()
+        self.load_error = None
+        if previous is None:
+            print(f"Loaded price model {artifact.version}")
+        else:
+            print(f"Swapped price model {previous.version} -> {artifact.version}")
+
+    def check_for_update(self):
+        """Load and swap in the manifest's active version if it changed. Returns True on a swap."""
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime
+        except OSError:
+            return False
+        if mtime == self._manifest_mtime:
+            return False
+        self._manifest_mtime = mtime
+        target = read_manifest(self.manifest_path)
+        current = self._current
+        if target is None or (current is not None and current.version == target[0]):
+            return False
+        try:
+            artifact = self._load_artifact(*target)
+        except Exception as e:
+            # Keep serving the current model; a later manifest change retries
+            self.load_error = f'{target[0]}: {e}'
+            print(f"Price model {target[0]} rejected, keeping {current.version if current else 'heuristics'}: {e}")
+            return False
+        with self._lock:
+            self._swap(artifact)
+        return True
+
+    def _ensure_poller(self):
+        if self.poll_seconds <= 0:
+            return
+        pid = os.getpid()
+        if self._poller is not None and self._poller_pid == pid and self._poller.is_alive():
+            return
+        with self._lock:
+            if self._poller is not None and self._poller_pid == pid and self._poller.is_alive():
+                return
+            self._poller_pid = pid
+            self._poller = threading.Thread(target=self._poll, name='price-model-poller', daemon=True)
+            self._poller.start()
+
+    def _poll(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            try:
+                self.check_for_update()
+            except Exception as e:
+                print(f"Price model poll failed: {e}")
+
+    @property
+    def version(self):
+        """Identifies the predictions' source, so stored scores can be refreshed when it changes."""
+        if not self.load():
+            return 'heuristic'
+        return self._current.version
+
+    @staticmethod
+    def _defaults(metadata):
+        defaults = dict(DEFAULT_FEATURE_VALUES)
+        defaults['year'] = float(datetime.now().year - 5)
+        defaults.update(metadata.get('feature_defaults') or {})
+        return defaults
+
+    def build_features(self, cars, metadata=None):
+        """One DataFrame for the whole batch, built from per-column arrays."""
+        defaults = self._defaults(self.metadata if metadata is None else metadata)
+        n = len(cars)
+        year = np.empty(n, dtype=float)
+        horsepower = np.empty(n, dtype=float)
+        make = np.empty(n, dtype=object)
+        model = np.empty(n, dtype=object)
+        body_style = np.empty(n, dtype=object)
+        for i, car in enumerate(cars):
+            specs = car.get('specs') or {}
+            year[i] = _to_float(car.get('year')) or defaults['year']
+            horsepower[i] = horsepower_from_specs(specs) or defaults['horsepower']
+            make[i] = car.get('make') or ''
+            model[i] = car.get('model') or ''
+            body_style[i] = specs.get('bodyStyle') or defaults['body_style']
+        return pd.DataFrame({
+            'year': year,
+            'rating': np.full(n, float(defaults['rating'])),
+            'reviews': np.full(n, float(defaults['reviews'])),
+            'horsepower': horsepower,
+            'make': make,
+            'model': model,
+            'body_style': body_style,
+        }, copy=False)
+
+    def _predict_with(self, artifact, cars):
+        """(n, 3) array of low, value, high; low/high are NaN for point-only artifacts."""
+        start = time.perf_counter()
+        features = self.build_features(cars, artifact.metadata)
+        if artifact.quantile_models:
+            # Encode once; every quantile regressor predicts from the same matrix
+            encoded = artifact.pipeline[:-1].transform(features)
+            values = np.column_stack([model.predict(encoded) for model in artifact.quantile_models]).astype(float)
+            # Independently fitted quantiles can cross; sorting keeps low <= value <= high
+            values.sort(axis=1)
+        else:
+            values = np.full((len(cars), 3), np.nan)
+            values[:, 1] = np.asarray(artifact.pipeline.predict(features), dtype=float)
+        elapsed = time.perf_counter() - start
+        with self._latency_lock:
+            stats = self._latency.get(artifact.version)
+            if stats is None:
+                stats = self._latency[artifact.version] = _LatencyStats()
+            stats.record(elapsed, len(cars))
+        return values
+
+    def predict(self, cars, artifact=None):
+        """(low, value, high) rows for a batch (NumPy array), or None when no model is usable."""
+        if not cars or not self.load():
+            return None
+        try:
+            return self._predict_with(artifact or self._current, cars)
+        except Exception as e:
+            print(f"Price model prediction failed: {e}")
+            return None
+
+    @staticmethod
+    def _memo_key(version, car):
+        specs = car.get('specs') or {}
+        return (
+            version, (car.get('make') or '').lower(), (car.get('model') or '').lower(), _to_float(car.get('year')),
+            horsepower_from_specs(specs), (specs.get('bodyStyle') or '').lower(),
+        )
+
+    def estimate_batch(self, cars):
+        """
+        Estimates for a list of {'make', 'model', 'year', 'specs'} dicts, in order.
+        Repeated listings are answered from a small memo; the rest share one predict call.
+        """
+        self.load()
+        # Pin one artifact for the whole batch, even if a swap happens meanwhile
+        artifact = self._current
+        version = artifact.version if artifact else 'heuristic'
+        results = [None] * len(cars)
+        keys = [self._memo_key(version, car) for car in cars]
+        with self._memo_lock:
+            for i, key in enumerate(keys):
+                cached = self._memo.get(key)
+                if cached is not None:
+                    self._memo.move_to_end(key)
+                    results[i] = dict(cached)
+
+        todo = [i for i, result in enumerate(results) if result is None]
+        predictions = self.predict([cars[i] for i in todo], artifact) if todo and artifact else None
+        computed = {}
+        for j, i in enumerate(todo):
+            car = cars[i]
+            low, value, high = (float(v) for v in predictions[j]) if predictions is not None else (None,) * 3
+            if value is not None and np.isfinite(value) and value > 0:
+                if not (np.isfinite(low) and np.isfinite(high) and low > 0):
+                    # Point-only artifact: fixed band by make tier
+                    _, variance = tier(car.get('make'))
+                    low, high = value * (1 - variance), value * (1 + variance)
+                result = {
+                    'value': round(value),
+                    'low': round(low),
+                    'high': round(high),
+                    'currency': 'JOD',
+                    'source': 'model',
+                }
+            else:
+                result = heuristic_estimate(car.get('make'), car.get('model'), car.get('year'), car.get('specs'))
+            results[i] = result
+            computed[keys[i]] = result
+
+        if computed and PRICE_ESTIMATE_CACHE_SIZE > 0:
+            with self._memo_lock:
+                for key, result in computed.items():
+                    self._memo[key] = dict(result)
+                while len(self._memo) > PRICE_ESTIMATE_CACHE_SIZE:
+                    self._memo.popitem(last=False)
+        return results
+
+    def estimate(self, make, model, year, specs):
+        return self.estimate_batch([{'make': make, 'model': model, 'year': year, 'specs': specs}])[0]
+
+    def stats(self):
+        current = self._current
+        with self._latency_lock:
+            latency = {version: stats.summary() for version, stats in self._latency.items()}
+        return {
+            'active_version': current.version if current else None,
+            'quantiles': bool(current and current.quantile_models),
+            'source': 'manifest' if current and current.path != self.path else ('legacy' if current else 'heuristic'),
+            'loaded_at': self.loaded_at,
+            'load_error': self.load_error,
+            'latency': latency,
+        }
+
+
+price_model = PriceModel()
@@ -0,0 +1,174 @@
+"""
+Buffered listing view tracking.
+
+``GET /api/cars/<id>`` only bumps an in-process counter. A background thread
+flushes the accumulated counts every ``VIEW_FLUSH_INTERVAL`` seconds into the
+per-car, per-day ``car_views`` table with one batched upsert, so the read path
+never waits on a database write. Upserts are additive, so every gunicorn
+worker can keep its own buffer and flush independently.
+
+A failed flush puts its counters back for the next one. After
+``VIEW_FLUSH_MAX_ATTEMPTS`` failures in a row the batch is written one row at
+a time and the rows that still fail are dropped, so one bad counter cannot
+keep the whole buffer from being written.
+"""
+
+import os
+import atexit
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+
+from ..db import get_db
+from ..log import get_logger
+
+VIEW_FLUSH_INTERVAL = int(os.environ.get('VIEW_FLUSH_INTERVAL', '30'))
+# Flush early when this many (car, day) counters are waiting
+VIEW_FLUSH_MAX_PENDING = int(os.environ.get('VIEW_FLUSH_MAX_PENDING', '5000'))
+VIEW_FLUSH_MAX_ATTEMPTS = int(os.environ.get('VIEW_FLUSH_MAX_ATTEMPTS', '3'))
+
+log = get_logger('Views')
+
+UPSERT_SQL = '''
+    INSERT INTO car_views (car_id, view_date, views) VALUES (?, ?, ?)
+    ON CONFLICT (car_id, view_date) DO UPDATE SET views = car_views.views + excluded.views
+'''
+
+
+class ViewTracker:
+    def __init__(self, flush_interval=VIEW_FLUSH_INTERVAL, max_pending=VIEW_FLUSH_MAX_PENDING,
+                 max_attempts=VIEW_FLUSH_MAX_ATTEMPTS):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self._pending = Counter()
+        self._failed_flushes = 0
+        self._lock = threading.Lock()
+        # Held from snapshot to commit, so forget() never runs while a flush is writing
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._app = None
+        self._thread = None
+        self._pid = None
+
+    def init_app(self, app):
+        self._app = app
+        app.extensions['view_tracker'] = self
+        atexit.register(self.flush)
+
+    def _ensure_worker(self):
+        """Start the flush thread lazily, and again after a fork (gunicorn workers)."""
+        pid = os.getpid()
+        if self._thread is not None and self._thread.is_alive() and self._pid == pid:
+            return
+        if self._pid is not None and self._pid != pid:
+            # Counters inherited from the parent process belong to the parent
+            self._pending.clear()
+        self._pid = pid
+        self._thread = threading.Thread(target=self._run, name='view-tracker-flush', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                log.exception('Flush thread error: %s', e)
+
+    def record(self, car_id):
+        """Count one view of a car. Never touches the database."""
+        day = datetime.now(timezone.utc).date().isoformat()
+        with self._lock:
+            self._ensure_worker()
+            self._pending[(int(car_id), day)] += 1
+            overflow = len(self._pending) >= self.max_pending
+        if overflow:
+            self._wake.set()
+
+    def flush(self):
+        """Write all buffered counters in one batched upsert. Returns views written."""
+        if self._app is None:
+            return 0
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, Counter()
+
+            rows = [(car_id, day, count) for (car_id, day), count in batch.items()]
+            try:
+                with self._app.app_context():
+                    db = get_db()
+                    db.executemany(UPSERT_SQL, rows)
+                    db.commit()
+            except Exception as e:
+                self._failed_flushes += 1
+                if self._failed_flushes < self.max_attempts:
+                    log.warning('Flush failed, re-queueing %d counters: %s', len(rows), e)
+                    with self._lock:
+                        self._pending.update(batch)
+                    return 0
+                log.warning('Flush failed %d times, writing row by row: %s', self._failed_flushes, e)
+                return self._flush_rows(rows)
+            self._failed_flushes = 0
+            return sum(batch.values())
+
+    def _flush_rows(self, rows):
+        """Upsert each counter on its own; counters that still fail are dropped."""
+        written = dropped = 0
+        with self._app.app_context():
+            try:
+                db = get_db()
+            except Exception as e:
+                # No connection at all: nothing is wrong with the counters, keep them
+                log.warning('Database unavailable, re-queueing %d counters: %s', len(rows), e)
+                with self._lock:
+                    self._pending.update({(car_id, day): count for car_id, day, count in rows})
+                return 0
+            for row in rows:
+                try:
+                    db.execute(UPSERT_SQL, row)
+                    db.commit()
+                    written += row[2]
+                except Exception as e:
+                    log.warning('Dropping %d views of car %s on %s: %s', row[2], row[0], row[1], e)
+                    dropped += row[2]
+                    try:
+                        db.rollback()
+                    except Exception:
+                        pass
+        self._failed_flushes = 0
+        if dropped:
+            log.warning('Wrote %d views row by row, dropped %d', written, dropped)
+        return written
+
+    def pending_views(self, car_ids):
+        """Views recorded by this worker that have not been flushed yet."""
+        wanted = {int(car_id) for car_id in car_ids}
+        with self._lock:
+            return sum(count for (car_id, _), count in self._pending.items() if car_id in wanted)
+
+    def total_views(self, db, car_ids):
+        """Persisted plus still-buffered views for the given cars."""
+        if not car_ids:
+            return 0
+        placeholders = ','.join(['?'] * len(car_ids))
+        row = db.execute(
+            f'SELECT COALESCE(SUM(views), 0) as total FROM car_views WHERE car_id IN ({placeholders})',
+            list(car_ids)
+        ).fetchone()
+        persisted = int(row['total']) if row and row['total'] else 0
+        return persisted + self.pending_views(car_ids)
+
+    def forget(self, db, car_id):
+        """Drop counters for a deleted car (caller commits)."""
+        # Waits for an in-flight flush, so its rows cannot land after the DELETE below
+        with self._flush_lock, self._lock:
+            for key in [k for k in self._pending if k[0] == int(car_id)]:
+                del self._pending[key]
+        db.execute('DELETE FROM car_views WHERE car_id = ?', (car_id,))
+
+
+view_tracker = ViewTracker()
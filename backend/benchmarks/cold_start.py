@@ -0,0 +1,93 @@
+"""Measure IntelliWheels backend cold-start time.
+
+Each run starts a fresh interpreter (like a new gunicorn worker) and records:
+  import_s        time to import ``app`` (module import plus the create_app() it runs)
+  create_app_s    a second create_app() call with every module already imported
+  first_request_s the first GET /api/health through the test client
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+CHILD_SCRIPT = r"""
+import json, time, contextlib, io
+t0 = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    import app as app_module
+    t1 = time.perf_counter()
+    app = app_module.create_app()
+    t2 = time.perf_counter()
+    app.test_client().get('/api/health')
+    t3 = time.perf_counter()
+print(json.dumps({'import_s': t1 - t0, 'create_app_s': t2 - t1, 'first_request_s': t3 - t2}))
+"""
+
+
+def run_once(env: Dict[str, str]) -> Dict[str, float]:
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT],
+        cwd=BASE_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def summarize(samples: List[Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    summary = {}
+    for metric in samples[0]:
+        values = sorted(s[metric] for s in samples)
+        summary[metric] = {
+            "min_ms": round(values[0] * 1000, 1),
+            "median_ms": round(statistics.median(values) * 1000, 1),
+            "max_ms": round(values[-1] * 1000, 1),
+        }
+    return summary
+
+
+def main(runs: int, init_mode: str, as_json: bool) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env.setdefault("DATABASE_PATH", str(Path(tmp) / "bench.db"))
+        if init_mode:
+            env["AI_INIT_MODE"] = init_mode
+        # Warm-up run creates the SQLite schema so later runs measure a normal boot
+        run_once(env)
+        samples = [run_once(env) for _ in range(runs)]
+
+    summary = summarize(samples)
+    if as_json:
+        print(json.dumps({"runs": runs, "ai_init_mode": init_mode or "default", "metrics": summary}, indent=2))
+        return
+
+    print(f"Cold start over {runs} runs (AI_INIT_MODE={init_mode or 'default'})")
+    print(f"{'metric':<18}{'min':>10}{'median':>10}{'max':>10}")
+    for metric, stats in summary.items():
+        print(f"{metric:<18}{stats['min_ms']:>8.1f}ms{stats['median_ms']:>8.1f}ms{stats['max_ms']:>8.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark create_app() cold start")
+    parser.add_argument("--runs", type=int, default=5, help="Number of fresh interpreters to time")
+    parser.add_argument(
+        "--init-mode",
+        choices=["background", "lazy", "eager"],
+        default=None,
+        help="AI_INIT_MODE for the child processes (default: environment or 'background')",
+    )
+    parser.add_argument("--json", action="store_true", help="Print machine-readable output")
+    args = parser.parse_args()
+
+    main(args.runs, args.init_mode, args.json)
@@ -0,0 +1,98 @@
+"""Break down the import time of the IntelliWheels backend.
+
+Runs ``python -X importtime -c "import app"`` (which also runs create_app())
+in a fresh interpreter and prints the slowest modules plus a per-package
+roll-up. ``--compare`` runs it twice, with LAZY_IMPORTS=1 and LAZY_IMPORTS=0,
+to show what deferring the optional dependencies saves.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# "import time:       412 |       1203 |     flask.app"
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+ImportRow = Tuple[str, int, int, int]  # module, self_us, cumulative_us, depth
+
+
+def profile_imports(env: Dict[str, str]) -> List[ImportRow]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=BASE_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows: List[ImportRow] = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return rows
+
+
+def by_package(rows: List[ImportRow]) -> Dict[str, int]:
+    """Total self time per top-level package, in microseconds."""
+    totals: Dict[str, int] = defaultdict(int)
+    for module, self_us, _, _ in rows:
+        totals[module.split(".")[0]] += self_us
+    return dict(totals)
+
+
+def print_report(title: str, rows: List[ImportRow], top: int) -> None:
+    total_us = sum(r[1] for r in rows)
+    print(f"\n== {title}: {len(rows)} modules, {total_us / 1000:.1f}ms total import time ==")
+
+    print(f"\nSlowest modules by cumulative time (top {top}):")
+    print(f"{'cumulative':>12}{'self':>10}  module")
+    for module, self_us, cumulative_us, depth in sorted(rows, key=lambda r: r[2], reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:>10.1f}ms{self_us / 1000:>8.1f}ms  {'  ' * min(depth, 6)}{module}")
+
+    print(f"\nSelf time by top-level package (top {top}):")
+    packages = sorted(by_package(rows).items(), key=lambda item: item[1], reverse=True)
+    for package, self_us in packages[:top]:
+        share = 100.0 * self_us / total_us if total_us else 0.0
+        print(f"{self_us / 1000:>10.1f}ms {share:>5.1f}%  {package}")
+
+
+def main(top: int, compare: bool) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env.setdefault("DATABASE_PATH", str(Path(tmp) / "profile.db"))
+        # Keep the background AI init thread out of the measurement
+        env.setdefault("AI_INIT_MODE", "lazy")
+
+        modes = ["1", "0"] if compare else [env.get("LAZY_IMPORTS", "1")]
+        totals = {}
+        for lazy in modes:
+            env["LAZY_IMPORTS"] = lazy
+            profile_imports(env)  # warm the bytecode cache and the SQLite schema
+            rows = profile_imports(env)
+            label = "lazy imports" if lazy != "0" else "eager imports"
+            totals[label] = sum(r[1] for r in rows)
+            print_report(label, rows, top)
+
+    if compare:
+        lazy_ms, eager_ms = totals["lazy imports"] / 1000, totals["eager imports"] / 1000
+        print(f"\nLazy imports save {eager_ms - lazy_ms:.1f}ms ({eager_ms:.1f}ms -> {lazy_ms:.1f}ms)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile backend import time")
+    parser.add_argument("--top", type=int, default=20, help="Rows to show per table")
+    parser.add_argument("--compare", action="store_true", help="Compare LAZY_IMPORTS=1 against LAZY_IMPORTS=0")
+    args = parser.parse_args()
+
+    main(args.top, args.compare)
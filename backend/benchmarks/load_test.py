@@ -0,0 +1,343 @@
+"""Scripted traffic against the IntelliWheels API, with latency percentiles.
+
+Runs ``--concurrency`` virtual users (threads) for ``--duration`` seconds.
+Each user logs in as a seeded ``bench_user_<n>`` (see seed_data.py) and
+sends requests drawn from a weighted traffic mix. The report gives count,
+errors, throughput and p50/p95/p99 latency per endpoint.
+
+Targets:
+  (default)    an in-process app on a temporary SQLite database, seeded with
+               ``--seed-cars`` listings. This is the real Flask app and
+               routes, dispatched through the test client without a network.
+  --database   an existing, already seeded SQLite file (or DATABASE_URL)
+  --url        a running server, e.g. gunicorn on http://localhost:5000
+
+The rate limiter counts requests per X-Forwarded-For address. By default
+every request gets its own address, so the run measures capacity and not
+the limits. ``--ip-pool N`` shares N addresses between all requests.
+
+    python benchmarks/load_test.py --mix browse --concurrency 8 --duration 30
+    python benchmarks/load_test.py --url http://localhost:5000 --mix mixed --json
+"""
+from __future__ import annotations
+
+import argparse
+import atexit
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from seed_data import BENCH_PASSWORD, BENCH_USER_PREFIX, CATALOG, load_app, seed  # noqa: E402
+
+Request = Tuple[str, str, str, Optional[dict]]  # label, method, path, JSON body
+
+SEARCH_QUERIES = [
+    "family SUV under 20000", "fuel efficient sedan", "electric car", "Toyota Land Cruiser",
+    "sports coupe V8", "cheap first car", "hybrid with low mileage", "7 seater for desert trips",
+]
+
+
+class InProcessClient:
+    """The app's test client; one per thread."""
+
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def request(self, method: str, path: str, headers: Dict[str, str], body: Optional[dict]):
+        started = time.perf_counter()
+        response = self._client.open(path, method=method, headers=headers, json=body)
+        data = response.get_data()
+        return response.status_code, time.perf_counter() - started, data
+
+
+class HttpClient:
+    """Keep-alive HTTP session against a running server."""
+
+    def __init__(self, base_url: str):
+        import requests
+
+        self._session = requests.Session()
+        self._base_url = base_url.rstrip("/")
+
+    def request(self, method: str, path: str, headers: Dict[str, str], body: Optional[dict]):
+        started = time.perf_counter()
+        response = self._session.request(method, self._base_url + path, headers=headers, json=body, timeout=60)
+        data = response.content
+        return response.status_code, time.perf_counter() - started, data
+
+
+class VirtualUser:
+    def __init__(self, client, rng: random.Random, users: int, car_ids: List[int], ip_for: Callable[[], str]):
+        self.client = client
+        self.rng = rng
+        self.users = users
+        self.car_ids = car_ids
+        self.ip_for = ip_for
+        self.token = None
+        self.conversations: List[dict] = []
+
+    def send(self, method: str, path: str, body: Optional[dict] = None):
+        headers = {"X-Forwarded-For": self.ip_for()}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        return self.client.request(method, path, headers, body)
+
+    def login_request(self) -> Request:
+        username = f"{BENCH_USER_PREFIX}{self.rng.randrange(self.users)}"
+        return "POST /api/auth/login", "POST", "/api/auth/login", {"username": username, "password": BENCH_PASSWORD}
+
+    def handle(self, label: str, status: int, data: bytes) -> None:
+        """Keep the session state (token, conversations) that later requests use."""
+        if status != 200 or label not in ("POST /api/auth/login", "GET /api/messages/conversations"):
+            return
+        payload = json.loads(data)
+        if label == "POST /api/auth/login":
+            self.token = payload.get("token")
+            self.conversations = []
+        else:
+            self.conversations = payload.get("conversations", [])
+
+
+def cars_list(user: VirtualUser) -> Request:
+    return "GET /api/cars", "GET", f"/api/cars?limit=24&offset={user.rng.randrange(0, 480, 24)}", None
+
+
+def cars_filtered(user: VirtualUser) -> Request:
+    make = user.rng.choice(list(CATALOG))
+    sort = "&sort=deal" if user.rng.random() < 0.3 else ""
+    return "GET /api/cars?make=", "GET", f"/api/cars?limit=24&make={make}{sort}", None
+
+
+def car_detail(user: VirtualUser) -> Request:
+    return "GET /api/cars/<id>", "GET", f"/api/cars/{user.rng.choice(user.car_ids)}", None
+
+
+def car_reviews(user: VirtualUser) -> Request:
+    return "GET /api/reviews/car/<id>", "GET", f"/api/reviews/car/{user.rng.choice(user.car_ids)}", None
+
+
+def semantic_search(user: VirtualUser) -> Request:
+    query = user.rng.choice(SEARCH_QUERIES).replace(" ", "+")
+    return "GET /api/semantic-search", "GET", f"/api/semantic-search?q={query}&limit=6", None
+
+
+def login(user: VirtualUser) -> Request:
+    return user.login_request()
+
+
+def verify(user: VirtualUser) -> Request:
+    return "GET /api/auth/verify", "GET", "/api/auth/verify", None
+
+
+def conversations(user: VirtualUser) -> Request:
+    return "GET /api/messages/conversations", "GET", "/api/messages/conversations", None
+
+
+def conversation(user: VirtualUser) -> Request:
+    if not user.conversations:
+        return conversations(user)
+    thread = user.rng.choice(user.conversations)
+    return "GET /api/messages/conversations/<id>", "GET", f"/api/messages/conversations/{thread['id']}", None
+
+
+def unread_count(user: VirtualUser) -> Request:
+    return "GET /api/messages/unread-count", "GET", "/api/messages/unread-count", None
+
+
+def send_message(user: VirtualUser) -> Request:
+    if not user.conversations:
+        return conversations(user)
+    thread = user.rng.choice(user.conversations)
+    body = {"recipient_id": thread["other_user_id"], "listing_id": thread["listing_id"],
+            "content": "Is this still available? (load test)"}
+    return "POST /api/messages/send", "POST", "/api/messages/send", body
+
+
+# mix -> [(step, weight)]
+MIXES: Dict[str, List[Tuple[Callable[[VirtualUser], Request], int]]] = {
+    "browse": [(cars_list, 50), (cars_filtered, 20), (car_detail, 25), (car_reviews, 5)],
+    "search": [(semantic_search, 80), (car_detail, 20)],
+    "auth": [(login, 20), (verify, 80)],
+    "messages": [(conversations, 35), (conversation, 35), (unread_count, 20), (send_message, 10)],
+    "mixed": [
+        (cars_list, 25), (cars_filtered, 10), (car_detail, 20), (car_reviews, 5), (semantic_search, 10),
+        (verify, 10), (login, 2), (conversations, 6), (conversation, 5), (unread_count, 5), (send_message, 2),
+    ],
+}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.statuses: Dict[int, int] = defaultdict(int)
+        self.enabled = False
+
+    def record(self, label: str, status: int, seconds: float) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.latencies[label].append(seconds)
+            self.statuses[status] += 1
+            if status >= 400:
+                self.errors[label] += 1
+
+    def summary(self, wall_s: float) -> Dict[str, Dict[str, float]]:
+        rows = {}
+        everything: List[float] = []
+        total_errors = 0
+        for label, values in sorted(self.latencies.items()):
+            everything.extend(values)
+            total_errors += self.errors[label]
+            rows[label] = self._row(sorted(values), self.errors[label], wall_s)
+        rows["TOTAL"] = self._row(sorted(everything), total_errors, wall_s)
+        return rows
+
+    @staticmethod
+    def _row(values: List[float], errors: int, wall_s: float) -> Dict[str, float]:
+        return {
+            "count": len(values),
+            "errors": errors,
+            "rps": round(len(values) / wall_s, 1) if wall_s else 0.0,
+            "mean_ms": round(sum(values) / len(values) * 1000, 2) if values else 0.0,
+            "p50_ms": round(percentile(values, 50) * 1000, 2),
+            "p95_ms": round(percentile(values, 95) * 1000, 2),
+            "p99_ms": round(percentile(values, 99) * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2) if values else 0.0,
+        }
+
+
+def make_ip_source(pool: int, rng: random.Random) -> Callable[[], str]:
+    if pool <= 0:
+        return lambda: f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+    addresses = [f"10.{n // 65536 % 256}.{n // 256 % 256}.{n % 256}" for n in range(1, pool + 1)]
+    return lambda: rng.choice(addresses)
+
+
+def run_user(index: int, make_client, args, car_ids: List[int], recorder: Recorder, stop: threading.Event) -> None:
+    rng = random.Random(args.seed * 1000 + index)
+    user = VirtualUser(make_client(), rng, args.users, car_ids, make_ip_source(args.ip_pool, rng))
+    steps, weights = zip(*MIXES[args.mix])
+
+    label, method, path, body = user.login_request()
+    status, seconds, data = user.send(method, path, body)
+    recorder.record(label, status, seconds)
+    user.handle(label, status, data)
+    if args.mix in ("messages", "mixed"):
+        label, method, path, body = conversations(user)
+        status, seconds, data = user.send(method, path, body)
+        user.handle(label, status, data)
+
+    while not stop.is_set():
+        label, method, path, body = rng.choices(steps, weights)[0](user)
+        try:
+            status, seconds, data = user.send(method, path, body)
+        except Exception:
+            status, seconds, data = 599, 0.0, b""
+        recorder.record(label, status, seconds)
+        user.handle(label, status, data)
+        if args.think_ms:
+            time.sleep(rng.expovariate(1000 / args.think_ms))
+
+
+def fetch_car_ids(make_client) -> List[int]:
+    status, _, data = make_client().request("GET", "/api/cars?limit=1000", {}, None)
+    if status != 200:
+        raise SystemExit(f"GET /api/cars returned {status}; is the target seeded?")
+    payload = json.loads(data)
+    ids = [car["id"] for car in payload.get("cars", payload.get("data", []))]
+    if not ids:
+        raise SystemExit("The target has no cars; run seed_data.py first")
+    return ids
+
+
+def main(args) -> None:
+    tmp = None
+    if args.url:
+        make_client = lambda: HttpClient(args.url)  # noqa: E731
+    else:
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+        database = args.database
+        if not database and not os.environ.get("DATABASE_URL"):
+            tmp = tempfile.TemporaryDirectory()
+            # Registered before the app's own atexit flushes, so it runs after them
+            atexit.register(tmp.cleanup)
+            database = str(Path(tmp.name) / "load.db")
+        app = load_app(database)
+        if tmp is not None:
+            counts = seed(app, cars=args.seed_cars, users=args.users, favorites=args.seed_cars,
+                          reviews=args.seed_cars // 2, conversations=args.users * 2, messages=args.users * 10,
+                          seed_value=args.seed)
+            if not args.json:
+                print(f"Seeded {counts['cars']} cars, {counts['users']} users in {counts['elapsed_s']}s")
+        make_client = lambda: InProcessClient(app)  # noqa: E731
+
+    car_ids = fetch_car_ids(make_client)
+    recorder = Recorder()
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=run_user, args=(i, make_client, args, car_ids, recorder, stop), daemon=True)
+        for i in range(args.concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.warmup)
+    recorder.enabled = True
+    started = time.perf_counter()
+    time.sleep(args.duration)
+    recorder.enabled = False
+    wall_s = time.perf_counter() - started
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=60)
+
+    summary = recorder.summary(wall_s)
+    target = args.url or "in-process"
+    if args.json:
+        print(json.dumps({
+            "target": target, "mix": args.mix, "concurrency": args.concurrency, "duration_s": round(wall_s, 2),
+            "statuses": {str(k): v for k, v in sorted(recorder.statuses.items())}, "endpoints": summary,
+        }, indent=2))
+        return
+
+    print(f"{args.mix} mix, {args.concurrency} users, {wall_s:.1f}s against {target}")
+    print(f"{'endpoint':<38}{'count':>8}{'err':>6}{'req/s':>9}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for label, row in summary.items():
+        print(f"{label:<38}{row['count']:>8}{row['errors']:>6}{row['rps']:>9.1f}"
+              f"{row['p50_ms']:>8.1f}ms{row['p95_ms']:>8.1f}ms{row['p99_ms']:>8.1f}ms")
+    print("statuses: " + ", ".join(f"{code}={count}" for code, count in sorted(recorder.statuses.items())))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the IntelliWheels API")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="mixed", help="Traffic mix to replay")
+    parser.add_argument("--concurrency", type=int, default=8, help="Virtual users (Render runs 8 gthread threads)")
+    parser.add_argument("--duration", type=float, default=20.0, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Unmeasured seconds before the measurement")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="Mean pause between a user's requests")
+    parser.add_argument("--url", help="Base URL of a running server instead of an in-process app")
+    parser.add_argument("--database", help="Seeded SQLite file for the in-process app")
+    parser.add_argument("--seed-cars", type=int, default=2000, help="Cars to seed when no database is given")
+    parser.add_argument("--users", type=int, default=200, help="Seeded users to log in as")
+    parser.add_argument("--ip-pool", type=int, default=0, help="Client addresses to share (0: one per request)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="Print machine-readable output")
+    main(parser.parse_args())
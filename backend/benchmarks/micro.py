@@ -0,0 +1,299 @@
+"""Micro-benchmarks for the backend's hot functions, with stored baselines.
+
+Times the helpers that run on nearly every request: row serialization, input
+sanitizing, Postgres SQL translation, session lookup, semantic search
+scoring, price estimates and the rate limiter. Each benchmark is timed like
+``timeit``: calls are batched until one round takes at least ``--min-time``,
+and rounds of all benchmarks are interleaved, with GC disabled. The per-call
+median and minimum are reported. Comparisons use the minimum, the statistic
+least disturbed by other work on the machine. Runs are offline against a
+temporary SQLite database seeded by seed_data.py.
+
+    python benchmarks/micro.py                  # run and print
+    python benchmarks/micro.py --save           # write baselines/micro.json
+    python benchmarks/micro.py --compare        # diff against it; exit 1 on regressions
+
+Baselines depend on the machine. Every run also times a fixed pure-Python
+calibration loop, and ``--normalize`` scales the baseline by the
+calibration ratio, so a baseline saved on one machine can be roughly compared
+on another. For a review, save a baseline on the base branch and compare on
+the PR branch on the same machine.
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from seed_data import BENCH_PASSWORD, BENCH_USER_PREFIX, load_app, seed  # noqa: E402
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baselines" / "micro.json"
+CALIBRATION = "_calibration"
+
+Setup = Callable[["BenchContext"], Callable[[], object]]
+BENCHMARKS: Dict[str, Setup] = {}
+
+
+def benchmark(name: str):
+    """Register ``setup(ctx)``, which returns the zero-argument callable to time."""
+    def decorator(setup: Setup) -> Setup:
+        BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+
+class BenchContext:
+    """A seeded in-process app, an open app context and a logged-in session token."""
+
+    def __init__(self, cars: int):
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+        # No background scoring, job or GC threads competing with the timed code
+        for name in ("DEAL_SCORE_INTERVAL", "JOB_QUEUE_WORKERS", "MEDIA_GC_INTERVAL"):
+            os.environ.setdefault(name, "0")
+        self._tmp = tempfile.TemporaryDirectory()
+        self.app = load_app(str(Path(self._tmp.name) / "micro.db"))
+        seed(self.app, cars=cars, users=50, favorites=cars, reviews=cars // 2, conversations=50, messages=200)
+        response = self.app.test_client().post(
+            "/api/auth/login", json={"username": f"{BENCH_USER_PREFIX}1", "password": BENCH_PASSWORD})
+        self.token = response.get_json()["token"]
+        self._stack = contextlib.ExitStack()
+
+    def __enter__(self) -> "BenchContext":
+        self._stack.enter_context(self.app.app_context())
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stack.close()
+        self._tmp.cleanup()
+
+
+@benchmark(CALIBRATION)
+def bench_calibration(ctx: BenchContext):
+    def loop():
+        total = 0
+        for i in range(1000):
+            total += i * i % 7
+        return total
+    return loop
+
+
+@benchmark("car_row_to_dict")
+def bench_car_row_to_dict(ctx: BenchContext):
+    from app.db import get_db
+    from app.routes.cars import car_row_to_dict
+
+    rows = get_db().execute("SELECT * FROM cars ORDER BY id LIMIT 24").fetchall()
+    return lambda: [car_row_to_dict(row) for row in rows]
+
+
+@benchmark("sanitize_string")
+def bench_sanitize_string(ctx: BenchContext):
+    from app.security import sanitize_string
+
+    value = "  2019 Toyota Land Cruiser <GXR> & V8 - excellent condition, one owner  "
+    return lambda: sanitize_string(value)
+
+
+@benchmark("sanitize_search_query")
+def bench_sanitize_search_query(ctx: BenchContext):
+    from app.security import sanitize_search_query
+
+    value = "land_cruiser 100% <original> paint"
+    return lambda: sanitize_search_query(value)
+
+
+class _RecordingCursor:
+    """Accepts the translated SQL so only the wrapper's own work is timed."""
+
+    def execute(self, sql, params=None):
+        self.sql = sql
+
+    def fetchone(self):
+        return (1,)
+
+
+@benchmark("PostgresCursorWrapper.execute")
+def bench_postgres_translation(ctx: BenchContext):
+    from app.db import PostgresCursorWrapper
+
+    wrapper = PostgresCursorWrapper(_RecordingCursor(), None)
+    statements = [
+        ("SELECT * FROM cars WHERE make = ? AND json_extract(specs, '$.bodyStyle') = ? LIMIT ?", ("BMW", "SUV", 24)),
+        ("INSERT INTO reviews (car_id, user_id, rating, comment) VALUES (?, ?, ?, ?)", (1, 2, 5, "Great")),
+        ("UPDATE cars SET updated_at = CURRENT_TIMESTAMP WHERE id = ?", (1,)),
+        ("INSERT OR IGNORE INTO favorites (user_id, car_id) VALUES (?, ?)", (1, 2)),
+    ]
+
+    def translate_all():
+        for sql, params in statements:
+            wrapper.execute(sql, params)
+    return translate_all
+
+
+@benchmark("get_user_from_token")
+def bench_get_user_from_token(ctx: BenchContext):
+    from app.routes.auth import get_user_from_token
+
+    return lambda: get_user_from_token(ctx.token)
+
+
+@benchmark("semantic_search")
+def bench_semantic_search(ctx: BenchContext):
+    from app.services.ai_service import ai_service
+
+    return lambda: ai_service.semantic_search("family SUV under 20000 with low mileage", 6)
+
+
+@benchmark("estimate_price (memo hit)")
+def bench_estimate_price_cached(ctx: BenchContext):
+    from app.services.ai_service import ai_service
+
+    specs = {"horsepower": 203, "bodyStyle": "Sedan", "engine": "2.5L I4"}
+    ai_service.estimate_price("Toyota", "Camry", 2019, specs)
+    return lambda: ai_service.estimate_price("Toyota", "Camry", 2019, specs)
+
+
+@benchmark("estimate_price (memo miss)")
+def bench_estimate_price_uncached(ctx: BenchContext):
+    from app.services.ai_service import ai_service
+
+    counter = iter(range(10 ** 9))
+    # A new horsepower each call gives a new memo key
+    return lambda: ai_service.estimate_price(
+        "Toyota", "Camry", 2019, {"horsepower": 100 + next(counter) % 10 ** 6 / 1000, "bodyStyle": "Sedan"})
+
+
+@benchmark("rate_limit")
+def bench_rate_limit(ctx: BenchContext):
+    from app.security import rate_limit
+
+    # Steady state for a busy client: a full window of timestamps to prune on every call
+    limited = rate_limit(max_requests=30, window_seconds=60)(lambda: "ok")
+    request_ctx = ctx.app.test_request_context("/api/cars", headers={"X-Forwarded-For": "10.9.8.7"})
+    ctx._stack.enter_context(request_ctx)
+    return limited
+
+
+def calls_per_round(timer: timeit.Timer, min_time: float) -> int:
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2 if number < 1000 else 10
+    return number
+
+
+def summarize(per_call: List[float], number: int) -> Dict[str, float]:
+    return {
+        "median_ns": round(statistics.median(per_call) * 1e9, 1),
+        "min_ns": round(min(per_call) * 1e9, 1),
+        "stdev_ns": round((statistics.stdev(per_call) if len(per_call) > 1 else 0.0) * 1e9, 1),
+        "ops_per_s": round(1 / statistics.median(per_call), 1),
+        "calls_per_round": number,
+    }
+
+
+def run(names: List[str], rounds: int, min_time: float, cars: int) -> Dict[str, Dict[str, float]]:
+    with BenchContext(cars) as ctx:
+        timers = {name: timeit.Timer(BENCHMARKS[name](ctx)) for name in names}
+        numbers = {name: calls_per_round(timer, min_time) for name, timer in timers.items()}
+        samples: Dict[str, List[float]] = {name: [] for name in names}
+        # Rounds are interleaved across benchmarks, so a burst of load on the
+        # machine slows one round of several benchmarks, not every round of one
+        for _ in range(rounds):
+            for name, timer in timers.items():
+                samples[name].append(timer.timeit(numbers[name]) / numbers[name])
+    return {name: summarize(samples[name], numbers[name]) for name in names}
+
+
+def machine_info() -> Dict[str, str]:
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+    }
+
+
+def _format_ns(ns: float) -> str:
+    for unit, scale in (("s", 1e9), ("ms", 1e6), ("us", 1e3)):
+        if ns >= scale:
+            return f"{ns / scale:.2f}{unit}"
+    return f"{ns:.0f}ns"
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: dict, threshold: float,
+            normalize: bool) -> List[dict]:
+    scale = 1.0
+    if normalize and CALIBRATION in baseline["results"] and CALIBRATION in results:
+        scale = results[CALIBRATION]["min_ns"] / baseline["results"][CALIBRATION]["min_ns"]
+    rows = []
+    for name, current in results.items():
+        if name == CALIBRATION:
+            continue
+        base = baseline["results"].get(name)
+        row = {"name": name, "current_ns": current["min_ns"], "baseline_ns": None, "change": None, "status": "new"}
+        if base:
+            expected = base["min_ns"] * scale
+            change = current["min_ns"] / expected - 1
+            status = "SLOWER" if change > threshold else "faster" if change < -threshold else "ok"
+            row.update(baseline_ns=expected, change=round(change, 4), status=status)
+        rows.append(row)
+    return rows
+
+
+def main(args) -> int:
+    names = [name for name in BENCHMARKS if name == CALIBRATION or not args.filter or args.filter in name]
+    results = run(names, args.rounds, args.min_time, args.cars)
+
+    if args.save:
+        path = Path(args.save)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({"machine": machine_info(), "results": results}, indent=2) + "\n")
+
+    report: Optional[List[dict]] = None
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        report = compare(results, baseline, args.threshold, args.normalize)
+
+    if args.json:
+        print(json.dumps({"machine": machine_info(), "results": results, "comparison": report}, indent=2))
+    elif report is None:
+        print(f"{'benchmark':<32}{'median':>12}{'min':>12}{'stdev':>12}{'ops/s':>14}")
+        for name, stats in results.items():
+            print(f"{name:<32}{_format_ns(stats['median_ns']):>12}{_format_ns(stats['min_ns']):>12}"
+                  f"{_format_ns(stats['stdev_ns']):>12}{stats['ops_per_s']:>14,.0f}")
+    else:
+        note = " (baseline normalized by calibration)" if args.normalize else ""
+        print(f"Compared with {args.compare}, threshold {args.threshold:.0%}{note}")
+        print(f"{'benchmark':<32}{'baseline':>12}{'current':>12}{'change':>10}  status")
+        for row in report:
+            baseline_text = _format_ns(row["baseline_ns"]) if row["baseline_ns"] is not None else "-"
+            change_text = f"{row['change']:+.1%}" if row["change"] is not None else "-"
+            print(f"{row['name']:<32}{baseline_text:>12}{_format_ns(row['current_ns']):>12}"
+                  f"{change_text:>10}  {row['status']}")
+
+    if report and any(row["status"] == "SLOWER" for row in report):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark backend hot paths")
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this text")
+    parser.add_argument("--rounds", type=int, default=10, help="Timed rounds per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.05, help="Minimum seconds per round")
+    parser.add_argument("--cars", type=int, default=1000, help="Cars in the seeded database")
+    parser.add_argument("--save", nargs="?", const=str(BASELINE_PATH), help="Write results as the baseline")
+    parser.add_argument("--compare", nargs="?", const=str(BASELINE_PATH), help="Compare with a saved baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Relative slowdown reported as a regression")
+    parser.add_argument("--normalize", action="store_true", help="Scale the baseline by the calibration ratio")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable output")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,275 @@
+"""Fill an IntelliWheels database with synthetic data for load tests.
+
+Generates N car listings with realistic specs, plus users, favorites, reviews
+and message conversations. Rows are written through the app's own database
+layer, so the same run works on SQLite (``--database``) and Postgres
+(``DATABASE_URL``). The output is reproducible for a given ``--seed``.
+
+Seeded rows are tagged (usernames ``bench_user_<n>``, cars with
+``import_key`` ``bench:<n>``). A re-run deletes the previous run's rows
+first and leaves everything else in the database alone. Every seeded user's
+password is ``BENCH_PASSWORD``, so load tests can log in as any of them.
+
+    python benchmarks/seed_data.py --database /tmp/bench.db --cars 20000
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+BENCH_PASSWORD = "bench-password-123"
+BENCH_USER_PREFIX = "bench_user_"
+BENCH_IMPORT_PREFIX = "bench:"
+BATCH_SIZE = 1000
+
+# make -> [(model, body style, base price in JOD, [engines])]
+CATALOG: Dict[str, List[Tuple[str, str, int, List[Tuple[str, int, str]]]]] = {
+    "Toyota": [
+        ("Camry", "Sedan", 19000, [("2.5L I4", 203, "Gasoline"), ("2.5L Hybrid", 208, "Hybrid")]),
+        ("Corolla", "Sedan", 13000, [("1.8L I4", 139, "Gasoline"), ("1.8L Hybrid", 121, "Hybrid")]),
+        ("Land Cruiser", "SUV", 55000, [("3.5L Twin-Turbo V6", 409, "Gasoline")]),
+        ("Hilux", "Pickup", 21000, [("2.7L I4", 164, "Gasoline"), ("2.8L Diesel", 201, "Diesel")]),
+    ],
+    "Hyundai": [
+        ("Elantra", "Sedan", 12000, [("2.0L I4", 147, "Gasoline"), ("1.6L Hybrid", 139, "Hybrid")]),
+        ("Tucson", "SUV", 18000, [("2.5L I4", 187, "Gasoline")]),
+        ("Ioniq 5", "Crossover", 28000, [("Dual Motor", 320, "Electric")]),
+    ],
+    "Kia": [
+        ("Sportage", "SUV", 17000, [("2.4L I4", 181, "Gasoline")]),
+        ("K5", "Sedan", 15000, [("1.6L Turbo I4", 180, "Gasoline")]),
+        ("EV6", "Crossover", 30000, [("Dual Motor", 320, "Electric")]),
+    ],
+    "Nissan": [
+        ("Patrol", "SUV", 45000, [("5.6L V8", 400, "Gasoline")]),
+        ("Sunny", "Sedan", 9000, [("1.5L I4", 98, "Gasoline")]),
+        ("Altima", "Sedan", 16000, [("2.5L I4", 188, "Gasoline")]),
+    ],
+    "BMW": [
+        ("3-Series", "Sedan", 32000, [("2.0L Turbo I4", 255, "Gasoline"), ("3.0L Turbo I6", 382, "Gasoline")]),
+        ("X5", "SUV", 52000, [("3.0L Turbo I6", 375, "Gasoline"), ("4.4L Twin-Turbo V8", 523, "Gasoline")]),
+        ("i4", "Sedan", 45000, [("Single Motor", 335, "Electric")]),
+    ],
+    "Mercedes-Benz": [
+        ("C-Class", "Sedan", 35000, [("2.0L Turbo I4", 255, "Gasoline")]),
+        ("E-Class", "Sedan", 48000, [("3.0L Turbo I6", 362, "Gasoline")]),
+        ("G-Class", "SUV", 110000, [("4.0L Twin-Turbo V8", 577, "Gasoline")]),
+    ],
+    "Ford": [
+        ("Mustang", "Coupe", 30000, [("2.3L EcoBoost I4", 315, "Gasoline"), ("5.0L V8", 480, "Gasoline")]),
+        ("F-150", "Pickup", 38000, [("3.5L EcoBoost V6", 400, "Gasoline")]),
+        ("Explorer", "SUV", 33000, [("2.3L EcoBoost I4", 300, "Gasoline")]),
+    ],
+    "Tesla": [
+        ("Model 3", "Sedan", 32000, [("Single Motor", 283, "Electric"), ("Dual Motor", 425, "Electric")]),
+        ("Model Y", "Crossover", 36000, [("Dual Motor", 384, "Electric")]),
+    ],
+    "Mitsubishi": [
+        ("Pajero", "SUV", 22000, [("3.8L V6", 247, "Gasoline")]),
+        ("Attrage", "Sedan", 7000, [("1.2L I3", 78, "Gasoline")]),
+    ],
+}
+CITIES = ["Amman", "Irbid", "Zarqa", "Aqaba", "Salt", "Madaba", "Jerash", "Mafraq"]
+COLORS = ["White", "Black", "Silver", "Grey", "Blue", "Red", "Beige", "Green"]
+REGIONAL_SPECS = ["GCC", "American", "European", "Korean", "Japanese"]
+DRIVETRAINS = {"Sedan": "FWD", "Coupe": "RWD", "SUV": "AWD", "Crossover": "AWD", "Pickup": "4WD"}
+REVIEW_COMMENTS = [
+    "Great condition, exactly as described.",
+    "Smooth drive and very economical.",
+    "Seller was honest about the service history.",
+    "A bit overpriced for the mileage.",
+    "Comfortable for long trips, strong AC.",
+    "Had some minor scratches but runs perfectly.",
+]
+MESSAGES = [
+    "Is this still available?",
+    "What is your best price?",
+    "Can I see it this weekend?",
+    "Has it been in any accidents?",
+    "Yes, it is still available.",
+    "I can do a small discount for cash.",
+    "Sure, Saturday afternoon works.",
+]
+
+
+def _car_row(rng: random.Random, n: int, owner_id: int, now: datetime) -> tuple:
+    make = rng.choice(list(CATALOG))
+    model, body, base_price, engines = rng.choice(CATALOG[make])
+    engine, horsepower, fuel = rng.choice(engines)
+    year = rng.randint(2008, 2025)
+    age = now.year - year
+    odometer = max(0, int(rng.gauss(age * 18000, 8000)))
+    condition = "new" if age == 0 and odometer < 1000 else "used"
+    # ~12% depreciation a year, +/-15% noise, rounded like a real asking price
+    price = round(base_price * (0.88 ** age) * rng.uniform(0.85, 1.15), -2)
+    transmission = "automatic" if fuel == "Electric" or rng.random() < 0.85 else "manual"
+    color = rng.choice(COLORS)
+    specs = {
+        "bodyStyle": body,
+        "horsepower": horsepower,
+        "engine": engine,
+        "fuelEconomy": "N/A" if fuel == "Electric" else f"{rng.uniform(5.5, 14.0):.1f} L/100km",
+        "drivetrain": DRIVETRAINS[body],
+        "seats": 7 if body == "SUV" and rng.random() < 0.5 else 5,
+        "overview": f"{year} {make} {model} {engine}, {odometer:,} km, {color.lower()} exterior.",
+    }
+    created = now - timedelta(days=rng.randint(0, 365), seconds=rng.randint(0, 86400))
+    return (
+        owner_id, make, model, year, price, "JOD", odometer,
+        f"https://picsum.photos/seed/iw{n}/800/600", specs["overview"], json.dumps(specs),
+        "car", condition, color, rng.choice(COLORS), transmission, fuel.lower(),
+        rng.choice(REGIONAL_SPECS), rng.choice(CITIES), f"{BENCH_IMPORT_PREFIX}{n}",
+        created.strftime("%Y-%m-%d %H:%M:%S"),
+    )
+
+
+def _clear(db) -> None:
+    """Remove the rows of a previous seeding run."""
+    from app.routes.messages import ensure_messages_tables
+
+    ensure_messages_tables()
+    bench_users = f"(SELECT id FROM users WHERE username LIKE '{BENCH_USER_PREFIX}%')"
+    bench_cars = f"(SELECT id FROM cars WHERE import_key LIKE '{BENCH_IMPORT_PREFIX}%')"
+    db.execute(f"DELETE FROM user_messages WHERE conversation_id IN "
+               f"(SELECT id FROM conversations WHERE user1_id IN {bench_users})")
+    db.execute(f"DELETE FROM conversations WHERE user1_id IN {bench_users}")
+    db.execute(f"DELETE FROM reviews WHERE user_id IN {bench_users} OR car_id IN {bench_cars}")
+    db.execute(f"DELETE FROM favorites WHERE user_id IN {bench_users} OR car_id IN {bench_cars}")
+    db.execute(f"DELETE FROM user_sessions WHERE user_id IN {bench_users}")
+    db.execute(f"DELETE FROM cars WHERE import_key LIKE '{BENCH_IMPORT_PREFIX}%'")
+    db.execute(f"DELETE FROM users WHERE username LIKE '{BENCH_USER_PREFIX}%'")
+    db.commit()
+
+
+def _insert(db, sql: str, rows: List[tuple]) -> None:
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.executemany(sql, rows[start:start + BATCH_SIZE])
+        db.commit()
+
+
+def seed(app, cars: int, users: int, favorites: int, reviews: int, conversations: int,
+         messages: int, seed_value: int = 42) -> Dict[str, float]:
+    """Seed the database of ``app``; returns row counts and elapsed time."""
+    from werkzeug.security import generate_password_hash
+    from app.db import get_db
+
+    rng = random.Random(seed_value)
+    now = datetime(2026, 1, 1)
+    started = time.perf_counter()
+    # One hash for every user; hashing per row would dominate the run
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+
+    with app.app_context():
+        db = get_db()
+        _clear(db)
+
+        _insert(db, "INSERT INTO users (username, email, password_hash, role) VALUES (?, ?, ?, ?)", [
+            (f"{BENCH_USER_PREFIX}{n}", f"{BENCH_USER_PREFIX}{n}@bench.example", password_hash,
+             "dealer" if n % 10 == 0 else "user")
+            for n in range(users)
+        ])
+        user_ids = [row["id"] for row in db.execute(
+            f"SELECT id FROM users WHERE username LIKE '{BENCH_USER_PREFIX}%' ORDER BY id").fetchall()]
+        # Dealers own most listings, like the live site
+        sellers = user_ids[::10] or user_ids
+
+        _insert(db, """
+            INSERT INTO cars (owner_id, make, model, year, price, currency, odometer_km, image_url,
+                              description, specs, category, condition, exterior_color, interior_color,
+                              transmission, fuel_type, regional_spec, city, import_key, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [_car_row(rng, n, rng.choice(sellers), now) for n in range(cars)])
+        car_ids = [row["id"] for row in db.execute(
+            f"SELECT id FROM cars WHERE import_key LIKE '{BENCH_IMPORT_PREFIX}%' ORDER BY id").fetchall()]
+
+        favorite_pairs = {(rng.choice(user_ids), rng.choice(car_ids)) for _ in range(favorites)}
+        _insert(db, "INSERT INTO favorites (user_id, car_id) VALUES (?, ?)", sorted(favorite_pairs))
+
+        review_pairs = {(rng.choice(car_ids), rng.choice(user_ids)) for _ in range(reviews)}
+        _insert(db, "INSERT INTO reviews (car_id, user_id, rating, comment) VALUES (?, ?, ?, ?)", [
+            (car_id, user_id, rng.choices([1, 2, 3, 4, 5], weights=[1, 2, 5, 12, 10])[0], rng.choice(REVIEW_COMMENTS))
+            for car_id, user_id in sorted(review_pairs)
+        ])
+        db.execute(f"""
+            UPDATE cars SET
+                reviews = (SELECT COUNT(*) FROM reviews WHERE reviews.car_id = cars.id),
+                rating = (SELECT ROUND(AVG(rating), 1) FROM reviews WHERE reviews.car_id = cars.id)
+            WHERE import_key LIKE '{BENCH_IMPORT_PREFIX}%'
+        """)
+        db.commit()
+
+        # Buyer -> seller threads about one listing each
+        threads = {}
+        for _ in range(conversations):
+            buyer, listing = rng.choice(user_ids), rng.choice(car_ids)
+            seller = rng.choice(sellers)
+            if buyer != seller:
+                threads[(buyer, seller, listing)] = None
+        _insert(db, "INSERT INTO conversations (user1_id, user2_id, listing_id) VALUES (?, ?, ?)", sorted(threads))
+        conversation_rows = db.execute(
+            f"SELECT id, user1_id, user2_id FROM conversations WHERE user1_id IN "
+            f"(SELECT id FROM users WHERE username LIKE '{BENCH_USER_PREFIX}%')"
+        ).fetchall()
+        message_rows = []
+        for row in conversation_rows:
+            for i in range(rng.randint(1, max(1, 2 * messages // max(len(conversation_rows), 1)))):
+                sender = row["user1_id"] if i % 2 == 0 else row["user2_id"]
+                message_rows.append((row["id"], sender, rng.choice(MESSAGES), 1 if rng.random() < 0.7 else 0))
+        _insert(db, "INSERT INTO user_messages (conversation_id, sender_id, content, is_read) VALUES (?, ?, ?, ?)",
+                message_rows)
+
+    return {
+        "users": len(user_ids),
+        "cars": len(car_ids),
+        "favorites": len(favorite_pairs),
+        "reviews": len(review_pairs),
+        "conversations": len(conversation_rows),
+        "messages": len(message_rows),
+        "elapsed_s": round(time.perf_counter() - started, 2),
+    }
+
+
+def load_app(database: str | None):
+    """create_app() for ``database`` (SQLite path; ignored when DATABASE_URL is set), quietly."""
+    if database:
+        os.environ["DATABASE_PATH"] = database
+    os.environ.setdefault("AI_INIT_MODE", "lazy")
+    sys.path.insert(0, str(BASE_DIR))
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as app_module
+        return app_module.create_app()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Seed synthetic IntelliWheels data for load tests")
+    parser.add_argument("--database", help="SQLite file to fill (created if missing); omit to use DATABASE_URL")
+    parser.add_argument("--cars", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--favorites", type=int, default=5000, help="Favorites to create (duplicates dropped)")
+    parser.add_argument("--reviews", type=int, default=3000, help="Reviews to create (duplicates dropped)")
+    parser.add_argument("--conversations", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=5000, help="Approximate total messages")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed; the same seed gives the same data")
+    args = parser.parse_args()
+
+    if not args.database and not os.environ.get("DATABASE_URL"):
+        parser.error("pass --database or set DATABASE_URL")
+    app = load_app(args.database)
+    counts = seed(app, args.cars, args.users, args.favorites, args.reviews,
+                  args.conversations, args.messages, args.seed)
+    print(json.dumps(counts, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,441 @@
+"""Import the Teoalida Middle East / GCC car database dump into ``cars``.
+
+The dump is a phpMyAdmin (MySQL/MariaDB) export: one ``CREATE TABLE`` and
+multi-row ``INSERT ... VALUES (...), (...);`` statements, one row per engine
+version of a model year. The file is tokenized incrementally from a fixed-size
+read buffer, so memory stays flat no matter how large the dump is (the full
+product is far bigger than the bundled sample).
+
+Consecutive rows of the same make/model/year become one listing: the cheapest
+UAE (else KSA) price, the first engine's specs, and every engine version in
+``engines``. Each listing carries an ``import_key`` with a unique index, and
+rows are upserted in batched transactions, so re-running the import updates
+the same cars instead of duplicating them.
+
+    python import_sql_data.py                       # bundled sample
+    python import_sql_data.py data/full-dump.sql --batch-size 1000
+    python import_sql_data.py --dry-run             # parse and report only
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+BASE_DIR = Path(__file__).resolve().parent
+DEFAULT_DUMP = BASE_DIR / "data" / "Middle-East-GCC-Car-Database-by-Teoalida-SAMPLE.sql"
+DEFAULT_TABLE = "middle_east_gcc_car_database_sample"
+DEFAULT_BATCH_SIZE = 500
+READ_SIZE = 1 << 16
+SOURCE = "teoalida-gcc"
+
+# ---------------------------------------------------------------------------
+# Streaming tokenizer for MySQL dumps
+# ---------------------------------------------------------------------------
+
+TOKEN_RE = re.compile(
+    r"""
+      (?P<space>\s+)
+    | (?P<comment>--[^\n]*\n|/\*.*?\*/)
+    | (?P<partial>--|/\*)
+    | (?P<string>'(?:[^'\\]|\\.|'')*')
+    | (?P<ident>`(?:[^`]|``)*`)
+    | (?P<punct>[(),;])
+    | (?P<word>[^\s(),;'`]+)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+MYSQL_ESCAPES = {
+    "0": "\0", "b": "\b", "n": "\n", "r": "\r", "t": "\t", "Z": "\x1a",
+    "'": "'", '"': '"', "\\": "\\", "%": "\\%", "_": "\\_",
+}
+ESCAPE_RE = re.compile(r"\\(.)|''", re.DOTALL)
+
+
+def _unescape(body: str) -> str:
+    return ESCAPE_RE.sub(lambda m: "'" if m.group(1) is None else MYSQL_ESCAPES.get(m.group(1), m.group(1)), body)
+
+
+def tokenize(stream, read_size: int = READ_SIZE) -> Iterator[Tuple[str, Any]]:
+    """
+    Yield ``(kind, value)`` tokens from a text stream: ``str`` (unescaped
+    string literal), ``ident``, ``punct`` and ``word`` (keywords, numbers,
+    NULL). Only the unread tail of the buffer is kept between reads.
+    """
+    buffer = ""
+    pos = 0
+    eof = False
+    while True:
+        match = TOKEN_RE.match(buffer, pos)
+        # A token touching the end of the buffer (or a comment whose end has not
+        # been read yet) may continue in the next read
+        if not eof and (match is None or match.end() == len(buffer) or match.lastgroup == "partial"):
+            chunk = stream.read(read_size)
+            if chunk:
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            eof = True
+            continue
+        if match is None:
+            if pos < len(buffer):
+                raise ValueError(f"Unterminated token near: {buffer[pos:pos + 80]!r}")
+            return
+        kind = match.lastgroup
+        if kind == "partial":
+            return  # unterminated comment at the end of the file
+        pos = match.end()
+        text = match.group()
+        if kind in ("space", "comment"):
+            continue
+        if kind == "string":
+            yield "str", _unescape(text[1:-1])
+        elif kind == "ident":
+            yield "ident", text[1:-1].replace("``", "`")
+        else:
+            yield kind, text
+
+
+def _literal(kind: str, text: str) -> Any:
+    if kind == "str":
+        return text
+    if kind == "word":
+        upper = text.upper()
+        if upper == "NULL":
+            return None
+        if upper in ("TRUE", "FALSE"):
+            return upper == "TRUE"
+        try:
+            return int(text)
+        except ValueError:
+            try:
+                return float(text)
+            except ValueError:
+                return text
+    raise ValueError(f"Unexpected {kind} token {text!r} in VALUES")
+
+
+def iter_insert_rows(stream, table: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Yield one ``{column: value}`` dict per row of every ``INSERT INTO`` in the
+    dump (optionally only for ``table``). Other statements are skipped.
+    """
+    tokens = tokenize(stream)
+    for kind, text in tokens:
+        if kind != "word" or text.upper() not in ("INSERT", "REPLACE"):
+            continue
+        # INSERT [IGNORE] INTO `table` [(`col`, ...)] VALUES (...), (...);
+        kind, text = next(tokens)
+        while kind == "word" and text.upper() in ("IGNORE", "INTO", "LOW_PRIORITY", "DELAYED", "HIGH_PRIORITY"):
+            kind, text = next(tokens)
+        target = text
+        columns: List[str] = []
+        kind, text = next(tokens)
+        if (kind, text) == ("punct", "("):
+            for kind, text in tokens:
+                if (kind, text) == ("punct", ")"):
+                    break
+                if kind in ("ident", "word"):
+                    columns.append(text)
+            kind, text = next(tokens)
+        if kind != "word" or text.upper() not in ("VALUES", "VALUE"):
+            raise ValueError(f"Unsupported INSERT into {target}: expected VALUES, got {text!r}")
+        wanted = table is None or target == table
+
+        row: List[Any] = []
+        in_row = False
+        for kind, text in tokens:
+            if kind == "punct":
+                if text == "(":
+                    row, in_row = [], True
+                elif text == ")":
+                    in_row = False
+                    if wanted:
+                        yield dict(zip(columns, row)) if columns else dict(enumerate(row))
+                elif text == ";":
+                    break
+            elif in_row:
+                row.append(_literal(kind, text))
+            elif kind == "word" and text.upper() == "ON":
+                # ON DUPLICATE KEY UPDATE ...: nothing left to import in this statement
+                for kind, text in tokens:
+                    if (kind, text) == ("punct", ";"):
+                        break
+                break
+
+
+# ---------------------------------------------------------------------------
+# Teoalida columns -> cars
+# ---------------------------------------------------------------------------
+
+PRICE_RE = re.compile(r"(?P<currency>[A-Z]{3})\s*(?P<low>[\d,]+)(?:\s*-\s*(?P<high>[\d,]+))?\s*(?:\((?P<trim>[^)]*)\))?")
+NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+STARS_RE = re.compile(r"star(\d+(?:\.\d+)?)", re.IGNORECASE)
+
+BODY_STYLES = [
+    ("pickup", "Pickup"), ("pick-up", "Pickup"), ("cab", "Pickup"), ("convertible", "Convertible"),
+    ("cabrio", "Convertible"), ("coupe", "Coupe"), ("wagon", "Wagon"), ("touring", "Wagon"),
+    ("hatch", "Hatchback"), ("suv", "SUV"), ("crossover", "SUV"), ("van", "Van"), ("sedan", "Sedan"),
+]
+DRIVETRAINS = ("AWD", "4WD", "4X4", "FWD", "RWD")
+
+
+def _text(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    text = str(value).strip()
+    return text or None
+
+
+def _number(value: Any) -> Optional[float]:
+    match = NUMBER_RE.search(str(value or "").replace(",", ""))
+    return float(match.group()) if match else None
+
+
+def _int(value: Any) -> Optional[int]:
+    number = _number(value)
+    return int(number) if number is not None else None
+
+
+def parse_prices(value: Any) -> List[Dict[str, Any]]:
+    """'AED 61,700 - 67,800 (316i);AED 76,200 (320i);' -> [{'currency', 'low', 'high', 'trim'}, ...]"""
+    prices = []
+    for part in str(value or "").split(";"):
+        match = PRICE_RE.search(part)
+        if not match:
+            continue
+        low = int(match.group("low").replace(",", ""))
+        high = int(match.group("high").replace(",", "")) if match.group("high") else low
+        if low <= 0:
+            continue
+        prices.append({
+            "currency": match.group("currency"),
+            "low": low,
+            "high": max(low, high),
+            "trim": _text(match.group("trim")),
+        })
+    return prices
+
+
+def _stars(value: Any) -> Optional[float]:
+    """Ratings are exported as star image URLs (.../star4.jpg)."""
+    match = STARS_RE.search(str(value or ""))
+    return float(match.group(1)) if match else None
+
+
+def _body_style(value: Any) -> Optional[str]:
+    text = (_text(value) or "").lower()
+    for needle, label in BODY_STYLES:
+        if needle in text:
+            return label
+    return _text(value)
+
+
+def _transmission(gearbox: Any) -> Optional[str]:
+    text = (_text(gearbox) or "").upper()
+    if not text:
+        return None
+    if "CVT" in text:
+        return "cvt"
+    if text.endswith("M") or "MANUAL" in text:
+        return "manual"
+    if text.endswith("A") or "AUTO" in text or "DCT" in text:
+        return "automatic"
+    return "other"
+
+
+def _fuel_type(engine: Any) -> Optional[str]:
+    text = (_text(engine) or "").lower()
+    if "plug" in text:
+        return "plugin_hybrid"
+    if "hybrid" in text:
+        return "hybrid"
+    if "diesel" in text or re.search(r"\btdi?\b|\bcrdi\b|\bd\b", text):
+        return "diesel"
+    if "electric" in text or text.startswith("ev"):
+        return "electric"
+    return "petrol" if text else None
+
+
+def engine_from_row(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    name = _text(row.get("Engine"))
+    if not name:
+        return None
+    drivetrain = next((d for d in DRIVETRAINS if d in name.upper()), None)
+    engine = {
+        "name": name,
+        "gearbox": _text(row.get("Gearbox")),
+        "horsepower": _int(row.get("Power (hp)")),
+        "torqueNm": _int(row.get("Torque (Nm)")),
+        "fuelEconomyL100km": _number(row.get("Fuel Econ (L/100km)")),
+        "acceleration0to100": _text(row.get("0-100 kph (sec)")),
+        "topSpeedKph": _text(row.get("Top speed (kph)")),
+        "drivetrain": "4WD" if drivetrain == "4X4" else drivetrain,
+    }
+    return {key: value for key, value in engine.items() if value is not None}
+
+
+def build_car(rows: List[Dict[str, Any]], source_name: str) -> Optional[Tuple[Any, ...]]:
+    """One listing (UPSERT_SQL parameters) from the engine rows of a model year."""
+    first = rows[0]
+    make, model, year = _text(first.get("Make")), _text(first.get("Model")), _int(first.get("Year"))
+
+    prices = parse_prices(first.get("Price UAE")) or parse_prices(first.get("Price KSA"))
+    cheapest = min(prices, key=lambda p: p["low"]) if prices else None
+
+    engines = []
+    seen = set()
+    for row in rows:
+        engine = engine_from_row(row)
+        key = json.dumps(engine, sort_keys=True) if engine else None
+        if engine and key not in seen:
+            seen.add(key)
+            engines.append(engine)
+    primary = engines[0] if engines else {}
+
+    specs = {
+        "bodyStyle": _body_style(first.get("Body Styles")),
+        "horsepower": primary.get("horsepower"),
+        "engine": primary.get("name"),
+        "torque": f"{primary['torqueNm']} Nm" if primary.get("torqueNm") else None,
+        "fuelEconomy": f"{primary['fuelEconomyL100km']:g} L/100km" if primary.get("fuelEconomyL100km") else None,
+        "drivetrain": primary.get("drivetrain"),
+        "class": _text(first.get("Class")),
+        "origin": _text(first.get("Country of Origin")),
+        "weightKg": _text(first.get("Weight")),
+    }
+    statistics = {
+        "pros": _text(first.get("Good")),
+        "cons": _text(first.get("Bad")),
+        "reliabilityStars": _stars(first.get("Reliability")),
+        "resaleValueStars": _stars(first.get("Resale Value")),
+        "knownProblems": _text(first.get("Known Problems")),
+        "nhtsaFrontalStars": _stars(first.get("NHTSA Driver Frontal Rating")),
+        "euroNcapAdultStars": _stars(first.get("EuroNCAP Overall Adult Rating")),
+        "prices": {
+            "AED": parse_prices(first.get("Price UAE")),
+            "SAR": parse_prices(first.get("Price KSA")),
+        },
+    }
+    images = [url for url in (_text(first.get("Image 1")), _text(first.get("Image 2"))) if url]
+    source_url = next((_text(row.get("URL")) for row in rows if _text(row.get("URL"))), None)
+    ratings = [s for s in (statistics["reliabilityStars"], statistics["resaleValueStars"]) if s is not None]
+
+    import_key = f"{SOURCE}:{make}:{model}:{year}".lower()
+    return (
+        make,
+        model,
+        year,
+        cheapest["low"] if cheapest else None,
+        cheapest["currency"] if cheapest else "AED",
+        images[0] if images else None,
+        json.dumps(images),
+        round(sum(ratings) / len(ratings), 1) if ratings else None,
+        _text(first.get("Overview")),
+        json.dumps({k: v for k, v in specs.items() if v is not None}),
+        json.dumps(engines),
+        json.dumps({k: v for k, v in statistics.items() if v}),
+        json.dumps([{"source": source_name, "url": source_url}] if source_url else [{"source": source_name}]),
+        _transmission(primary.get("gearbox")),
+        _fuel_type(primary.get("name")),
+        cheapest["trim"] if cheapest else None,
+        import_key,
+    )
+
+
+def iter_cars(rows: Iterable[Dict[str, Any]], source_name: str) -> Iterator[Tuple[Any, ...]]:
+    """Group consecutive engine rows by make/model/year (the dump is ordered) into listings."""
+    group: List[Dict[str, Any]] = []
+    group_key = None
+    for row in rows:
+        key = (_text(row.get("Make")), _text(row.get("Model")), _int(row.get("Year")))
+        if not all(key):
+            continue  # notes and blank rows at the top and bottom of the sheet
+        if key != group_key and group:
+            yield build_car(group, source_name)
+            group = []
+        group_key = key
+        group.append(row)
+    if group:
+        yield build_car(group, source_name)
+
+
+# Columns written by the import; everything else (owner, deal score, views...) is left alone
+IMPORT_COLUMNS = [
+    "make", "model", "year", "price", "currency", "image_url", "image_urls", "rating", "description",
+    "specs", "engines", "statistics", "source_sheets", "transmission", "fuel_type", "trim", "import_key",
+]
+UPSERT_SQL = (
+    f"INSERT INTO cars ({', '.join(IMPORT_COLUMNS)}, category, regional_spec) "
+    f"VALUES ({', '.join('?' for _ in IMPORT_COLUMNS)}, 'car', 'gcc') "
+    "ON CONFLICT (import_key) DO UPDATE SET "
+    + ", ".join(f"{column} = excluded.{column}" for column in IMPORT_COLUMNS if column != "import_key")
+    + ", price_scored_at = NULL, updated_at = CURRENT_TIMESTAMP"
+)
+
+
+def import_dump(db, dump_path: Path, table: Optional[str] = DEFAULT_TABLE,
+                batch_size: int = DEFAULT_BATCH_SIZE, dry_run: bool = False) -> Dict[str, Any]:
+    """Stream ``dump_path`` into ``cars``, committing every ``batch_size`` listings."""
+    started = time.perf_counter()
+    imported = 0
+    batch: List[Tuple[Any, ...]] = []
+
+    def flush():
+        nonlocal imported
+        if batch and not dry_run:
+            db.executemany(UPSERT_SQL, batch)
+            db.commit()
+        imported += len(batch)
+        batch.clear()
+
+    with open(dump_path, "r", encoding="utf-8", errors="replace") as stream:
+        try:
+            for car in iter_cars(iter_insert_rows(stream, table), dump_path.stem):
+                batch.append(car)
+                if len(batch) >= batch_size:
+                    flush()
+                    print(f"[Import] {imported} cars...")
+            flush()
+        except Exception:
+            if not dry_run:
+                db.rollback()
+            raise
+
+    return {"cars": imported, "seconds": round(time.perf_counter() - started, 2)}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Import the Teoalida GCC car database SQL dump")
+    parser.add_argument("dump", nargs="?", type=Path, default=DEFAULT_DUMP, help="MySQL dump to import")
+    parser.add_argument("--table", default=DEFAULT_TABLE, help="Table whose INSERTs to import ('' for all)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Listings per transaction")
+    parser.add_argument("--dry-run", action="store_true", help="Parse the dump without writing")
+    args = parser.parse_args()
+
+    if not args.dump.exists():
+        print(f"[Import] Dump not found: {args.dump}")
+        return 1
+    table, batch_size = args.table or None, max(1, args.batch_size)
+
+    if args.dry_run:
+        result = import_dump(None, args.dump, table, batch_size, dry_run=True)
+    else:
+        # Creates the tables and runs migrations (including the import_key index)
+        from app import app
+        from app.db import get_db
+
+        with app.app_context():
+            result = import_dump(get_db(), args.dump, table, batch_size)
+    action = "Parsed" if args.dry_run else "Imported"
+    print(f"[Import] {action} {result['cars']} cars from {args.dump.name} in {result['seconds']}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
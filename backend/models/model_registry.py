@@ -0,0 +1,111 @@
+"""Versioned price model artifacts and the manifest the Flask app polls.
+
+Layout::
+
+    models/price_models/
+        manifest.json                       {"active": "<version>", "versions": {...}}
+        <version>/fair_price_model.joblib   {"pipeline", "quantiles", "metadata"}
+
+Running workers notice a new ``active`` version within PRICE_MODEL_POLL_SECONDS,
+load it in the background and swap it in. Rolling back is just activating an
+older version:
+
+    python models/model_registry.py list
+    python models/model_registry.py activate 20260101T120000Z
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import joblib
+
+BASE_DIR = Path(__file__).resolve().parent
+REGISTRY_DIR = BASE_DIR / "price_models"
+MANIFEST_PATH = REGISTRY_DIR / "manifest.json"
+ARTIFACT_NAME = "fair_price_model.joblib"
+
+
+def load_manifest(manifest_path: Path = MANIFEST_PATH) -> Dict[str, Any]:
+    if not manifest_path.exists():
+        return {"active": None, "versions": {}}
+    return json.loads(manifest_path.read_text())
+
+
+def write_manifest(manifest: Dict[str, Any], manifest_path: Path = MANIFEST_PATH) -> None:
+    """Write via a temp file and rename, so a polling worker never reads half a manifest."""
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=manifest_path.parent, prefix=".manifest.")
+    with os.fdopen(fd, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def new_version() -> str:
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def register(pipeline: Any, metadata: Dict[str, Any], activate: bool = True,
+             version: Optional[str] = None, registry_dir: Path = REGISTRY_DIR,
+             quantiles: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Save a trained pipeline as a new version and (optionally) make it active.
+    ``quantiles`` is ``{"levels": [...], "models": [...]}``: range regressors
+    that take the pipeline's preprocessed features.
+    """
+    version = version or new_version()
+    metadata = {**metadata, "version": version}
+    version_dir = registry_dir / version
+    version_dir.mkdir(parents=True, exist_ok=False)
+    joblib.dump({"pipeline": pipeline, "quantiles": quantiles, "metadata": metadata}, version_dir / ARTIFACT_NAME)
+
+    manifest_path = registry_dir / "manifest.json"
+    manifest = load_manifest(manifest_path)
+    manifest["versions"][version] = {
+        "path": f"{version}/{ARTIFACT_NAME}",
+        "trained_at": metadata.get("trained_at"),
+        "metrics": metadata.get("metrics"),
+        "train_rows": metadata.get("train_rows"),
+    }
+    if activate:
+        manifest["active"] = version
+    write_manifest(manifest, manifest_path)
+    return version
+
+
+def activate(version: str, manifest_path: Path = MANIFEST_PATH) -> None:
+    manifest = load_manifest(manifest_path)
+    if version not in manifest["versions"]:
+        raise SystemExit(f"Unknown version {version}; see 'list'")
+    manifest["active"] = version
+    write_manifest(manifest, manifest_path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage versioned price model artifacts")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="Show registered versions")
+    activate_parser = sub.add_parser("activate", help="Make a version active (deploy or roll back)")
+    activate_parser.add_argument("version")
+    args = parser.parse_args()
+
+    if args.command == "activate":
+        activate(args.version)
+        print(f"✅ Active price model: {args.version}")
+        return
+
+    manifest = load_manifest()
+    for version, entry in sorted(manifest["versions"].items()):
+        marker = "*" if version == manifest.get("active") else " "
+        metrics = entry.get("metrics") or {}
+        print(f"{marker} {version}  rows={entry.get('train_rows')}  mae={metrics.get('mae')}  r2={metrics.get('r2')}"
+              f"  coverage={metrics.get('interval_coverage')}")
+
+
+if __name__ == "__main__":
+    main()
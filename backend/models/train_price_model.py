@@ -1,216 +1,394 @@
 """Utility script for training the IntelliWheels fair-price prediction model.
 
-The script loads the latest listings from ``intelliwheels.db``, performs light feature
-engineering, trains a regression pipeline, and stores the artifact/metrics under
-``models/`` so the Flask app can serve real-time estimates.
+The script streams listings from ``intelliwheels.db`` in chunks, extracts the
+spec fields inside SQLite (``json_extract``/``json_each``) instead of parsing
+JSON row by row in pandas, trains a ``HistGradientBoostingRegressor`` with
+native categorical support, and stores the artifact/metrics under ``models/``
+so the Flask app can serve real-time estimates. Alongside the point model it
+fits quantile regressors (p10/p50/p90) on the same encoded features, which the
+app serves as the fair-price range. Wall time and peak memory are recorded next
+to the accuracy metrics.
 """
 from __future__ import annotations
 
 import argparse
 import json
 import sqlite3
-from dataclasses import dataclass
+import time
+import tracemalloc
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 
 import joblib
 import numpy as np
 import pandas as pd
-from sklearn.compose import ColumnTransformer
-from sklearn.ensemble import GradientBoostingRegressor
-from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
-from sklearn.model_selection import train_test_split
+from pandas.api.types import union_categoricals
+from sklearn.compose import ColumnTransformer, TransformedTargetRegressor
+from sklearn.ensemble import HistGradientBoostingRegressor
+from sklearn.metrics import mean_absolute_error, mean_pinball_loss, mean_squared_error, r2_score
+from sklearn.model_selection import KFold, cross_validate, train_test_split
 from sklearn.pipeline import Pipeline
-from sklearn.preprocessing import OneHotEncoder, StandardScaler
-OHE_KWARGS = {"handle_unknown": "ignore"}
-if "sparse_output" in OneHotEncoder.__init__.__code__.co_varnames:
-    OHE_KWARGS["sparse_output"] = False
-else:
-    OHE_KWARGS["sparse"] = False
+from sklearn.preprocessing import OrdinalEncoder
+
+import model_registry
+
+try:
+    import resource
+    HAS_RESOURCE = True
+except ImportError:  # Windows
+    HAS_RESOURCE = False
 
 
 BASE_DIR = Path(__file__).resolve().parent
 DEFAULT_DB = BASE_DIR.parent / "intelliwheels.db"
 MODEL_PATH = BASE_DIR / "fair_price_model.joblib"
 METRICS_PATH = BASE_DIR / "fair_price_model_metrics.json"
+DEFAULT_CHUNK_SIZE = 50_000
+
+NUMERIC_FEATURES = ["year", "rating", "reviews", "horsepower"]
+CATEGORICAL_FEATURES = ["make", "model", "body_style"]
+# HistGradientBoosting bins categories into at most 255 buckets; rarer ones share one
+MAX_CATEGORIES = 250
+# Served as (low, value, high) of the fair-price range
+QUANTILES = [0.1, 0.5, 0.9]
+
+# Listing prices are in mixed Gulf currencies; the model is trained and served in JOD.
+# Keep in sync with JOD_RATES in app/services/price_model.py.
+PRICE_TO_JOD = {"JOD": 1.0, "USD": 0.709, "AED": 0.193, "SAR": 0.189, "QAR": 0.195, "BHD": 1.886, "KWD": 2.31, "OMR": 1.842}
+
+# Spec fields are pulled out by SQLite's JSON1 functions, one pass per chunk
+QUERY = """
+    SELECT
+        make,
+        model,
+        year,
+        price,
+        UPPER(COALESCE(currency, 'JOD')) AS currency,
+        rating,
+        reviews,
+        CASE WHEN json_valid(specs) THEN json_extract(specs, '$.bodyStyle') END AS body_style,
+        CASE WHEN json_valid(specs) THEN json_extract(specs, '$.horsepower') END AS spec_horsepower,
+        CASE WHEN json_valid(engines) AND json_type(engines) = 'array' THEN (
+            SELECT AVG(CAST(COALESCE(json_extract(value, '$.powerHp'),
+                                     json_extract(value, '$.horsepower'),
+                                     json_extract(value, '$.power')) AS REAL))
+            FROM json_each(engines)
+            WHERE json_type(value) = 'object'
+        ) END AS engine_horsepower
+    FROM cars
+    WHERE price IS NOT NULL AND price > 0
+"""
 
 
-def load_data(db_path: Path) -> pd.DataFrame:
-    """Load the cars table and expand the JSON "specs" column."""
+def _numeric(series: pd.Series) -> pd.Series:
+    """Vectorized '300', 300 or '300 hp' -> 300.0."""
+    as_text = series.astype("string")
+    extracted = as_text.str.replace(",", "", regex=False).str.extract(r"(-?\d+(?:\.\d+)?)", expand=False)
+    return pd.to_numeric(extracted, errors="coerce").astype("float32")
+
+
+def prepare_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Clean one chunk into compact dtypes (float32 numerics, categorical strings)."""
+    rates = chunk["currency"].map(PRICE_TO_JOD)
+    out = pd.DataFrame({
+        "year": pd.to_numeric(chunk["year"], errors="coerce").astype("float32"),
+        "rating": pd.to_numeric(chunk["rating"], errors="coerce").astype("float32"),
+        "reviews": pd.to_numeric(chunk["reviews"], errors="coerce").fillna(0).astype("float32"),
+        "horsepower": _numeric(chunk["spec_horsepower"]).fillna(
+            pd.to_numeric(chunk["engine_horsepower"], errors="coerce").astype("float32")
+        ),
+        "price": (pd.to_numeric(chunk["price"], errors="coerce") * rates).astype("float64"),
+    })
+    for column in CATEGORICAL_FEATURES:
+        values = chunk[column].astype("string").str.strip()
+        if column == "body_style":
+            # Filled before the categorical conversion: a chunk whose data already
+            # says "Unknown" would make cat.add_categories(["Unknown"]) raise
+            values = values.fillna("Unknown")
+        out[column] = values.astype("category")
+    # Drop unknown currencies, and rows without the identifying fields
+    return out.dropna(subset=["make", "model", "year", "price"])
+
+
+def _concat_chunks(chunks: List[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenate chunks while keeping categorical columns categorical."""
+    if len(chunks) == 1:
+        return chunks[0].reset_index(drop=True)
+    columns = {}
+    for column in chunks[0].columns:
+        if isinstance(chunks[0][column].dtype, pd.CategoricalDtype):
+            columns[column] = pd.Series(union_categoricals([c[column] for c in chunks]))
+        else:
+            columns[column] = pd.Series(np.concatenate([c[column].to_numpy() for c in chunks]))
+    return pd.DataFrame(columns)
+
+
+def load_data(db_path: Path, chunk_size: int = DEFAULT_CHUNK_SIZE) -> pd.DataFrame:
+    """Stream the cars table in chunks and return the cleaned feature frame."""
     if not db_path.exists():
         raise FileNotFoundError(f"Database not found at {db_path}")
 
-    query = (
-        "SELECT make, model, year, price, rating, reviews, specs, engines "
-        "FROM cars WHERE price IS NOT NULL AND price > 0"
-    )
+    chunks = []
     with sqlite3.connect(db_path) as conn:
-        df = pd.read_sql_query(query, conn)
-
-    def parse_specs(raw: Any) -> Dict[str, Any]:
-        if raw in (None, "", "null"):
-            return {}
-        if isinstance(raw, dict):
-            return raw
-        try:
-            return json.loads(raw)
-        except json.JSONDecodeError:
-            return {}
-
-    def parse_engines(raw: Any) -> Any:
-        if raw in (None, "", "null"):
-            return []
-        if isinstance(raw, list):
-            return raw
-        try:
-            data = json.loads(raw)
-        except json.JSONDecodeError:
-            return []
-        return data if isinstance(data, list) else []
-
-    def extract_horsepower(rows: Any) -> Any:
-        if not rows:
-            return None
-        values = []
-        for row in rows:
-            if not isinstance(row, dict):
-                continue
-            hp = row.get("powerHp") or row.get("horsepower") or row.get("power")
-            if hp is None:
-                continue
-            try:
-                values.append(float(hp))
-            except (TypeError, ValueError):
-                continue
-        if not values:
-            return None
-        return sum(values) / len(values)
-
-    specs_df = df["specs"].apply(parse_specs).apply(pd.Series)
-    horsepower_from_engines = None
-    if "engines" in df.columns:
-        horsepower_from_engines = (
-            df["engines"].apply(parse_engines).apply(extract_horsepower)
-        )
-        df.drop(columns=["engines"], inplace=True)
-    df = pd.concat([df.drop(columns=["specs"]), specs_df], axis=1)
-
-    df.rename(
-        columns={
-            "bodyStyle": "body_style",
-            "horsepower": "horsepower",
-            "engine": "engine",
-            "fuelEconomy": "fuel_economy",
-        },
-        inplace=True,
-    )
-
-    # Basic cleanup
-    df["body_style"].fillna("Unknown", inplace=True)
-    if "horsepower" in df.columns:
-        df["horsepower"] = pd.to_numeric(df["horsepower"], errors="coerce")
-    else:
-        df["horsepower"] = np.nan
-    if horsepower_from_engines is not None:
-        engine_hp_series = pd.to_numeric(horsepower_from_engines, errors="coerce")
-        df["horsepower"] = df["horsepower"].combine_first(engine_hp_series)
-    df["horsepower"] = pd.to_numeric(df["horsepower"], errors="coerce")
-    df["horsepower"].fillna(df["horsepower"].median(), inplace=True)
-    df["rating"].fillna(df["rating"].median(), inplace=True)
-    df["reviews"].fillna(0, inplace=True)
-    df.dropna(subset=["make", "model", "year", "price"], inplace=True)
-
-    # Ensure numeric types
-    df["year"] = pd.to_numeric(df["year"], errors="coerce")
-    df.dropna(subset=["year"], inplace=True)
+        for chunk in pd.read_sql_query(QUERY, conn, chunksize=chunk_size):
+            prepared = prepare_chunk(chunk)
+            if not prepared.empty:
+                chunks.append(prepared)
+    if not chunks:
+        return pd.DataFrame(columns=NUMERIC_FEATURES + CATEGORICAL_FEATURES + ["price"])
+
+    df = _concat_chunks(chunks)
+    df["horsepower"] = df["horsepower"].fillna(df["horsepower"].median())
+    df["rating"] = df["rating"].fillna(df["rating"].median())
     return df
 
 
-def build_pipeline() -> Pipeline:
-    """Create the preprocessing + regression pipeline."""
-    numeric_features = ["year", "rating", "reviews", "horsepower"]
-    categorical_features = ["make", "model", "body_style"]
+def feature_defaults(df: pd.DataFrame) -> Dict[str, Any]:
+    """Values the server substitutes when a request omits a feature."""
+    def median(column: str, fallback: float) -> float:
+        value = df[column].median()
+        return float(value) if pd.notna(value) else fallback
+
+    return {
+        "year": median("year", 2020.0),
+        "rating": median("rating", 4.5),
+        "reviews": median("reviews", 0.0),
+        "horsepower": median("horsepower", 200.0),
+        "body_style": "Unknown",
+    }
 
-    preprocessing = ColumnTransformer(
+
+def build_preprocessing() -> ColumnTransformer:
+    """Ordinal-encode categoricals (unknown -> missing) and pass numerics through."""
+    encoder = OrdinalEncoder(
+        handle_unknown="use_encoded_value",
+        unknown_value=np.nan,
+        encoded_missing_value=np.nan,
+        max_categories=MAX_CATEGORIES,
+    )
+    return ColumnTransformer(
         transformers=[
-            ("num", StandardScaler(), numeric_features),
-            (
-                "cat",
-                OneHotEncoder(**OHE_KWARGS),
-                categorical_features,
-            ),
+            ("cat", encoder, CATEGORICAL_FEATURES),
+            ("num", "passthrough", NUMERIC_FEATURES),
         ]
     )
 
-    regressor = GradientBoostingRegressor(random_state=42)
+
+def build_regressor(quantile: Optional[float] = None) -> TransformedTargetRegressor:
+    """Gradient-boosted regressor on log-prices; a quantile regressor when ``quantile`` is given."""
+    # Categorical columns come first in the ColumnTransformer output
+    categorical_mask = [True] * len(CATEGORICAL_FEATURES) + [False] * len(NUMERIC_FEATURES)
+    loss_params: Dict[str, Any] = {"loss": "quantile", "quantile": quantile} if quantile is not None else {}
+    regressor = HistGradientBoostingRegressor(
+        categorical_features=categorical_mask,
+        max_iter=300,
+        learning_rate=0.08,
+        early_stopping="auto",
+        random_state=42,
+        **loss_params,
+    )
+    # Prices are right-skewed; fitting log-prices keeps cheap and luxury cars on one scale.
+    # Quantiles survive the monotonic log transform, so the same trick works for the range.
+    return TransformedTargetRegressor(regressor=regressor, func=np.log1p, inverse_func=np.expm1)
+
+
+def build_pipeline() -> Pipeline:
+    """Create the preprocessing + regression pipeline."""
+    model = build_regressor()
 
     pipeline = Pipeline(
         steps=[
-            ("preprocess", preprocessing),
-            ("regressor", regressor),
+            ("preprocess", build_preprocessing()),
+            ("regressor", model),
         ]
     )
     return pipeline
 
 
+def peak_rss_mb() -> float | None:
+    """Peak resident memory of this process and its finished children (CV workers)."""
+    if not HAS_RESOURCE:
+        return None
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, children) / 1024, 1)  # ru_maxrss is KiB on Linux
+
+
 @dataclass
 class TrainingResult:
     pipeline: Pipeline
     metrics: Dict[str, float]
     train_rows: int
+    performance: Dict[str, Any] = field(default_factory=dict)
+    feature_defaults: Dict[str, Any] = field(default_factory=dict)
+    quantile_models: List[TransformedTargetRegressor] = field(default_factory=list)
+
+
+def train_quantiles(pipeline: Pipeline, X_train: pd.DataFrame, y_train: np.ndarray,
+                    X_val: pd.DataFrame, y_val: np.ndarray):
+    """
+    Fit one quantile regressor per level on the pipeline's already-fitted
+    preprocessing, so the features are encoded once for all of them (here and
+    when serving). Returns the models and their holdout metrics.
+    """
+    preprocess = pipeline.named_steps["preprocess"]
+    encoded_train = preprocess.transform(X_train)
+    encoded_val = preprocess.transform(X_val)
+
+    models = []
+    predictions = []
+    for quantile in QUANTILES:
+        model = build_regressor(quantile)
+        model.fit(encoded_train, y_train)
+        models.append(model)
+        predictions.append(model.predict(encoded_val))
+    # Independently fitted quantiles can cross on a few rows; the server sorts them the same way
+    predictions = np.sort(np.column_stack(predictions), axis=1)
 
-
-def train_model(df: pd.DataFrame) -> TrainingResult:
-    """Train the pipeline and compute metrics."""
-    target = df["price"].values
-    features = df.drop(columns=["price"])
+    metrics = {
+        f"pinball_p{round(q * 100)}": float(mean_pinball_loss(y_val, predictions[:, i], alpha=q))
+        for i, q in enumerate(QUANTILES)
+    }
+    low, high = predictions[:, 0], predictions[:, -1]
+    metrics["interval_coverage"] = float(np.mean((y_val >= low) & (y_val <= high)))
+    metrics["interval_nominal"] = round(QUANTILES[-1] - QUANTILES[0], 4)
+    metrics["interval_median_width_pct"] = float(np.median((high - low) / np.maximum(predictions[:, 1], 1e-9)))
+    return models, metrics
+
+
+def train_model(df: pd.DataFrame, cv_folds: int = 5, cv_jobs: int = -1, quantiles: bool = True) -> TrainingResult:
+    """Cross-validate in parallel, then fit on a train split and compute holdout metrics."""
+    target = df["price"].to_numpy()
+    features = df[NUMERIC_FEATURES + CATEGORICAL_FEATURES]
+    performance: Dict[str, Any] = {}
+    metrics: Dict[str, float] = {}
+
+    if cv_folds >= 2 and len(df) >= cv_folds * 10:
+        start = time.perf_counter()
+        scores = cross_validate(
+            build_pipeline(),
+            features,
+            target,
+            cv=KFold(n_splits=cv_folds, shuffle=True, random_state=42),
+            scoring=("neg_mean_absolute_error", "r2"),
+            n_jobs=cv_jobs,
+        )
+        performance["cv_seconds"] = round(time.perf_counter() - start, 3)
+        metrics["cv_mae"] = float(-scores["test_neg_mean_absolute_error"].mean())
+        metrics["cv_r2"] = float(scores["test_r2"].mean())
+        metrics["cv_r2_std"] = float(scores["test_r2"].std())
 
     X_train, X_val, y_train, y_val = train_test_split(
         features, target, test_size=0.2, random_state=42
     )
 
     pipeline = build_pipeline()
+    start = time.perf_counter()
     pipeline.fit(X_train, y_train)
+    performance["fit_seconds"] = round(time.perf_counter() - start, 3)
 
+    start = time.perf_counter()
     predictions = pipeline.predict(X_val)
-    metrics = {
+    performance["predict_rows_per_second"] = round(len(X_val) / max(time.perf_counter() - start, 1e-9))
+    metrics.update({
         "mae": float(mean_absolute_error(y_val, predictions)),
         "rmse": float(np.sqrt(mean_squared_error(y_val, predictions))),
         "r2": float(r2_score(y_val, predictions)),
-    }
+    })
+
+    quantile_models: List[TransformedTargetRegressor] = []
+    if quantiles:
+        start = time.perf_counter()
+        quantile_models, quantile_metrics = train_quantiles(pipeline, X_train, y_train, X_val, y_val)
+        performance["quantile_fit_seconds"] = round(time.perf_counter() - start, 3)
+        metrics.update(quantile_metrics)
+
+    return TrainingResult(
+        pipeline=pipeline,
+        metrics=metrics,
+        train_rows=len(df),
+        performance=performance,
+        feature_defaults=feature_defaults(df),
+        quantile_models=quantile_models,
+    )
 
-    return TrainingResult(pipeline=pipeline, metrics=metrics, train_rows=len(df))
 
+def persist_artifacts(result: TrainingResult, activate: bool = True) -> None:
+    """Persist the trained pipeline as a new registry version.
 
-def persist_artifacts(result: TrainingResult) -> None:
-    """Persist the trained pipeline and metrics to disk."""
+    The legacy single artifact is rewritten only for an activated version, so a
+    ``--no-activate`` candidate never replaces what older loaders serve.
+    """
     metadata = {
         "trained_at": datetime.now(timezone.utc).isoformat(),
         "metrics": result.metrics,
         "train_rows": result.train_rows,
+        "performance": result.performance,
+        "feature_defaults": result.feature_defaults,
     }
-
-    joblib.dump({"pipeline": result.pipeline, "metadata": metadata}, MODEL_PATH)
-    METRICS_PATH.write_text(json.dumps(metadata, indent=2))
-    print(f"✅ Saved model to {MODEL_PATH}")
+    quantiles = None
+    if result.quantile_models:
+        metadata["quantiles"] = QUANTILES
+        quantiles = {"levels": QUANTILES, "models": result.quantile_models}
+
+    version = model_registry.register(result.pipeline, metadata, activate=activate, quantiles=quantiles)
+    metadata["version"] = version
+    if activate:
+        joblib.dump({"pipeline": result.pipeline, "quantiles": quantiles, "metadata": metadata}, MODEL_PATH)
+        METRICS_PATH.write_text(json.dumps(metadata, indent=2))
+        print(f"✅ Saved model version {version} (active) and {MODEL_PATH}")
+    else:
+        print(f"✅ Saved model version {version} (not activated; {MODEL_PATH} left unchanged)")
     print(f"📊 Metrics: {json.dumps(result.metrics, indent=2)}")
+    print(f"⏱️  Performance: {json.dumps(result.performance, indent=2)}")
 
 
-def main(db_path: Path) -> None:
+def main(db_path: Path, activate: bool = True, chunk_size: int = DEFAULT_CHUNK_SIZE,
+         cv_folds: int = 5, cv_jobs: int = -1, quantiles: bool = True) -> None:
+    tracemalloc.start()
+    started = time.perf_counter()
+
     print(f"📥 Loading data from {db_path}")
-    df = load_data(db_path)
+    df = load_data(db_path, chunk_size)
+    load_seconds = round(time.perf_counter() - started, 3)
     if df.empty:
         raise RuntimeError("No training data available. Populate the cars table first.")
 
     print(f"📈 Training on {len(df)} rows")
-    result = train_model(df)
-    persist_artifacts(result)
+    result = train_model(df, cv_folds=cv_folds, cv_jobs=cv_jobs, quantiles=quantiles)
+
+    _, peak_traced = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result.performance.update({
+        "load_seconds": load_seconds,
+        "wall_seconds": round(time.perf_counter() - started, 3),
+        "peak_traced_mb": round(peak_traced / (1024 * 1024), 1),
+        "peak_rss_mb": peak_rss_mb(),
+        "frame_mb": round(df.memory_usage(deep=True).sum() / (1024 * 1024), 1),
+        "chunk_size": chunk_size,
+    })
+    persist_artifacts(result, activate=activate)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Train the IntelliWheels price model")
     parser.add_argument("--db", type=Path, default=DEFAULT_DB, help="Path to intelliwheels.db")
+    parser.add_argument(
+        "--no-activate",
+        action="store_true",
+        help="Register the new version without making it the one workers serve",
+    )
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows read from SQLite per chunk")
+    parser.add_argument("--cv-folds", type=int, default=5, help="Cross-validation folds (0 to skip)")
+    parser.add_argument("--cv-jobs", type=int, default=-1, help="Parallel CV workers (-1 = all cores)")
+    parser.add_argument(
+        "--no-quantiles",
+        action="store_true",
+        help="Skip the p10/p50/p90 range models (the app falls back to fixed bands)",
+    )
     args = parser.parse_args()
 
-    main(args.db)
+    main(args.db, activate=not args.no_activate, chunk_size=args.chunk_size,
+         cv_folds=args.cv_folds, cv_jobs=args.cv_jobs, quantiles=not args.no_quantiles)
@@ -0,0 +1,37 @@
+"""
+Shared test setup.
+
+Importing ``app`` runs ``create_app()``, so the environment is set up before
+any test module imports it: a throwaway SQLite database and upload folder,
+and no background threads (deal scorer, job workers, media GC).
+"""
+
+import os
+import sys
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix='intelliwheels-tests-')
+os.environ['DATABASE_PATH'] = os.path.join(_tmp, 'test.db')
+os.environ.setdefault('AI_INIT_MODE', 'lazy')
+os.environ.setdefault('DEAL_SCORE_INTERVAL', '0')
+os.environ.setdefault('JOB_QUEUE_WORKERS', '0')
+os.environ.setdefault('MEDIA_GC_INTERVAL', '0')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    from app import create_app
+
+    os.environ['DATABASE_PATH'] = str(tmp_path / 'test.db')
+    app = create_app({'TESTING': True, 'UPLOAD_FOLDER': str(tmp_path / 'uploads')})
+    yield app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
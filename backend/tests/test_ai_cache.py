@@ -0,0 +1,155 @@
+import threading
+import time
+import types
+
+import pytest
+
+from app.services import ai_cache
+from app.services.ai_cache import ResponseCache, prompt_key
+
+
+class StubModel:
+    """Stands in for a Gemini model: counts calls and can hold them until released."""
+
+    def __init__(self, release=None):
+        self.calls = 0
+        self.release = release
+        self._lock = threading.Lock()
+
+    def generate_content(self, parts):
+        with self._lock:
+            self.calls += 1
+            n = self.calls
+        if self.release is not None:
+            assert self.release.wait(5)
+        return types.SimpleNamespace(text=f'answer {n} to {parts[-1]}')
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ai_cache, 'time', types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def _ask(cache, model, prompt):
+    key = prompt_key('stub', [prompt])
+    return cache.get_or_compute(key, lambda: model.generate_content([prompt]).text)
+
+
+def test_cached_answer_expires_after_ttl(clock):
+    cache, model = ResponseCache(ttl=60), StubModel()
+
+    assert _ask(cache, model, 'Best family SUV?') == 'answer 1 to Best family SUV?'
+    clock[0] += 59
+    assert _ask(cache, model, 'best   family suv?') == 'answer 1 to Best family SUV?'
+    assert model.calls == 1
+
+    clock[0] += 2
+    assert _ask(cache, model, 'Best family SUV?') == 'answer 2 to Best family SUV?'
+    assert model.calls == 2
+    assert cache.stats()['hits'] == 1
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache, model = ResponseCache(ttl=60, max_entries=2), StubModel()
+
+    _ask(cache, model, 'a')
+    _ask(cache, model, 'b')
+    _ask(cache, model, 'a')  # 'b' is now the least recently used
+    _ask(cache, model, 'c')
+    assert model.calls == 3
+    assert cache.stats()['entries'] == 2
+
+    _ask(cache, model, 'a')
+    assert model.calls == 3
+    _ask(cache, model, 'b')
+    assert model.calls == 4
+
+
+def test_entries_are_evicted_by_size(clock):
+    cache, model = ResponseCache(ttl=60, max_entries=100, max_bytes=40), StubModel()
+
+    for prompt in ('first', 'second', 'third'):
+        _ask(cache, model, prompt)
+    assert cache.stats()['bytes'] <= 40
+    _ask(cache, model, 'first')
+    assert model.calls == 4
+
+
+def test_concurrent_identical_prompts_share_one_model_call():
+    release = threading.Event()
+    cache, model = ResponseCache(ttl=60), StubModel(release)
+    callers = 8
+    results = []
+
+    def ask():
+        results.append(_ask(cache, model, 'Is this a good deal?'))
+
+    threads = [threading.Thread(target=ask) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while cache.stats()['coalesced'] < callers - 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert model.calls == 1
+    assert results == ['answer 1 to Is this a good deal?'] * callers
+    assert cache.stats()['misses'] == 1
+    assert cache.stats()['coalesced'] == callers - 1
+
+
+def test_waiting_callers_get_the_leaders_error():
+    release = threading.Event()
+    cache = ResponseCache(ttl=60)
+    errors = []
+
+    def failing():
+        release.wait(5)
+        raise RuntimeError('quota exceeded')
+
+    def ask():
+        try:
+            cache.get_or_compute('key', failing)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=ask) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while cache.stats()['coalesced'] < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert errors == ['quota exceeded'] * 4
+    assert cache.stats()['entries'] == 0
+
+
+def test_ai_service_coalesces_through_the_cache(monkeypatch):
+    from app.services.ai_service import ai_service
+
+    release = threading.Event()
+    model = StubModel(release)
+    monkeypatch.setattr(ai_service, 'gemini_model', model)
+    monkeypatch.setattr(ai_service, 'response_cache', ResponseCache(ttl=60))
+    results = []
+
+    threads = [threading.Thread(target=lambda: results.append(ai_service._generate_text(['Compare Camry and K5'])))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while ai_service.response_cache.stats()['coalesced'] < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert model.calls == 1
+    assert len(set(results)) == 1 and len(results) == 5
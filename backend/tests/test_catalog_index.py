@@ -0,0 +1,27 @@
+from app.db import get_db
+from app.services.catalog_index import CatalogIndex, catalog_index
+
+
+def test_model_named_like_its_make():
+    index = CatalogIndex()
+    index.add_car('Mini', 'Mini', {}, None)
+    index.add_car('Mini', 'Cooper', {}, None)
+
+    suggestions = index.autocomplete('mi')
+
+    assert suggestions[0] == {'type': 'make', 'make': 'Mini', 'count': 2}
+    assert {'type': 'model', 'make': 'Mini', 'model': 'Mini', 'count': 1} in suggestions
+    assert {'type': 'model', 'make': 'Mini', 'model': 'Cooper', 'count': 1} in suggestions
+
+
+def test_autocomplete_route_with_make_named_model(app, client):
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO cars (make, model) VALUES ('Mini', 'Mini')")
+        db.commit()
+    catalog_index.rebuild()
+
+    for _ in range(2):
+        response = client.get('/api/catalog/autocomplete?q=mi')
+        assert response.status_code == 200
+        assert response.get_json()['suggestions'][0]['make'] == 'Mini'
@@ -0,0 +1,81 @@
+import json
+import types
+
+import pytest
+
+from app.services.ai_cache import ResponseCache
+from app.services.ai_service import ai_service
+
+INTRO = 'Great choice! Here is a draft listing for your Camry.\n\n'
+LISTING = {'make': 'Toyota', 'model': 'Camry', 'year': 2019, 'price': 15500}
+REPLY = INTRO + '```json_listing\n' + json.dumps(LISTING) + '\n```'
+
+
+class ChunkedModel:
+    """A Gemini stand-in whose streamed reply arrives in the given chunks."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def generate_content(self, parts, stream=False):
+        assert stream
+        return iter([types.SimpleNamespace(text=chunk) for chunk in self.chunks])
+
+
+def _chunks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.fixture
+def stream_with(monkeypatch):
+    def install(chunks):
+        monkeypatch.setattr(ai_service, 'ensure_gemini', lambda *args, **kwargs: True)
+        monkeypatch.setattr(ai_service, 'gemini_model', ChunkedModel(chunks))
+        monkeypatch.setattr(ai_service, 'response_cache', ResponseCache(ttl=60))
+    return install
+
+
+@pytest.mark.parametrize('chunks', [
+    # The marker itself split across chunk boundaries
+    [INTRO + '``', '`json_', 'listing\n{"make": "Toyota", ', '"model": "Camry", "year": 2019, "price": 15500}\n``', '`'],
+    [INTRO[:-3], INTRO[-3:] + '```j', 'son_listing', REPLY[len(INTRO) + len('```json_listing'):]],
+    _chunks(REPLY, 1),
+    _chunks(REPLY, 7),
+    [REPLY],
+], ids=['marker-split', 'marker-split-2', 'size-1', 'size-7', 'whole'])
+def test_listing_block_is_held_back_and_emitted_whole(stream_with, chunks):
+    assert ''.join(chunks) == REPLY
+    stream_with(chunks)
+
+    events = list(ai_service.chat_stream('Sell my Camry', []))
+
+    deltas = ''.join(event['text'] for event in events if event['type'] == 'delta')
+    assert deltas == INTRO
+    assert '`' not in deltas
+    listings = [event for event in events if event['type'] == 'listing']
+    assert listings == [{'type': 'listing', 'listing_data': LISTING}]
+    assert events[-1] == {'type': 'done', 'text': INTRO.strip()}
+    assert [event['type'] for event in events][-2:] == ['listing', 'done']
+
+
+def test_partial_marker_that_is_not_a_listing_is_released(stream_with):
+    reply = 'Use this:\n```python\nprint(1)\n```'
+    stream_with(_chunks(reply, 2))
+
+    events = list(ai_service.chat_stream('code?', []))
+
+    assert ''.join(event['text'] for event in events if event['type'] == 'delta') == reply
+    assert not any(event['type'] == 'listing' for event in events)
+
+
+def test_ndjson_route_streams_the_same_events(client, stream_with):
+    stream_with(_chunks(REPLY, 5))
+
+    response = client.post('/api/chatbot', json={'query': 'Sell my Camry', 'stream': True},
+                           headers={'Accept': 'application/x-ndjson'})
+
+    assert response.status_code == 200
+    events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert ''.join(event['text'] for event in events if event['type'] == 'delta') == INTRO
+    assert [event['listing_data'] for event in events if event['type'] == 'listing'] == [LISTING]
+    assert events[-1]['type'] == 'done'
@@ -0,0 +1,73 @@
+import io
+import threading
+
+import pytest
+
+from app.services.chunked_upload import ChunkedUploads, UploadSessionError
+
+
+class SlowStream:
+    """A request body that stalls after its first block until released."""
+
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+        self.reading = threading.Event()
+        self.release = threading.Event()
+
+    def read(self, size):
+        if self._data.tell() > 0:
+            self.reading.set()
+            assert self.release.wait(5)
+        return self._data.read(min(size, 4))
+
+
+@pytest.fixture
+def uploads(tmp_path):
+    return ChunkedUploads(str(tmp_path))
+
+
+def test_concurrent_chunk_for_the_same_session_is_rejected(uploads):
+    session = uploads.create('mp4', 16)
+    slow = SlowStream(b'a' * 8)
+    results = {}
+
+    def first():
+        results['first'] = uploads.append(session['id'], 0, slow, 8)
+
+    writer = threading.Thread(target=first)
+    writer.start()
+    assert slow.reading.wait(5)
+
+    # The retry of the same chunk arrives while the first copy is still streaming
+    with pytest.raises(UploadSessionError) as busy:
+        uploads.append(session['id'], 0, io.BytesIO(b'b' * 8), 8)
+    assert busy.value.status == 409
+    with pytest.raises(UploadSessionError) as finalizing:
+        uploads.finalize(session['id'], lambda path, ext: None)
+    assert finalizing.value.status == 409
+
+    slow.release.set()
+    writer.join(5)
+    assert results['first']['offset'] == 8
+
+    # Once it is done, the retry learns the real offset and moves on
+    with pytest.raises(UploadSessionError) as stale:
+        uploads.append(session['id'], 0, io.BytesIO(b'b' * 8), 8)
+    assert (stale.value.status, stale.value.offset) == (409, 8)
+    assert uploads.append(session['id'], 8, io.BytesIO(b'c' * 8), 8)['offset'] == 16
+
+    stored = {}
+
+    def store(path, ext):
+        with open(path, 'rb') as f:
+            stored['data'] = f.read()
+        return 'done'
+
+    assert uploads.finalize(session['id'], store) == 'done'
+    assert stored['data'] == b'a' * 8 + b'c' * 8
+
+
+def test_unknown_session_is_not_found(uploads):
+    with pytest.raises(UploadSessionError) as missing:
+        uploads.append('0' * 32, 0, io.BytesIO(b'x'), 1)
+    assert missing.value.status == 404
@@ -0,0 +1,110 @@
+import sqlite3
+
+import pytest
+
+from app.db import get_db
+from app.services.deal_scorer import DealScorer
+from app.services.price_model import price_model
+
+
+@pytest.fixture
+def scorer(app, monkeypatch):
+    monkeypatch.setattr(price_model, 'load', lambda *args, **kwargs: False)
+    monkeypatch.setattr(price_model, '_current', None)
+    scorer = DealScorer(interval=0, batch_size=10)
+    scorer.init_app(app)
+    return scorer
+
+
+def _add_car(app, make, price):
+    with app.app_context():
+        db = get_db()
+        db.execute('INSERT INTO cars (make, model, year, price, currency) VALUES (?, ?, ?, ?, ?)',
+                   (make, 'Model', 2019, price, 'JOD'))
+        db.commit()
+        return db.execute('SELECT id FROM cars WHERE make = ?', (make,)).fetchone()['id']
+
+
+def _car(app, car_id):
+    with app.app_context():
+        return dict(get_db().execute(
+            'SELECT price, fair_price, deal_score, price_scored_at FROM cars WHERE id = ?', (car_id,)).fetchone())
+
+
+def _estimate(car):
+    return {'value': 20000.0, 'low': 18000.0, 'high': 22000.0, 'source': 'heuristic'}
+
+
+def test_car_edited_while_being_priced_is_not_marked_scored(app, scorer, monkeypatch):
+    car_id = _add_car(app, 'Toyota', 15000)
+
+    def edit_during_estimate(cars):
+        # Another request edits the price between the scorer's read and write
+        conn = sqlite3.connect(app.config['DATABASE'])
+        conn.execute('UPDATE cars SET price = 30000, price_scored_at = NULL WHERE id = ?', (car_id,))
+        conn.commit()
+        conn.close()
+        return [_estimate(car) for car in cars]
+
+    monkeypatch.setattr(price_model, 'estimate_batch', edit_during_estimate)
+    scorer.run_once()
+
+    car = _car(app, car_id)
+    assert car['price'] == 30000
+    assert car['price_scored_at'] is None
+    assert car['fair_price'] is None
+
+    # The next pass scores the new price
+    monkeypatch.setattr(price_model, 'estimate_batch', lambda cars: [_estimate(car) for car in cars])
+    scorer.run_once()
+    car = _car(app, car_id)
+    assert car['price_scored_at'] is not None
+    assert car['deal_score'] == pytest.approx(-0.5)
+
+
+def test_failing_row_gets_null_score_and_batch_is_written(app, scorer, monkeypatch):
+    good_id = _add_car(app, 'Toyota', 15000)
+    bad_id = _add_car(app, 'Broken', 15000)
+    calls = []
+
+    def estimate_batch(cars):
+        calls.append(len(cars))
+        if any(car['make'] == 'Broken' for car in cars):
+            raise ValueError('bad specs')
+        return [_estimate(car) for car in cars]
+
+    monkeypatch.setattr(price_model, 'estimate_batch', estimate_batch)
+    assert scorer.run_once() == 2
+
+    good, bad = _car(app, good_id), _car(app, bad_id)
+    assert good['deal_score'] == pytest.approx(0.25)
+    assert bad['price_scored_at'] is not None
+    assert bad['fair_price'] is None and bad['deal_score'] is None
+
+    # Nothing is left to retry on the next run
+    calls.clear()
+    assert scorer.run_once() == 0
+    assert calls == []
+
+
+def test_row_that_rejects_its_null_score_is_skipped(app, scorer, monkeypatch):
+    bad_id = _add_car(app, 'Broken', 15000)
+    good_id = _add_car(app, 'Toyota', 15000)
+    with app.app_context():
+        db = get_db()
+        db.execute('''CREATE TRIGGER reject_broken BEFORE UPDATE OF price_scored_at ON cars
+                      WHEN NEW.make = 'Broken' BEGIN SELECT RAISE(ABORT, 'row is locked'); END''')
+        db.commit()
+    monkeypatch.setattr(price_model, 'estimate_batch', lambda cars: [_estimate(car) for car in cars])
+
+    # The bad row comes first in the batch; the rest of the batch is still written
+    assert scorer.run_once() == 1
+    assert _car(app, good_id)['deal_score'] == pytest.approx(0.25)
+    assert _car(app, bad_id)['price_scored_at'] is None
+
+    with app.app_context():
+        db = get_db()
+        db.execute('DROP TRIGGER reject_broken')
+        db.commit()
+    assert scorer.run_once() == 1
+    assert _car(app, bad_id)['deal_score'] == pytest.approx(0.25)
@@ -0,0 +1,34 @@
+import base64
+import io
+import os
+
+import pytest
+
+from app.services.image_processing import HAS_PIL, Image, prepare_image
+
+pytestmark = pytest.mark.skipif(not HAS_PIL, reason='Pillow is not installed')
+
+
+def _jpeg_with_exif(size=(400, 300)):
+    # Noise, so re-encoding at the vision quality never comes out smaller than the original
+    img = Image.frombytes('RGB', size, os.urandom(size[0] * size[1] * 3))
+    exif = Image.Exif()
+    exif[0x010F] = 'SecretCam'  # Make
+    exif[0x0110] = 'Model X'  # Model
+    out = io.BytesIO()
+    img.save(out, format='JPEG', quality=20, exif=exif.tobytes())
+    return out.getvalue()
+
+
+@pytest.mark.parametrize('size', [(400, 300), (3000, 2000)])
+def test_prepare_image_strips_exif(size):
+    original = _jpeg_with_exif(size)
+    assert b'SecretCam' in original
+
+    result = prepare_image(base64.b64encode(original).decode())
+
+    assert result['mime_type'] == 'image/jpeg'
+    assert b'SecretCam' not in result['data']
+    with Image.open(io.BytesIO(result['data'])) as processed:
+        assert not processed.getexif()
+        assert 'exif' not in processed.info
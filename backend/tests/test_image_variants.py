@@ -0,0 +1,51 @@
+import io
+import json
+import os
+
+import pytest
+
+from app.db import get_db
+from app.services.image_processing import Image
+from app.services.image_variants import generate_variants
+from app.services.media_store import save_upload
+
+
+@pytest.fixture
+def uploaded_photo(app):
+    buf = io.BytesIO()
+    Image.new('RGB', (2000, 1500), (200, 30, 30)).save(buf, format='JPEG')
+    buf.seek(0)
+    with app.app_context():
+        filename, _ = save_upload(get_db(), app.config['UPLOAD_FOLDER'], buf, 'jpg', 'image')
+    return filename
+
+
+def test_variants_are_copied_onto_listings_by_image_url(app, uploaded_photo, monkeypatch):
+    monkeypatch.setenv('BACKEND_URL', 'https://api.example.com')
+    path = f'/api/uploads/images/{uploaded_photo}'
+    with app.app_context():
+        db = get_db()
+        for image_url in (path, f'https://api.example.com{path}', '/api/uploads/images/other.jpg'):
+            db.execute('INSERT INTO cars (make, model, image_url) VALUES (?, ?, ?)', ('Kia', 'K5', image_url))
+        db.commit()
+
+        generate_variants({'filename': uploaded_photo})
+
+        rows = db.execute('SELECT image_url, image_variants FROM cars ORDER BY id').fetchall()
+        variants = json.loads(rows[0]['image_variants'])
+        assert variants['thumb']['width'] == 320
+        assert variants['full']['webp'].startswith('https://api.example.com/api/uploads/variants/')
+        assert rows[1]['image_variants'] == rows[0]['image_variants']
+        assert rows[2]['image_variants'] is None
+
+        for entry in variants.values():
+            relative = entry['jpeg'].split('/api/uploads/', 1)[1]
+            assert os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], relative))
+
+
+def test_listing_update_uses_the_image_url_index(app):
+    with app.app_context():
+        plan = get_db().execute(
+            'EXPLAIN QUERY PLAN UPDATE cars SET image_variants = ? WHERE image_url IN (?, ?)', ('{}', 'a', 'b')
+        ).fetchall()
+    assert any('idx_cars_image_url' in row[-1] for row in plan)
@@ -0,0 +1,47 @@
+import pytest
+
+from app.db import get_db
+from app.routes import system
+from app.services.job_queue import JobQueue
+
+
+@pytest.fixture
+def queue(app, monkeypatch):
+    """A durable queue driven by hand: no worker threads, jobs run via run_pending()."""
+    queue = JobQueue(workers=1)
+    queue._app = app
+    monkeypatch.setattr(queue, '_ensure_workers', lambda: None)
+    return queue
+
+
+def test_failed_handler_write_is_rolled_back_before_rescheduling(app, queue):
+    @queue.handler('half_done', max_attempts=3)
+    def half_done(payload):
+        get_db().execute("INSERT INTO cars (make, model) VALUES ('Half', 'Written')")
+        raise RuntimeError('failed after writing')
+
+    with app.app_context():
+        job_id = queue.enqueue('half_done', {})
+    assert queue.run_pending() == 1
+
+    with app.app_context():
+        db = get_db()
+        job = db.execute('SELECT status, attempts, last_error FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        assert (job['status'], job['attempts']) == ('queued', 1)
+        assert 'failed after writing' in job['last_error']
+        assert db.execute("SELECT COUNT(*) FROM cars WHERE make = 'Half'").fetchone()[0] == 0
+
+
+def test_cloudinary_job_fails_when_the_local_file_is_gone(app, monkeypatch):
+    monkeypatch.setattr(system, 'init_cloudinary', lambda: True)
+    payload = {'filename': 'f' * 32 + '.jpg', 'kind': 'image'}
+    with app.app_context():
+        with pytest.raises(FileNotFoundError):
+            system.upload_to_cloudinary(payload)
+
+        # A retry after the copy was already made has nothing left to do
+        db = get_db()
+        db.execute('INSERT INTO media_uploads (filename, kind, remote_url) VALUES (?, ?, ?)',
+                   (payload['filename'], 'image', 'https://res.cloudinary.com/demo/f.jpg'))
+        db.commit()
+        assert system.upload_to_cloudinary(payload) is None
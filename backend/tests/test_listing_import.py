@@ -0,0 +1,60 @@
+import io
+import json
+
+from app.db import get_db
+from app.services.listing_import import listing_importer, run_import
+
+
+def _ndjson(*listings):
+    return io.StringIO(''.join(json.dumps(listing) + '\n' for listing in listings))
+
+
+def test_database_error_fails_only_the_bad_row(app):
+    with app.app_context():
+        db = get_db()
+        # Row 2's import key is already taken, so inserting it violates the unique index
+        db.execute("INSERT INTO cars (make, model, import_key) VALUES ('Kia', 'Rio', 'bulk:job1:2')")
+        db.commit()
+
+        stream = _ndjson(*({'make': 'Toyota', 'model': f'Model {i}', 'year': 2020} for i in range(1, 5)))
+        summary = run_import(db, stream, 'ndjson', None, 'job1', batch_size=10)
+
+        assert summary['inserted'] == 3
+        assert summary['failed'] == 1
+        assert [result['success'] for result in summary['results']] == [True, False, True, True]
+        assert summary['results'][1]['error'] == 'Database error'
+        ids = [result['id'] for result in summary['results'] if result['success']]
+        rows = db.execute(
+            f"SELECT id, model FROM cars WHERE id IN ({', '.join('?' for _ in ids)}) ORDER BY id", ids
+        ).fetchall()
+        assert [row['model'] for row in rows] == ['Model 1', 'Model 3', 'Model 4']
+
+
+def test_job_without_progress_is_marked_failed_when_polled(app):
+    with app.app_context():
+        db = get_db()
+        stale = listing_importer.create_job(db, None, 'csv', 'old.csv', status='running')
+        fresh = listing_importer.create_job(db, None, 'csv', 'new.csv', status='running')
+        db.execute("UPDATE import_jobs SET updated_at = datetime('now', '-2 hours') WHERE id = ?", (stale,))
+        db.commit()
+
+        assert listing_importer.get_job(db, stale)['status'] == 'failed'
+        assert 'upload the file again' in listing_importer.get_job(db, stale)['error']
+        assert listing_importer.get_job(db, fresh)['status'] == 'running'
+
+
+def test_reclaimed_job_is_not_started_later(app, tmp_path):
+    path = tmp_path / 'upload.ndjson'
+    path.write_text(json.dumps({'make': 'Toyota', 'model': 'Camry'}) + '\n')
+    with app.app_context():
+        db = get_db()
+        job_id = listing_importer.create_job(db, None, 'ndjson', 'upload.ndjson')
+        db.execute("UPDATE import_jobs SET updated_at = datetime('now', '-2 hours') WHERE id = ?", (job_id,))
+        db.commit()
+        assert listing_importer.get_job(db, job_id)['status'] == 'failed'
+
+        listing_importer.run(db, job_id, str(path), 'ndjson', None)
+
+        assert listing_importer.get_job(db, job_id)['status'] == 'failed'
+        assert db.execute('SELECT COUNT(*) FROM cars').fetchone()[0] == 0
+        assert not path.exists()
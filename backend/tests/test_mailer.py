@@ -0,0 +1,167 @@
+import socketserver
+import threading
+import time
+
+import pytest
+
+from app.db import get_db
+from app.services import mailer as mailer_module
+from app.services.job_queue import JobQueue, job_queue, JOB_MAX_ATTEMPTS, JOB_RETRY_BASE
+
+
+class StubSMTPServer(socketserver.ThreadingTCPServer):
+    """
+    Minimal local SMTP server, in the spirit of ``python -m aiosmtpd``. Accepts
+    everything, except that the first ``fail_next`` messages are refused at
+    the end of DATA with a temporary 451.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, fail_next=0):
+        super().__init__(('127.0.0.1', 0), StubSMTPHandler)
+        self.fail_next = fail_next
+        self.messages = []
+        self.refused = 0
+        self.connections = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply('220 stub ESMTP')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('ascii', 'replace').strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250 stub')
+            elif command.startswith(('MAIL', 'RCPT', 'RSET', 'NOOP')):
+                self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                for data_line in iter(self.rfile.readline, b''):
+                    if data_line in (b'.\r\n', b'.\n'):
+                        break
+                    data.append(data_line)
+                if server.fail_next > 0:
+                    server.fail_next -= 1
+                    server.refused += 1
+                    self.reply('451 4.3.0 Try again later')
+                else:
+                    server.messages.append(b''.join(data).decode('utf-8', 'replace'))
+                    self.reply('250 Queued')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Not implemented')
+
+
+@pytest.fixture
+def smtp_stub(monkeypatch):
+    def start(fail_next=0):
+        server = StubSMTPServer(fail_next)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        monkeypatch.setattr(mailer_module, 'SMTP_HOST', '127.0.0.1')
+        monkeypatch.setattr(mailer_module, 'SMTP_PORT', server.port)
+        monkeypatch.setattr(mailer_module, 'SMTP_STARTTLS', False)
+        monkeypatch.setattr(mailer_module, 'SMTP_USER', '')
+        monkeypatch.setattr(mailer_module, 'SMTP_FROM', 'noreply@intelliwheels.test')
+        monkeypatch.setattr(mailer_module, 'mailer', mailer_module.Mailer())
+        return server
+
+    servers = []
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def queue(app, monkeypatch):
+    """A durable queue driven by hand: no worker threads, jobs run via run_pending()."""
+    queue = JobQueue(workers=1)
+    queue._handlers = dict(job_queue._handlers)
+    queue._app = app
+    monkeypatch.setattr(queue, '_ensure_workers', lambda: None)
+    return queue
+
+
+def _job(app, job_id):
+    with app.app_context():
+        return dict(get_db().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone())
+
+
+def _make_due(app, job_id):
+    with app.app_context():
+        db = get_db()
+        db.execute('UPDATE jobs SET run_at = ? WHERE id = ?', (time.time() - 1, job_id))
+        db.commit()
+
+
+def _enqueue_email(app, queue):
+    with app.app_context():
+        return queue.enqueue('email', {'to': 'buyer@example.com', 'subject': 'Your listing', 'body': '<p>Hi</p>'})
+
+
+def test_email_job_retries_with_backoff_then_sends(app, queue, smtp_stub):
+    server = smtp_stub(fail_next=2)
+    job_id = _enqueue_email(app, queue)
+
+    for attempt in (1, 2):
+        before = time.time()
+        assert queue.run_pending() == 1
+        job = _job(app, job_id)
+        assert job['status'] == 'queued'
+        assert job['attempts'] == attempt
+        assert '451' in job['last_error']
+        # Exponential backoff with +/-20% jitter
+        expected = JOB_RETRY_BASE * 2 ** (attempt - 1)
+        assert 0.8 * expected - 1 <= job['run_at'] - before <= 1.2 * expected + 1
+        # Not due yet, so nothing runs until the backoff has passed
+        assert queue.run_pending() == 0
+        _make_due(app, job_id)
+
+    assert queue.run_pending() == 1
+    job = _job(app, job_id)
+    assert job['status'] == 'done'
+    assert job['last_error'] is None
+    assert server.refused == 2
+    assert len(server.messages) == 1
+    assert 'Subject: Your listing' in server.messages[0]
+    assert 'To: buyer@example.com' in server.messages[0]
+    # The worker thread's SMTP session survived the refusals
+    assert server.connections == 1
+
+
+def test_email_job_gives_up_after_max_attempts(app, queue, smtp_stub):
+    server = smtp_stub(fail_next=10 ** 6)
+    job_id = _enqueue_email(app, queue)
+
+    for _ in range(JOB_MAX_ATTEMPTS):
+        assert queue.run_pending() == 1
+        _make_due(app, job_id)
+    assert queue.run_pending() == 0
+
+    job = _job(app, job_id)
+    assert job['status'] == 'failed'
+    assert job['attempts'] == JOB_MAX_ATTEMPTS
+    assert job['finished_at'] is not None
+    assert 'SMTPDataError' in job['last_error']
+    assert server.refused == JOB_MAX_ATTEMPTS
+    assert server.messages == []
+    assert queue.stats_counters['retried'] == JOB_MAX_ATTEMPTS - 1
+    assert queue.stats_counters['failed'] == 1
@@ -0,0 +1,83 @@
+import io
+import os
+import threading
+import time
+
+import pytest
+
+from app.db import get_db
+from app.services import media_store as media_store_module
+from app.services.media_store import MediaStore, save_upload
+
+
+@pytest.fixture
+def upload_dir(app):
+    return app.config['UPLOAD_FOLDER']
+
+
+def test_reupload_of_blob_moved_to_cloudinary_is_not_new(app, upload_dir):
+    with app.app_context():
+        db = get_db()
+        filename, created = save_upload(db, upload_dir, io.BytesIO(b'photo bytes'), 'jpg', 'image')
+        assert created
+
+        # What the Cloudinary job leaves behind: a remote copy and no local file
+        db.execute('UPDATE media_uploads SET remote_url = ? WHERE filename = ?',
+                   ('https://res.cloudinary.com/demo/photo.jpg', filename))
+        db.commit()
+        os.remove(os.path.join(upload_dir, filename))
+
+        again, created = save_upload(db, upload_dir, io.BytesIO(b'photo bytes'), 'jpg', 'image')
+        assert again == filename
+        assert not created
+        assert not os.path.exists(os.path.join(upload_dir, filename))
+        assert [name for name in os.listdir(upload_dir) if name.startswith('.incoming-')] == []
+
+
+def test_collector_waits_for_the_blob_lock(app, upload_dir):
+    with app.app_context():
+        db = get_db()
+        filename, _ = save_upload(db, upload_dir, io.BytesIO(b'old photo'), 'jpg', 'image')
+        db.execute('UPDATE media_uploads SET unreferenced_since = ? WHERE filename = ?',
+                   (time.time() - 3600, filename))
+        db.commit()
+
+    store = MediaStore(interval=0, grace=60)
+    store.init_app(app)
+    path = os.path.join(upload_dir, filename)
+
+    with media_store_module._blob_lock(filename):
+        collector = threading.Thread(target=store.collect)
+        collector.start()
+        collector.join(0.5)
+        # Blocked on the lock a re-upload of the same bytes would hold
+        assert collector.is_alive()
+        assert os.path.exists(path)
+    collector.join(5)
+
+    assert not collector.is_alive()
+    assert store.last_gc['deleted'] == 1
+    assert not os.path.exists(path)
+
+
+def test_collector_leaves_files_it_did_not_name(app, client, upload_dir):
+    path = os.path.join(upload_dir, 'legacy_photo.jpg')
+    with open(path, 'wb') as f:
+        f.write(b'legacy bytes')
+    with app.app_context():
+        db = get_db()
+        db.execute('INSERT INTO cars (make, model, image_url) VALUES (?, ?, ?)',
+                   ('Kia', 'Rio', '/api/uploads/images/legacy_photo.jpg'))
+        db.commit()
+
+    # Serving it records its ETag in media_uploads with no counted references
+    assert client.get('/api/uploads/images/legacy_photo.jpg').status_code == 200
+
+    store = MediaStore(interval=0, grace=0)
+    store.init_app(app)
+    store.collect()
+    store.collect()
+
+    assert store.last_gc['deleted'] == 0
+    assert os.path.exists(path)
+    assert client.get('/api/uploads/images/legacy_photo.jpg').status_code == 200
@@ -0,0 +1,45 @@
+import pytest
+
+from app import metrics
+
+
+def test_metrics_are_served_without_token_under_testing(client, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_TOKEN', '')
+    response = client.get('/api/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+
+
+def test_metrics_are_disabled_without_token_in_production(app, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_TOKEN', '')
+    app.config['TESTING'] = False
+    response = app.test_client().get('/api/metrics')
+    assert response.status_code == 403
+    assert 'METRICS_TOKEN' in response.get_json()['error']
+
+
+@pytest.mark.parametrize('testing', [True, False])
+def test_metrics_token_is_required_when_set(app, monkeypatch, testing):
+    monkeypatch.setattr(metrics, 'METRICS_TOKEN', 's3cret-scrape-token')
+    app.config['TESTING'] = testing
+    client = app.test_client()
+    assert client.get('/api/metrics').status_code == 401
+    assert client.get('/api/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = client.get('/api/metrics', headers={'Authorization': 'Bearer s3cret-scrape-token'})
+    assert response.status_code == 200
+
+
+def test_server_timing_is_sent_under_testing(client, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_TOKEN', '')
+    assert 'db;dur=' in client.get('/api/makes').headers['Server-Timing']
+
+
+@pytest.mark.parametrize('token', ['', 's3cret-scrape-token'])
+def test_server_timing_needs_the_metrics_token_in_production(app, monkeypatch, token):
+    monkeypatch.setattr(metrics, 'METRICS_TOKEN', token)
+    app.config['TESTING'] = False
+    client = app.test_client()
+    assert 'Server-Timing' not in client.get('/api/makes').headers
+    assert 'Server-Timing' not in client.get('/api/makes', headers={'X-Metrics-Token': 'wrong'}).headers
+    response = client.get('/api/makes', headers={'X-Metrics-Token': 's3cret-scrape-token'})
+    assert ('Server-Timing' in response.headers) == bool(token)
@@ -0,0 +1,37 @@
+import pytest
+
+from app.services.price_model import heuristic_estimate, price_model
+
+
+@pytest.fixture
+def heuristic_only(monkeypatch):
+    """Price without a model artifact, as when it is missing or fails to load."""
+    monkeypatch.setattr(price_model, 'load', lambda *args, **kwargs: False)
+    monkeypatch.setattr(price_model, '_current', None)
+
+
+@pytest.mark.parametrize('year', ['abc', '2020.5', float('nan'), None, ''])
+def test_heuristic_estimate_ignores_unusable_year(year):
+    result = heuristic_estimate('Toyota', 'Camry', year, {'horsepower': 200})
+    assert result['source'] == 'heuristic'
+    assert result['value'] > 0
+
+
+def test_batch_reports_bad_rows_individually(client, heuristic_only):
+    response = client.post('/api/price-estimate/batch', json={'cars': [
+        {'make': 'Toyota', 'model': 'Camry', 'year': 2019},
+        {'make': 'Toyota', 'model': 'Camry', 'year': 'abc'},
+        {'make': 'Kia', 'model': 'K5', 'year': '2020.5'},
+        {'make': 'Kia', 'model': 'K5', 'year': 2020, 'odometer_km': 'lots'},
+        {'make': 'Kia', 'model': 'K5', 'year': '2020', 'odometer_km': 45000},
+    ]})
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['count'] == 2
+    ok = [entry['success'] for entry in body['estimates']]
+    assert ok == [True, False, False, False, True]
+    assert 'Year' in body['estimates'][1]['error']
+    assert 'Year' in body['estimates'][2]['error']
+    assert 'Odometer' in body['estimates'][3]['error']
+    assert body['estimates'][4]['source'] == 'heuristic'
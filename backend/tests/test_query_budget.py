@@ -0,0 +1,104 @@
+import pytest
+
+from app import create_app, query_budget as query_budget_module
+from app.db import get_db
+from app.query_budget import QueryBudgetExceeded, query_budget
+
+
+def _budget_app(tmp_path, mode):
+    app = create_app({'TESTING': True, 'UPLOAD_FOLDER': str(tmp_path / 'uploads'), 'QUERY_BUDGET_MODE': mode})
+
+    # Every statement has its own shape: only the total counts
+    distinct = [f"SELECT COUNT(*) AS {'n' * (i + 1)} FROM cars" for i in range(30)]
+
+    @app.route('/_test/many')
+    def many():
+        db = get_db()
+        for sql in distinct:
+            db.execute(sql).fetchone()
+        return 'ok'
+
+    @app.route('/_test/many-allowed')
+    @query_budget(max_queries=40)
+    def many_allowed():
+        return many()
+
+    # One lookup per row: the same statement over and over
+    @app.route('/_test/n-plus-one')
+    def n_plus_one():
+        db = get_db()
+        for car_id in range(8):
+            db.execute('SELECT * FROM cars WHERE id = ?', (car_id,)).fetchone()
+        return 'ok'
+
+    @app.route('/_test/n-plus-one-allowed')
+    @query_budget(max_repeats=10)
+    def n_plus_one_allowed():
+        return n_plus_one()
+
+    @app.route('/_test/few')
+    def few():
+        db = get_db()
+        for car_id in range(3):
+            db.execute('SELECT * FROM cars WHERE id = ?', (car_id,)).fetchone()
+        return 'ok'
+
+    return app
+
+
+@pytest.fixture
+def raising(tmp_path):
+    return _budget_app(tmp_path, 'raise').test_client()
+
+
+def test_request_over_the_total_budget_raises(raising):
+    with pytest.raises(QueryBudgetExceeded, match='more than 25 queries'):
+        raising.get('/_test/many')
+
+
+def test_repeated_statement_is_reported_as_n_plus_one(raising):
+    with pytest.raises(QueryBudgetExceeded) as excinfo:
+        raising.get('/_test/n-plus-one')
+    report = str(excinfo.value)
+    assert 'likely N+1' in report
+    assert '8x SELECT * FROM cars WHERE id = ?' in report
+    # The stack points at the loop in the view, not at db.py
+    assert 'n_plus_one' in report
+
+
+def test_decorator_raises_the_limits_for_one_view(raising):
+    assert raising.get('/_test/few').status_code == 200
+    assert raising.get('/_test/many-allowed').status_code == 200
+    assert raising.get('/_test/n-plus-one-allowed').status_code == 200
+    # The other views keep the defaults
+    with pytest.raises(QueryBudgetExceeded):
+        raising.get('/_test/many')
+
+
+def test_warn_mode_logs_and_serves_the_response(tmp_path, monkeypatch):
+    warnings = []
+    monkeypatch.setattr(query_budget_module.log, 'warning', lambda msg, *args: warnings.append(msg % args))
+    client = _budget_app(tmp_path, 'warn').test_client()
+
+    response = client.get('/_test/n-plus-one')
+    assert response.status_code == 200
+    assert len(warnings) == 1
+    assert 'GET /_test/n-plus-one' in warnings[0] and 'likely N+1' in warnings[0]
+
+    assert client.get('/_test/few').status_code == 200
+    assert len(warnings) == 1
+
+
+def test_off_mode_records_nothing(tmp_path, monkeypatch):
+    warnings = []
+    monkeypatch.setattr(query_budget_module.log, 'warning', lambda msg, *args: warnings.append(msg % args))
+    client = _budget_app(tmp_path, 'off').test_client()
+
+    assert client.get('/_test/many').status_code == 200
+    assert client.get('/_test/n-plus-one').status_code == 200
+    assert warnings == []
+
+
+def test_invalid_mode_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match='QUERY_BUDGET_MODE'):
+        _budget_app(tmp_path, 'loud')
@@ -0,0 +1,32 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('sklearn')
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'models'))
+import train_price_model  # noqa: E402
+
+
+def _chunk(body_styles):
+    count = len(body_styles)
+    return pd.DataFrame({
+        'make': ['Toyota'] * count,
+        'model': ['Hilux'] * count,
+        'year': [2019] * count,
+        'price': [20000] * count,
+        'currency': ['JOD'] * count,
+        'rating': [4.5] * count,
+        'reviews': [3] * count,
+        'body_style': body_styles,
+        'spec_horsepower': ['160 hp'] * count,
+        'engine_horsepower': [None] * count,
+    })
+
+
+def test_chunk_that_already_says_unknown_is_prepared():
+    out = train_price_model.prepare_chunk(_chunk(['Pickup', 'Unknown', None]))
+    assert list(out['body_style']) == ['Pickup', 'Unknown', 'Unknown']
+    assert str(out['body_style'].dtype) == 'category'
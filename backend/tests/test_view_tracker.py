@@ -0,0 +1,140 @@
+import threading
+import time
+
+import pytest
+
+from app.db import get_db
+from app.services import view_tracker as view_tracker_module
+from app.services.view_tracker import ViewTracker
+
+
+@pytest.fixture
+def tracker(app):
+    tracker = ViewTracker(flush_interval=3600, max_attempts=3)
+    tracker.init_app(app)
+    return tracker
+
+
+def _views(app):
+    with app.app_context():
+        rows = get_db().execute('SELECT car_id, SUM(views) AS views FROM car_views GROUP BY car_id').fetchall()
+        return {row['car_id']: row['views'] for row in rows}
+
+
+def test_failing_counter_is_dropped_after_max_attempts(app, tracker):
+    with app.app_context():
+        db = get_db()
+        db.execute('''CREATE TRIGGER reject_car_666 BEFORE INSERT ON car_views WHEN NEW.car_id = 666
+                      BEGIN SELECT RAISE(ABORT, 'bad counter'); END''')
+        db.commit()
+    for _ in range(3):
+        tracker.record(1)
+    tracker.record(666)
+
+    # Failed flushes keep every counter for the next attempt
+    assert tracker.flush() == 0
+    assert tracker.flush() == 0
+    assert tracker.pending_views([1, 666]) == 4
+    assert _views(app) == {}
+
+    # The last attempt splits the batch: the good counter is written, the bad one dropped
+    assert tracker.flush() == 3
+    assert tracker.pending_views([1, 666]) == 0
+    assert _views(app) == {1: 3}
+
+    # Failures are counted again from zero
+    tracker.record(666)
+    assert tracker.flush() == 0
+    assert tracker.pending_views([666]) == 1
+
+    with app.app_context():
+        db = get_db()
+        db.execute('DROP TRIGGER reject_car_666')
+        db.commit()
+    assert tracker.flush() == 1
+    assert _views(app) == {1: 3, 666: 1}
+
+
+def test_forget_waits_for_a_flush_in_flight(app, tracker, monkeypatch):
+    writing, release = threading.Event(), threading.Event()
+    real_get_db = view_tracker_module.get_db
+
+    class SlowDb:
+        def __init__(self, db):
+            self._db = db
+
+        def executemany(self, sql, rows):
+            writing.set()
+            assert release.wait(5)
+            return self._db.executemany(sql, rows)
+
+        def __getattr__(self, name):
+            return getattr(self._db, name)
+
+    monkeypatch.setattr(view_tracker_module, 'get_db', lambda: SlowDb(real_get_db()))
+    tracker.record(7)
+    flusher = threading.Thread(target=tracker.flush)
+    flusher.start()
+    assert writing.wait(5)
+
+    forgot = threading.Event()
+
+    def forget():
+        with app.app_context():
+            db = get_db()
+            tracker.forget(db, 7)
+            db.commit()
+        forgot.set()
+
+    forgetter = threading.Thread(target=forget)
+    forgetter.start()
+    # Still blocked behind the flush that holds counters for car 7
+    assert not forgot.wait(0.3)
+    release.set()
+    flusher.join(5)
+    forgetter.join(5)
+
+    assert forgot.is_set()
+    # The flush committed first, so the delete removed its rows
+    assert _views(app) == {}
+
+
+def test_unreachable_database_keeps_the_counters(app, monkeypatch):
+    tracker = ViewTracker(flush_interval=3600, max_attempts=1)
+    tracker.init_app(app)
+    real_get_db = view_tracker_module.get_db
+
+    def unreachable():
+        raise ConnectionError('database is down')
+
+    monkeypatch.setattr(view_tracker_module, 'get_db', unreachable)
+    tracker.record(3)
+    tracker.record(3)
+
+    assert tracker.flush() == 0
+    assert tracker.flush() == 0
+    assert tracker.pending_views([3]) == 2
+
+    monkeypatch.setattr(view_tracker_module, 'get_db', real_get_db)
+    assert tracker.flush() == 2
+    assert _views(app) == {3: 2}
+
+
+def test_flush_thread_survives_errors(app, monkeypatch):
+    tracker = ViewTracker(flush_interval=0.01)
+    tracker.init_app(app)
+    calls = []
+
+    def failing_flush():
+        calls.append(1)
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(tracker, 'flush', failing_flush)
+    tracker.record(4)
+    try:
+        time.sleep(0.2)
+        assert len(calls) > 1
+        assert tracker._thread.is_alive()
+    finally:
+        # Park the thread for the rest of the session
+        tracker.flush_interval = 3600
@@ -376,14 +376,47 @@ export async function uploadListingImage(file: File, token: string | null) {
   });
 }
 
+interface VideoUploadSession {
+  success: boolean;
+  uploadId: string;
+  offset: number;
+  size: number;
+  chunkSize: number;
+}
+
+const VIDEO_CHUNK_RETRIES = 3;
+
+// Videos go up in chunks so a dropped connection resumes instead of restarting
 export async function uploadListingVideo(file: File, token: string | null) {
-  const formData = new FormData();
-  formData.append('file', file);
-  return apiRequest<{ success: boolean; url: string; path?: string; filename?: string }>(`/uploads/videos`, {
+  const session = await apiRequest<VideoUploadSession>(`/uploads/videos/sessions`, {
+    method: 'POST',
+    token,
+    body: { filename: file.name, size: file.size },
+  });
+  const sessionPath = `/uploads/videos/sessions/${session.uploadId}`;
+  let offset = session.offset;
+  let failures = 0;
+  while (offset < file.size) {
+    try {
+      const chunk = await apiRequest<VideoUploadSession>(sessionPath, {
+        method: 'PUT',
+        token,
+        body: file.slice(offset, offset + session.chunkSize),
+        headers: { 'Upload-Offset': String(offset), 'Content-Type': 'application/octet-stream' },
+        isFormData: true,
+      });
+      offset = chunk.offset;
+      failures = 0;
+    } catch (error) {
+      if (++failures > VIDEO_CHUNK_RETRIES) throw error;
+      // Ask the server how much it kept, then carry on from there
+      const status = await apiRequest<VideoUploadSession>(sessionPath, { token });
+      offset = status.offset;
+    }
+  }
+  return apiRequest<{ success: boolean; url: string; path?: string; filename?: string }>(`${sessionPath}/complete`, {
     method: 'POST',
     token,
-    body: formData,
-    isFormData: true,
   });
 }
 